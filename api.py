@@ -10,6 +10,7 @@ import json
 from requests import post
 
 link = u'https://калькулятор.дом.рф:8193/Convention2/v2/Calculate'
+# Для расчета через локальный сервис (python service.py) используется адрес вида http://127.0.0.1:8194/Calculate
 
 params = {
             'bondID': 'RU000A10AQC0',
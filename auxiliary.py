@@ -4,15 +4,17 @@
 # ----- КОНВЕНЦИЯ ДЛЯ ИПОТЕЧНЫХ ЦЕННЫХ БУМАГ: ВСПОМОГАТЕЛЬНЫЕ ПЕРЕМЕННЫЕ, КЛАССЫ, ФУНКЦИИ ------------------------------------------------ #
 # ---------------------------------------------------------------------------------------------------------------------------------------- #
 
+import os
 import math
+import json
+import pickle
+import hashlib
+import sqlite3
 import numpy as np
 import pandas as pd
 import time
-import asyncio
 import threading
-import openpyxl
-from openpyxl.utils.dataframe import dataframe_to_rows
-from requests import post
+from collections import OrderedDict
 
 import warnings
 warnings.filterwarnings('ignore')
@@ -38,10 +40,11 @@ governProgramsFractionUpperBound = 99.5
 # ----- МЕТОДЫ API ----------------------------------------------------------------------------------------------------------------------- #
 class API(object):
 
-    """ Методы API """
+    """ Методы API. Адрес сервера можно переопределить переменными окружения CONVENTION_API_SERVER и CONVENTION_API_PORT или методом
+        API.configure (например, для работы с локальным сервером benchmarks/datasource_server.py) """
 
-    SERVER = u'https://калькулятор.дом.рф'
-    PORT = 8193
+    SERVER = os.environ.get('CONVENTION_API_SERVER', u'https://калькулятор.дом.рф').rstrip('/')
+    PORT = int(os.environ.get('CONVENTION_API_PORT', 8193))
 
     DATA_FOR_CALC = SERVER + ':' + str(PORT) + u'/DataSource/v2/GetDataForCalculation?bondID={}'
     GET_ZCYC_COEF = SERVER + ':' + str(PORT) + u'/DataSource/v2/GetZCYCCoefficients?zcycDate={}'
@@ -49,6 +52,40 @@ class API(object):
     GET_MACR_DATA = SERVER + ':' + str(PORT) + u'/DataSource/v2/GetMacroData?date={}'
     UPDATE_STATUS = SERVER + ':' + str(PORT) + u'/Convention2/v2/UpdateConventionStatus'
 
+    METHODS = ['DATA_FOR_CALC', 'GET_ZCYC_COEF', 'GET_POOL_DATA', 'GET_MACR_DATA', 'UPDATE_STATUS']
+
+    @classmethod
+    def configure(cls, server=None, port=None):
+        """ Смена адреса сервера (server — схема и хост, например http://127.0.0.1) и/или порта для всех методов API """
+        base = cls.SERVER + ':' + str(cls.PORT)
+        if server is not None:
+            cls.SERVER = server.rstrip('/')
+        if port is not None:
+            cls.PORT = int(port)
+        for method in cls.METHODS:
+            setattr(cls, method, cls.SERVER + ':' + str(cls.PORT) + getattr(cls, method)[len(base):])
+
+
+# ----- ЗАПРОСЫ К API -------------------------------------------------------------------------------------------------------------------- #
+# Модули requests, scipy.optimize и openpyxl импортируются при первом использовании, а не при импорте модели: расчеты на данных из кэша
+# или локального хранилища не загружают requests, расчеты без оптимизации — scipy, расчеты без сохранения в Excel — openpyxl.
+def get(url, **kwargs):
+    """ requests.get (модуль requests импортируется при первом запросе) """
+    import requests
+    return requests.get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    """ requests.post (модуль requests импортируется при первом запросе) """
+    import requests
+    return requests.post(url, **kwargs)
+
+
+def minimize(function, x0, **kwargs):
+    """ scipy.optimize.minimize (модуль scipy.optimize импортируется при первом вызове) """
+    from scipy.optimize import minimize as scipy_minimize
+    return scipy_minimize(function, x0, **kwargs)
+
 
 # ----- ОПОВЕЩЕНИЯ ОБ ОШИБКАХ ------------------------------------------------------------------------------------------------------------ #
 class EXCEPTIONS(object):
@@ -122,6 +159,18 @@ class EXCEPTIONS(object):
     _17 = ('По состоянию на {} не были обновлены параметры S-кривых. Расчет по требованиям МСФО на {} не может быть проведен. '
            'Пожалуйста, обратитесь в тех. поддержку по адресу calculator.service@domrf.ru')
 
+    _18 = ('Параметр progressBar может принимать значения true/false, "tqdm", функцию, принимающую процент готовности расчета, '
+           'или объект ProgressReporter')
+
+    _19 = 'Параметр outputProfile может принимать значения "minimal", "tables" или "full"'
+    _20 = 'Формат сохранения результатов расчетов может принимать значения "xlsx", "csv" или "parquet"'
+    _21 = 'Параметры расчета денежного потока (все, кроме опорной ценовой метрики) не совпадают с параметрами исходного расчета'
+    _22 = 'Расчет с другой опорной ценовой метрикой невозможен после вызова функции calculate у исходного объекта'
+    _23 = 'Для исторического расчета необходимо задать список Дат оценки или первую и последнюю Дату оценки диапазона'
+    _24 = 'Переоценка портфеля проводится по требованиям МСФО или РСБУ: параметр standard может принимать значения "ifrs" или "ras"'
+    _25 = ('Показатели процентного риска не рассчитаны: грязная цена в сценарии без сдвига ({}% от номинала) не совпадает с грязной ценой '
+           'базового расчета ({}% от номинала)')
+
 
 # ----- ПРЕДУПРЕЖДЕНИЯ ------------------------------------------------------------------------------------------------------------------- #
 class WARNINGS(object):
@@ -143,6 +192,7 @@ class CONSTRAINTS(object):
     PREMI_MIN, PREMI_MAX = -300, 1000
     COUPN_MIN, COUPN_MAX = 0, 20
     FXPRM_MIN, FXPRM_MAX = 0, 300
+    SHIFT_MIN, SHIFT_MAX = 1, 300
 
     ZSPRD_EXCEP = 'Z-спред может быть задан в диапазоне от {} до {} б.п.'.format(int(ZSPRD_MIN), int(ZSPRD_MAX))
     GSPRD_EXCEP = 'G-спред может быть задан в диапазоне от {} до {} б.п.'.format(int(GSPRD_MIN), int(GSPRD_MAX))
@@ -153,6 +203,8 @@ class CONSTRAINTS(object):
                    .format(int(PREMI_MIN), int(PREMI_MAX)))
     FXPRM_EXCEP = ('Фактичесекая фиксированная надбавка к Ключевой ставке может быть задана в диапазоне от {} до {} б.п.'
                    .format(int(FXPRM_MIN), int(FXPRM_MAX)))
+    SHIFT_EXCEP = ('Сдвиг процентных ставок для расчета показателей риска может быть задан в диапазоне от {} до {} б.п.'
+                   .format(int(SHIFT_MIN), int(SHIFT_MAX)))
 
 
 # ----- ТИПЫ РАСЧЕТА --------------------------------------------------------------------------------------------------------------------- #
@@ -216,6 +268,30 @@ class POOL_TYPE(object):
     MIX = 3  # ТИП ИПОТЕЧНОГО ПОКРЫТИЯ 3: СМЕШАННОЕ (ЕСТЬ КАК ФИКСИРОВАННАЯ, ТАК И ПЛАВАЮЩАЯ ЧАСТЬ)
 
 
+# ----- СОСТАВ ВЫХОДНЫХ ДАННЫХ РАСЧЕТА --------------------------------------------------------------------------------------------------- #
+class OUTPUT_PROFILE(object):
+
+    """ Категориальный признак, определяющий состав выходных данных расчета (calculationOutput):
+
+            1. minimal — результат оценки, параметры расчета, статистика ипотечного покрытия и денежный поток по ИЦБ ДОМ.РФ
+
+            2. tables  — дополнительно таблицы денежных потоков по ипотечному покрытию, субсидиям, свопам и расходам Ипотечного агента
+
+            3. full    — дополнительно данные для графиков на сайте Калькулятора ИЦБ ДОМ.РФ (keyRateInteractiveGraph, mbsCashflowGraph,
+                         zcycGraph, cprGraph)
+    """
+
+    MINIMAL = 'minimal'  # СОСТАВ ВЫХОДНЫХ ДАННЫХ 1: ТОЛЬКО РЕЗУЛЬТАТ ОЦЕНКИ И ДЕНЕЖНЫЙ ПОТОК ПО ИЦБ ДОМ.РФ
+    TABLES = 'tables'    # СОСТАВ ВЫХОДНЫХ ДАННЫХ 2: ВСЕ ТАБЛИЦЫ ДЕНЕЖНЫХ ПОТОКОВ БЕЗ ДАННЫХ ДЛЯ ГРАФИКОВ
+    FULL = 'full'        # СОСТАВ ВЫХОДНЫХ ДАННЫХ 3: ВСЕ ТАБЛИЦЫ И ДАННЫЕ ДЛЯ ГРАФИКОВ
+
+
+# ----- СОСТОЯНИЕ ОБЪЕКТА CONVENTION ПОСЛЕ РАСЧЕТА В РЕЖИМЕ ЭКОНОМИИ ПАМЯТИ -------------------------------------------------------------- #
+# При leanMemory = True после окончания расчета в объекте Convention остаются только эти атрибуты (см. функцию Convention.releaseState):
+lean_state_attributes = ['bondID', 'pricingDate', 'pricingParameters', 'modelKey', 'modelled', 'priced', 'leanMemory', 'startTime',
+                         'endTime', 'pricingResult', 'calculationParameters', 'calculationOutput']
+
+
 # ----- ДАННЫЕ ПО ВЫПЛАТЕ СУБСИДИЙ ----------------------------------------------------------------------------------------------------------- #
 # День месяца, в который приходит субсидия:
 subsidy_payment_day = 15
@@ -260,6 +336,44 @@ def round_ceil(x, decimals):
     return (math.ceil(x * 10.0 ** float(decimals))) / 10.0 ** float(decimals)
 
 
+# ----- КАЛЕНДАРЬ РАСЧЕТНЫХ ПЕРИОДОВ ---------------------------------------------------------------------------------------------------- #
+def payment_period_index(dates, period_start, period_end):
+
+    """ Функция, возвращающая для каждой из дат dates номер расчетного периода [period_start; period_end] (обе даты включительно),
+    в который попадает дата, или -1, если дата не попадает ни в один из расчетных периодов. Даты концов расчетных периодов
+    period_end должны возрастать, а сами расчетные периоды — не пересекаться (как в таблице couponsStructure) """
+
+    dates = np.asarray(dates).astype(d_type)
+    period_start = np.asarray(period_start).astype(d_type)
+    period_end = np.asarray(period_end).astype(d_type)
+
+    # Первый расчетный период, дата конца которого не раньше даты. Дата принадлежит ему, если она не раньше даты его начала:
+    index = np.searchsorted(period_end, dates, side='left')
+    found = (index < period_end.size) & ~np.isnat(dates)
+    found[found] = dates[found] >= period_start[index[found]]
+
+    return np.where(found, index, -1)
+
+
+def payment_period_coupon_dates(dates, coupons_structure):
+
+    """ Функция, возвращающая для каждой из дат dates дату купонной выплаты, к расчетному периоду которой относится дата (NaT, если
+    дата не попадает ни в один из расчетных периодов). coupons_structure — таблица couponsStructure с колонками couponDate,
+    paymentPeriodStart и paymentPeriodEnd """
+
+    index = payment_period_index(dates, coupons_structure['paymentPeriodStart'].values, coupons_structure['paymentPeriodEnd'].values)
+    coupon_dates = coupons_structure['couponDate'].values.astype(d_type)
+
+    return np.where(index >= 0, coupon_dates[np.maximum(index, 0)], d_nat)
+
+
+def coupon_index(coupon_dates, coupons_structure):
+
+    """ Функция, возвращающая номера строк таблицы couponsStructure, соответствующих датам купонных выплат coupon_dates """
+
+    return np.searchsorted(coupons_structure['couponDate'].values.astype(d_type), np.asarray(coupon_dates).astype(d_type))
+
+
 # ----- РАСЧЕТ КБД ----------------------------------------------------------------------------------------------------------------------- #
 @np.vectorize
 def Y(params, t):
@@ -294,26 +408,1028 @@ def Y(params, t):
     return 10000.0 * (np.exp(g_t / 10000.0) - 1)
 
 
+# ----- КОНТЕКСТ ДИСКОНТИРОВАНИЯ --------------------------------------------------------------------------------------------------------- #
+class DiscountGrid(object):
+
+    """ Сроки t (в годах) и значения КБД с учетом сценарного сдвига rates (в б.п.) для фиксированного набора будущих дат потоков.
+    Логарифмы факторов роста рассчитываются один раз на каждое значение спреда, фактор дисконтирования — exp(-t · ln(1 + ставка)),
+    поэтому каждая итерация солвера — одно умножение и одна экспонента над массивом сроков. Спред (доходность) может быть числом или
+    массивом: в последнем случае результат — массив размера (спреды × даты) """
+
+    def __init__(self, t, rates):
+        self.t = t
+        self.rates = rates
+        self.lastYTM = (None, None)
+
+    def df(self, spread):
+        # Фактор дисконтирования по КБД со спредом spread в б.п.:
+        spread = np.asarray(spread, dtype=float)[..., np.newaxis]
+        return np.exp(-self.t * np.log1p((self.rates + spread) / 10000.0))
+
+    def df_ytm(self, ytm):
+        # Фактор дисконтирования по доходности ytm в % годовых. Факторы для последнего числового значения ytm сохраняются: после
+        # решения уравнения на YTM грязная цена и дюрация рассчитываются по уже готовым факторам:
+        if np.ndim(ytm) == 0 and self.lastYTM[0] == float(ytm):
+            return self.lastYTM[1]
+        df = np.exp(-self.t * np.log1p(np.asarray(ytm, dtype=float)[..., np.newaxis] / 100.0))
+        if np.ndim(ytm) == 0:
+            self.lastYTM = (float(ytm), df)
+        return df
+
+    def price(self, flows, spread, slope=0.0):
+        # Приведенная стоимость потоков flows по КБД со спредом spread и ее первая и вторая производные по спреду (на 1 б.п.). slope —
+        # производная самих потоков по спреду (например, выплат по требуемой надбавке к Ключевой ставке, рассчитанных по тому же спреду).
+        # Производные фактора дисконтирования: df' = -t · u · df, df'' = t · (t + 1) · u² · df, где u = 1 / (10000 + КБД + спред):
+        df = self.df(spread)
+        u = 1.0 / (10000.0 + self.rates + np.asarray(spread, dtype=float)[..., np.newaxis])
+        return self.derivatives(flows, slope, df, u)
+
+    def price_ytm(self, flows, ytm):
+        # Приведенная стоимость потоков flows по доходности ytm и ее первая и вторая производные по доходности (на 1 п.п.):
+        df = self.df_ytm(ytm)
+        u = 1.0 / (100.0 + np.asarray(ytm, dtype=float)[..., np.newaxis])
+        return self.derivatives(flows, 0.0, df, u)
+
+    def duration_ytm(self, flows, ytm):
+        # Дюрация Маколея потоков flows по доходности ytm и ее производная по доходности (на 1 п.п.): D' = -(E[t²] - D²) / (100 + ytm):
+        weights = flows * self.df_ytm(ytm)
+        duration = (self.t * weights).sum(axis=-1) / weights.sum(axis=-1)
+        square = (self.t ** 2.0 * weights).sum(axis=-1) / weights.sum(axis=-1)
+        return duration, -(square - duration ** 2.0) / (100.0 + np.asarray(ytm, dtype=float))
+
+    def derivatives(self, flows, slope, df, u):
+        df_1 = -self.t * u * df
+        df_2 = self.t * (self.t + 1.0) * u ** 2.0 * df
+        return ((flows * df).sum(axis=-1),
+                (slope * df + flows * df_1).sum(axis=-1),
+                (2.0 * slope * df_1 + flows * df_2).sum(axis=-1))
+
+
+class DiscountingContext(object):
+
+    """ Контекст дисконтирования одного расчета: Дата оценки, Параметры КБД и сценарный сдвиг КБД zcyc_shift(t) (в б.п.). Значения КБД
+    без сдвига кэшируются по целому количеству дней от Даты оценки, поэтому потоки по облигации, по свопам и график КБД используют одни и
+    те же значения Y(t), а повторные запросы тех же дат не пересчитывают функцию Y(•) """
+
+    def __init__(self, pricing_date, zcyc_parameters, zcyc_shift=None):
+        self.pricingDate = np.datetime64(pricing_date, 'D')
+        self.zcycParameters = zcyc_parameters
+        self.zcycShift = zcyc_shift
+        self.zcycValues = {}
+        self.grids = {}
+        self.curves = {}
+
+    def days(self, dates):
+        # Количество дней от Даты оценки до дат dates:
+        return ((np.asarray(dates).astype(d_type) - self.pricingDate) / day).astype(int)
+
+    def years(self, dates):
+        # Срок от Даты оценки до дат dates в годах:
+        return self.days(dates) / 365.0
+
+    def zcyc(self, days):
+        # Значения КБД без сдвига для сроков days (в днях, строго положительных), в б.п.:
+        days = np.asarray(days, dtype=int)
+        missing = np.array(sorted(set(days.tolist()) - set(self.zcycValues.keys())), dtype=int)
+        if len(missing) > 0:
+            self.zcycValues.update(zip(missing.tolist(), np.atleast_1d(Y(self.zcycParameters, missing / 365.0)).tolist()))
+        return np.array([self.zcycValues[d] for d in days.tolist()], dtype=float)
+
+    def rate(self, t):
+        # Значение КБД с учетом сдвига для произвольного срока t в годах, в б.п.:
+        return Y(self.zcycParameters, t) + (0.0 if self.zcycShift is None else self.zcycShift(t))
+
+    def grid(self, dates):
+        # Сроки и значения КБД с учетом сдвига для будущих дат dates (повторный запрос тех же дат возвращает тот же объект):
+        days = self.days(dates)
+        key = days.tobytes()
+        if key not in self.grids:
+            t = days / 365.0
+            rates = self.zcyc(days) + (0.0 if self.zcycShift is None else self.zcycShift(t))
+            self.grids[key] = DiscountGrid(t, rates)
+        return self.grids[key]
+
+    def curve(self, end, step=0.1):
+        # Значения КБД без сдвига на сетке сроков step, 2 · step, ..., end лет (для графика КБД), в б.п.:
+        key = (float(end), float(step))
+        if key not in self.curves:
+            self.curves[key] = Y(self.zcycParameters, np.arange(step, end + step, step))
+        return self.curves[key]
+
+
+# ----- МЕТОД НЬЮТОНА -------------------------------------------------------------------------------------------------------------------- #
+def newton_root(function, target, start, tolerance=1e-10, iterations=100, **kwargs):
+
+    """ Решение уравнения function(x)[0] = target методом Ньютона от начального значения start, где function возвращает значение и его
+    первую производную (например, DiscountGrid.price). Как только найдены точки по обе стороны от решения, шаг Ньютона, выходящий за их
+    пределы или уменьшающий отклонение менее чем вдвое, заменяется делением отрезка пополам: так решение находится и для ступенчатых
+    монотонных функций (например, приведенной стоимости выплат, округленных до копеек). Итерации завершаются, когда шаг или отрезок меньше
+    tolerance (относительно max(1, |x|)). Если метод не сошелся за iterations итераций (или значения не конечны), решение ищется
+    минимизацией квадрата отклонения от start, как в Convention.mbsPricing (kwargs передаются в minimize, например method='Nelder-Mead') """
+
+    x, below, above, previous = float(start), None, None, None
+    for i in range(iterations):
+        value, derivative = function(x)[:2]
+        value, derivative = float(value) - target, float(derivative)
+        if value == 0.0:
+            return x
+        if not np.isfinite(value):
+            break
+        if value < 0.0:
+            below = x
+        else:
+            above = x
+
+        x_next = x - value / derivative if np.isfinite(derivative) and derivative != 0.0 else None
+        if below is not None and above is not None:
+            a, b = min(below, above), max(below, above)
+            if b - a <= tolerance * max(1.0, abs(x)):
+                return x
+            stalled = previous is not None and abs(value) > 0.5 * abs(previous)
+            if x_next is None or not a < x_next < b or stalled:
+                x_next = (a + b) / 2.0
+        if x_next is None:
+            break
+
+        step, x, previous = x_next - x, x_next, value
+        if abs(step) <= tolerance * max(1.0, abs(x)):
+            return x
+
+    return minimize(lambda x: (function(x[0])[0] - target) ** 2.0, np.array([float(start)]), **kwargs).x[0]
+
+
+def g_spread_ytm(grid, flows, g_spread, rate, start=0.0, tolerance=1e-10, step=1e-4):
+
+    """ YTM потоков flows (grid — объект DiscountGrid), при которой G-спред равен g_spread: 100 · YTM - rate(D(YTM)) = g_spread, где
+    D(YTM) — дюрация Маколея (не меньше 0.001), rate(t) — значение КБД в б.п. для срока t в годах (например, DiscountingContext.rate).
+    Дюрация убывает по YTM, поэтому левая часть уравнения монотонно возрастает с наклоном 100 - rate'(D) · D'(YTM), близким к 100.
+    Дюрация и ее производная по YTM рассчитываются аналитически по одним и тем же факторам дисконтирования, наклон КБД rate'(D) — по
+    центральной разности с шагом step лет один раз, в точке дюрации первой итерации (наклон КБД между итерациями почти не меняется),
+    поэтому каждая итерация вызывает функцию КБД один раз, а метод Ньютона сходится за несколько итераций с точностью tolerance
+    (см. newton_root) """
+
+    curve_slope = []
+
+    def equation(ytm):
+        duration, slope = grid.duration_ytm(flows, ytm)
+        if duration < 0.001:
+            return 100.0 * ytm - rate(0.001), 100.0
+        if not curve_slope:
+            rates = rate(np.array([duration - step, duration, duration + step]))
+            curve_slope.append((rates[2] - rates[0]) / (2.0 * step))
+            return 100.0 * ytm - rates[1], 100.0 - curve_slope[0] * slope
+        return 100.0 * ytm - rate(duration), 100.0 - curve_slope[0] * slope
+
+    return newton_root(equation, g_spread, start, tolerance)
+
+
+# ----- ПОЛУЧАТЕЛИ ДОЛИ ГОТОВНОСТИ РАСЧЕТА ---------------------------------------------------------------------------------------------- #
+class ProgressReporter(object):
+
+    """ Базовый получатель доли готовности расчета (ничего не делает) """
+
+    def update(self, percent):
+        pass
+
+    def close(self):
+        pass
+
+
+class TqdmProgress(ProgressReporter):
+
+    """ Progress bar в консоли. Модуль tqdm импортируется только при создании объекта """
+
+    def __init__(self, desc=None):
+        import sys
+        import tqdm
+        self.bar = tqdm.tqdm(total=100, file=sys.stdout, ncols=100, leave=False,
+                             desc=desc, bar_format="{l_bar}|{bar}| {n_fmt}/{total_fmt}{postfix}")
+
+    def update(self, percent):
+        progress_delta = int(round(percent)) - int(self.bar.n)
+        if progress_delta != 0:
+            self.bar.update(progress_delta)
+
+    def close(self):
+        self.bar.close()
+
+
+class CallbackProgress(ProgressReporter):
+
+    """ Передача доли готовности расчета (целое число процентов) в функцию callback. Функция вызывается только при изменении
+    целого числа процентов """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.percent = None
+
+    def update(self, percent):
+        percent = int(round(percent))
+        if percent != self.percent:
+            self.percent = percent
+            self.callback(percent)
+
+
+class AsyncQueueProgress(CallbackProgress):
+
+    """ Передача доли готовности расчета, запущенного в отдельном потоке, в очередь asyncio.Queue в виде пары (key, percent)
+    (например, для отправки статуса расчета на сайт из асинхронного сервиса) """
+
+    def __init__(self, queue, loop, key=None):
+        super().__init__(lambda percent: loop.call_soon_threadsafe(queue.put_nowait, (key, percent)))
+
+
+def progress_reporter(progress_bar, desc=None):
+
+    """ Получатель доли готовности расчета по значению параметра progressBar: None/false — без отображения готовности, true/"tqdm" —
+    progress bar в консоли, функция — CallbackProgress, объект ProgressReporter используется как есть """
+
+    if progress_bar is None or progress_bar is False:
+        return None
+    if isinstance(progress_bar, ProgressReporter):
+        return progress_bar
+    if progress_bar is True or progress_bar == 'tqdm':
+        return TqdmProgress(desc)
+    if callable(progress_bar):
+        return CallbackProgress(progress_bar)
+
+    raise Exception(EXCEPTIONS._18)
+
+
 # ----- ЗАПРОС НА ОБНОВЛЕНИЕ ДОЛИ ГОТОВНОСТИ РАСЧЕТА НА САЙТЕ КАЛЬКУЛЯТОРА --------------------------------------------------------------- #
 def update(connection_id, percent, progress_bar=None):
 
-    percent = np.round(percent, 0)
+    # Если получатель доли готовности расчета не задан, обновление не производится:
+    if progress_bar is None:
+        return
+
+    if isinstance(progress_bar, ProgressReporter):
+        progress_bar.update(percent)
 
-    if connection_id is None and progress_bar is not None:
-        progress_delta = int(percent) - int(progress_bar.n)
+    elif connection_id is None:
+        # Progress bar tqdm, переданный напрямую (например, при отдельном запуске loansCashflowModel):
+        progress_delta = int(np.round(percent, 0)) - int(progress_bar.n)
         progress_bar.update(int(progress_delta))
 
-    if connection_id is None:
-        return
+# ----- ЗАМЕРЫ ВРЕМЕНИ ВЫПОЛНЕНИЯ ЭТАПОВ РАСЧЕТА ----------------------------------------------------------------------------------------- #
+class StageTimer(object):
+
+    """ Иерархические замеры времени выполнения этапов расчета. Этап открывается методом start(name) и закрывается методом stop().
+    Этапы, открытые до закрытия текущего этапа, считаются его вложенными этапами """
+
+    def __init__(self, name):
+        self.timings = {'stage': name, 'seconds': None, 'stages': []}
+        self.stack = [(self.timings, time.perf_counter())]
+
+    def start(self, name):
+        stage = {'stage': name, 'seconds': None, 'stages': []}
+        self.stack[-1][0]['stages'].append(stage)
+        self.stack.append((stage, time.perf_counter()))
+
+    def stop(self):
+        if len(self.stack) > 1:
+            stage, start = self.stack.pop()
+            stage['seconds'] = round(time.perf_counter() - start, 6)
+
+    def report(self):
+        self.timings['seconds'] = round(time.perf_counter() - self.stack[0][1], 6)
+        return self.timings
+
+    def log(self):
+        logger.info(json.dumps(self.report(), ensure_ascii=False))
+
+# ----- РЕЗУЛЬТАТ РАСЧЕТА ---------------------------------------------------------------------------------------------------------------- #
+def table_to_lists(table, nulls=True):
+
+    """ Функция, преобразующая таблицу pandas.DataFrame в словарь списков (формат выходных данных API). Даты преобразуются в строки
+    вида 2023-11-01T00:00:00. При nulls=True пропущенные значения (NaN, NaT) заменяются на None """
+
+    lists = {}
+    for column in table.columns:
+        values = table[column].values
+        if np.issubdtype(values.dtype, np.datetime64):
+            values = values.astype(s_type).astype(str).astype(object)
+            if nulls:
+                values[values == 'NaT'] = None
+        elif values.dtype.kind in 'fc' and nulls:
+            values = values.astype(object)
+            values[pd.isnull(values)] = None
+        elif values.dtype.kind == 'O':
+            values = values.copy()
+            if nulls:
+                values[pd.isnull(values)] = None
+            lists[column] = [v.item() if isinstance(v, np.generic) else v for v in values]
+            continue
+        lists[column] = values.tolist()
+
+    return lists
+
+
+def json_default(value):
+
+    """ Преобразование скалярных значений numpy при сериализации результата расчета в JSON """
+
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+class CalculationResult(dict):
+
+    """ Результат расчета. Таблицы (денежные потоки, данные для графиков) хранятся в колоночном виде (pandas.DataFrame) и преобразуются
+    в словари списков (формат выходных данных API) только при обращении к ним как к элементам словаря, при вызове to_dict/to_json
+    или при сериализации через json.dumps. Таблицы без преобразования доступны через метод table, выгрузка в Apache Arrow/Parquet —
+    через методы to_arrow/to_parquet (модуль pyarrow импортируется только при вызове этих методов) """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.tables = {}      # (ключ, часть) -> (таблица, замена пропущенных значений на None)
+        self.pending = set()  # ключи таблиц, еще не преобразованных в словари списков
+
+    def setTable(self, key, table, part=None, nulls=True):
+
+        """ Сохранение таблицы под ключом key (и частью part, например, poolCashflowTable -> total) без преобразования """
+
+        self.tables[(key, part)] = (table, nulls)
+        self.pending.add(key)
+        if part is None:
+            dict.__setitem__(self, key, None)
+        else:
+            if not isinstance(dict.get(self, key), dict):
+                dict.__setitem__(self, key, {})
+            dict.__getitem__(self, key)[part] = None
+
+    def table(self, key, part=None):
+
+        """ Таблица pandas.DataFrame под ключом key (None, если таблица не сформирована) """
+
+        table = self.tables.get((key, part))
+        return None if table is None else table[0]
+
+    def materialize(self, key=None):
+
+        """ Преобразование таблиц под ключом key (всех таблиц при key=None) в словари списков """
+
+        for k in list(self.pending) if key is None else [key]:
+            if k not in self.pending:
+                continue
+            self.pending.discard(k)
+            for (table_key, part), (table, nulls) in self.tables.items():
+                if table_key != k:
+                    continue
+                lists = None if table is None else table_to_lists(table, nulls)
+                if part is None:
+                    dict.__setitem__(self, k, lists)
+                else:
+                    dict.__getitem__(self, k)[part] = lists
+
+    def __getitem__(self, key):
+        self.materialize(key)
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        if key in self.pending:
+            self.pending.discard(key)
+            self.tables = {k: v for k, v in self.tables.items() if k[0] != key}
+        dict.__setitem__(self, key, value)
+
+    def __iter__(self):
+        return dict.__iter__(self)
+
+    def __repr__(self):
+        self.materialize()
+        return dict.__repr__(self)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        self.materialize()
+        return dict.items(self)
+
+    def values(self):
+        self.materialize()
+        return dict.values(self)
+
+    def copy(self):
+        self.materialize()
+        return dict.copy(self)
+
+    def to_dict(self):
+
+        """ Результат расчета в формате выходных данных API (все таблицы преобразованы в словари списков) """
+
+        return self.copy()
+
+    def to_json(self, **kwargs):
+
+        """ Результат расчета в формате JSON """
+
+        kwargs.setdefault('ensure_ascii', False)
+        kwargs.setdefault('default', json_default)
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_arrow(self, key, part=None):
+
+        """ Таблица под ключом key в формате pyarrow.Table """
+
+        import pyarrow
+
+        table = self.table(key, part)
+        return None if table is None else pyarrow.Table.from_pandas(table, preserve_index=False)
+
+    def to_parquet(self, path, key=None, part=None):
+
+        """ Сохранение таблицы под ключом key в Parquet-файл path. При key=None все сформированные таблицы сохраняются в папку path
+        в файлы <ключ>.parquet (<ключ>_<часть>.parquet для таблиц, разбитых на части) """
+
+        import pyarrow.parquet
+
+        if key is not None:
+            pyarrow.parquet.write_table(self.to_arrow(key, part), path)
+            return
+
+        os.makedirs(path, exist_ok=True)
+        for (table_key, table_part), (table, nulls) in self.tables.items():
+            if table is None:
+                continue
+            name = table_key if table_part is None else table_key + '_' + table_part
+            pyarrow.parquet.write_table(self.to_arrow(table_key, table_part), os.path.join(path, name + '.parquet'))
+
 
-# ----- ТЕХНИЧЕСКИЕ ПЕРЕМЕННЫЕ ДЛЯ СОХРАНЕНИЯ РЕЗУЛЬТАТА РАСЧЕТА В EXCEL-ФАЙЛ ------------------------------------------------------------ #
-rslt_cf = pd.DataFrame([])
-pool_cf_total = pd.DataFrame([])
-pool_cf_fixed = pd.DataFrame([])
-pool_cf_float = pd.DataFrame([])
-subs_cf = pd.DataFrame([])
-bond_cf = pd.DataFrame([])
+# ----- КЛЮЧЕВЫЕ СРОКИ КБД --------------------------------------------------------------------------------------------------------------- #
+# Сроки (в годах), для которых рассчитываются дюрации ключевых сроков КБД (key rate durations). Сдвиг КБД для ключевого срока линейно
+# убывает до нуля к соседним срокам (до первого и после последнего срока — постоянен), поэтому сумма сдвигов по всем срокам равна
+# параллельному сдвигу КБД:
+krd_tenors = [0.5, 1.0, 2.0, 3.0, 5.0, 7.0, 10.0, 15.0, 20.0]
 
+
+def krd_weights(tenors, t):
+
+    """ Веса сдвига КБД для каждого ключевого срока tenors в точках t (матрица размером len(tenors) x len(t)) """
+
+    t = np.clip(np.asarray(t, dtype=float), tenors[0], tenors[-1])
+    return np.array([np.interp(t, tenors, np.eye(len(tenors))[i]) for i in range(len(tenors))])
+
+
+# ----- КЛЮЧ МОДЕЛИ ДЕНЕЖНОГО ПОТОКА ----------------------------------------------------------------------------------------------------- #
+# Опорные ценовые метрики не влияют на денежный поток по ипотечному покрытию и ИЦБ ДОМ.РФ: при одинаковых остальных параметрах
+# расчета poolCashflowModel и mbsCashflowModel дают один и тот же результат, и различается только расчет ценовых метрик (mbsPricing).
+# Служебные параметры не влияют на результат расчета вовсе:
+quote_parameters = ['zSpread', 'gSpread', 'dirtyPrice', 'cleanPrice', 'requiredKeyRatePremium']
+service_parameters = ['connectionId', 'progressBar', 'logTimings', 'leanMemory']
+
+
+def model_key(parameters):
+
+    """ Канонический хэш параметров расчета, от которых зависит денежный поток (все параметры, кроме опорных ценовых метрик и служебных
+    параметров). Незаданные параметры (None) не учитываются, идентификатор выпуска из поля isin приравнивается к bondID """
+
+    return parameters_hash(parameters, quote_parameters + service_parameters)
+
+
+def calculation_key(parameters):
+
+    """ Канонический хэш всех параметров расчета, кроме служебных (в отличие от model_key, учитывает опорные ценовые метрики) """
+
+    return parameters_hash(parameters, service_parameters)
+
+
+def parameters_hash(parameters, excluded):
+
+    inputs = {key: value for key, value in parameters.items() if key not in excluded and value is not None}
+
+    bond_id = inputs.pop('isin', None)
+    if 'bondID' not in inputs and bond_id is not None:
+        inputs['bondID'] = bond_id
+
+    def default(value):
+        if isinstance(value, (np.generic, np.ndarray)):
+            return json_default(value)
+        return str(value)
+
+    content = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=default)
+    return hashlib.sha256(content.encode('utf8')).hexdigest()
+
+
+# ----- КЭШ ОТВЕТОВ МЕТОДОВ DATASOURCE --------------------------------------------------------------------------------------------------- #
+class CachedResponse(object):
+
+    """ Ответ метода DataSource из кэша (повторяет метод json объекта requests.Response) """
+
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+    def json(self):
+        # Каждый расчет получает собственную копию данных, поэтому изменения внутри расчета не попадают в кэш:
+        return json.loads(self.content)
+
+
+class DataCache(object):
+
+    """ Кэш ответов методов DataSource в памяти процесса. Ответ хранится ttl секунд (ttl=None — без ограничения), при превышении
+    max_entries (max_entries=None — без ограничения) удаляются ответы, к которым дольше всего не обращались. Кэшируются только успешные
+    ответы. Ответы, отсутствующие в кэше, загружаются функцией source (по умолчанию — requests.get) """
+
+    def __init__(self, ttl=600.0, max_entries=256, source=None):
+        self.ttl = ttl
+        self.maxEntries = max_entries
+        self.source = source if source is not None else get
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url, timeout=None, **kwargs):
+
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None and (self.ttl is None or now - entry[0] < self.ttl):
+                self.entries.move_to_end(url)
+                self.hits += 1
+                return CachedResponse(entry[1])
+
+        response = self.source(url, timeout=timeout, **kwargs)
+        with self.lock:
+            self.misses += 1
+            if response.status_code == 200:
+                self.entries[url] = (now, response.content)
+                self.entries.move_to_end(url)
+                while self.maxEntries is not None and len(self.entries) > self.maxEntries:
+                    self.entries.popitem(last=False)
+
+        return response
+
+    def put(self, url, content):
+        """ Добавление в кэш ответа на запрос url, загруженного заранее (content — тело ответа в формате JSON) """
+        with self.lock:
+            self.entries[url] = (time.monotonic(), content)
+            self.entries.move_to_end(url)
+            while self.maxEntries is not None and len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def statistics(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# ----- КЭШ ДЕНЕЖНОГО ПОТОКА ------------------------------------------------------------------------------------------------------------- #
+class ModelCache(object):
+
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Кэш состояния расчета после расчета денежного потока (poolCashflowModel и mbsCashflowModel)
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Денежный поток по ипотечному покрытию и ИЦБ ДОМ.РФ, а также данные модели макроэкономики зависят только от выпуска, дат и допущений
+    модели, но не от опорной ценовой метрики. Поэтому при повторном расчете того же выпуска с другим Z-спредом или ценой состояние расчета
+    после расчета денежного потока можно взять из кэша и сразу перейти к расчету ценовых метрик (см. описание функции Convention.restore).
+
+    Состояние хранится в сериализованном виде (pickle), поэтому каждый расчет получает собственную копию. Ключ кэша — хэш параметров
+    расчета, от которых зависит денежный поток (см. описание функции model_key), адреса сервера API, а также сегодняшней даты, если Дата
+    оценки не задана (по умолчанию Дата оценки — сегодняшняя дата).
+
+    Если Дата оценки не раньше сегодняшней даты (или не задана), а дата и время КБД zcycDateTime не заданы, состояние содержит параметры
+    КБД, которые обновляются в течение торгового дня, а ключ кэша от них не зависит. Такое состояние хранится не дольше intraday_ttl
+    секунд, даже если время хранения ttl не ограничено.
+
+    Параметры:
+
+        Опциональные:
+            1. max_entries    — максимальное количество состояний в памяти процесса (при превышении удаляются состояния, к которым дольше
+                                всего не обращались). По умолчанию 0 — кэш в памяти не используется
+            2. ttl            — время хранения состояния, секунды (None — без ограничения). Ограничивает использование устаревших данных
+                                (например, параметров КБД, обновляемых в течение торгового дня)
+            3. path           — директория для хранения состояний на диске (None — не используется). Позволяет использовать рассчитанные
+                                денежные потоки в разных процессах и после перезапуска
+            4. max_disk_bytes — максимальный объем состояний в директории path, байты (None — без ограничения). После каждой записи из
+                                директории удаляются устаревшие (старше ttl) состояния, а при превышении объема — самые старые. По
+                                умолчанию 1 ГБ
+            5. intraday_ttl   — время хранения состояний с внутридневными параметрами КБД, секунды (по умолчанию 60)
+
+    Кэш по умолчанию выключен. Включить его можно методом configure объекта model_cache или переменными окружения
+    CONVENTION_MODEL_CACHE_SIZE, CONVENTION_MODEL_CACHE_TTL, CONVENTION_MODEL_CACHE_DIR и CONVENTION_MODEL_CACHE_DIR_BYTES.
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    def __init__(self, max_entries=0, ttl=600.0, path=None, max_disk_bytes=2 ** 30, intraday_ttl=60.0):
+        self.maxEntries = 0
+        self.ttl = ttl
+        self.path = None
+        self.maxDiskBytes = max_disk_bytes
+        self.intradayTTL = intraday_ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.configure(max_entries, ttl, path, max_disk_bytes, intraday_ttl)
+
+    def configure(self, max_entries=None, ttl=None, path=None, max_disk_bytes=None, intraday_ttl=None):
+        """ Смена параметров кэша (незаданные параметры не изменяются) """
+        with self.lock:
+            if max_entries is not None:
+                self.maxEntries = int(max_entries)
+            if ttl is not None:
+                self.ttl = float(ttl) if ttl > 0 else None
+            if max_disk_bytes is not None:
+                self.maxDiskBytes = int(max_disk_bytes) if max_disk_bytes > 0 else None
+            if intraday_ttl is not None:
+                self.intradayTTL = float(intraday_ttl)
+            if path is not None:
+                self.path = path or None
+                if self.path is not None:
+                    os.makedirs(self.path, exist_ok=True)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    @property
+    def enabled(self):
+        return self.maxEntries > 0 or self.path is not None
+
+    @staticmethod
+    def key(parameters):
+        inputs = [model_key(parameters), API.SERVER + ':' + str(API.PORT)]
+        if 'pricingDate' not in parameters.keys() or parameters['pricingDate'] is None:
+            inputs.append(str(np.datetime64('today')))
+        return hashlib.sha256(' '.join(inputs).encode('utf8')).hexdigest()
+
+    @staticmethod
+    def intraday(parameters):
+        """ Содержит ли состояние параметры КБД, обновляемые в течение дня: zcycDateTime не задана, а Дата оценки не раньше сегодняшней """
+        if 'zcycDateTime' in parameters.keys() and parameters['zcycDateTime'] is not None:
+            return False
+        if 'pricingDate' not in parameters.keys() or parameters['pricingDate'] is None:
+            return True
+        try:
+            return np.datetime64(str(parameters['pricingDate'])[:10], 'D') >= np.datetime64('today', 'D')
+        except ValueError:
+            return True
+
+    def max_age(self, parameters):
+        """ Время хранения состояния для параметров расчета parameters, секунды (None — без ограничения) """
+        if self.intraday(parameters):
+            return self.intradayTTL if self.ttl is None else min(self.ttl, self.intradayTTL)
+        return self.ttl
+
+    def load(self, parameters):
+
+        """ Сериализованное состояние для параметров расчета parameters (None, если состояния нет в кэше или оно устарело) """
+
+        if not self.enabled:
+            return None
+
+        key = self.key(parameters)
+        ttl = self.max_age(parameters)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (ttl is None or now - entry[0] < ttl):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        if self.path is not None:
+            file = os.path.join(self.path, key + '.pickle')
+            try:
+                created = os.path.getmtime(file)
+                if ttl is None or now - created < ttl:
+                    with open(file, 'rb') as f:
+                        content = f.read()
+                    self.store(parameters, content, created=created, disk=False)
+                    with self.lock:
+                        self.hits += 1
+                    return content
+            except OSError:
+                pass
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def store(self, parameters, content, created=None, disk=True):
+
+        """ Сохранение сериализованного состояния для параметров расчета parameters """
+
+        if not self.enabled:
+            return
+
+        key = self.key(parameters)
+        with self.lock:
+            if self.maxEntries > 0:
+                self.entries[key] = (time.time() if created is None else created, content)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxEntries:
+                    self.entries.popitem(last=False)
+
+        if disk and self.path is not None:
+            # Запись через временный файл, чтобы другие процессы не прочитали состояние частично:
+            file = os.path.join(self.path, key + '.pickle')
+            temporary = file + '.' + str(os.getpid()) + '.tmp'
+            with open(temporary, 'wb') as f:
+                f.write(content)
+            os.replace(temporary, file)
+            self.prune()
+
+    def prune(self):
+
+        """ Удаление из директории path состояний старше ttl и, при превышении max_disk_bytes, самых старых состояний """
+
+        files = []
+        for name in os.listdir(self.path):
+            if name.endswith('.pickle'):
+                file = os.path.join(self.path, name)
+                try:
+                    files.append((os.path.getmtime(file), os.path.getsize(file), file))
+                except OSError:
+                    pass  # файл удален другим процессом
+
+        now, total = time.time(), 0
+        for created, size, file in sorted(files, reverse=True):
+            total += size
+            expired = self.ttl is not None and now - created >= self.ttl
+            if expired or (self.maxDiskBytes is not None and total > self.maxDiskBytes):
+                try:
+                    os.remove(file)
+                except OSError:
+                    pass
+
+    def get(self, parameters):
+        content = self.load(parameters)
+        return pickle.loads(content) if content is not None else None
+
+    def put(self, parameters, state):
+        if self.enabled:
+            self.store(parameters, pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def statistics(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+model_cache = ModelCache(int(os.environ.get('CONVENTION_MODEL_CACHE_SIZE', 0)),
+                         float(os.environ.get('CONVENTION_MODEL_CACHE_TTL', 600.0)),
+                         os.environ.get('CONVENTION_MODEL_CACHE_DIR'),
+                         int(os.environ.get('CONVENTION_MODEL_CACHE_DIR_BYTES', 2 ** 30)))
+
+
+# ----- ПАРАМЕТРЫ S-КРИВЫХ --------------------------------------------------------------------------------------------------------------- #
+# Колонки компактного представления S-кривой на одну дату отчетов (массив numpy, одна строка на каждую выдержку кредита):
+s_curves_columns = ['loanAge', 'beta0', 'beta1', 'beta2', 'beta3', 'beta4', 'beta5', 'beta6']
+
+
+def s_curves_array(s_curves):
+    """ Компактное представление S-кривой (loanAge, beta0, ..., beta6), отсортированное по выдержке кредита, из таблицы параметров
+    S-кривой на одну дату отчетов (pandas.DataFrame) """
+    if isinstance(s_curves, np.ndarray):
+        return s_curves
+    array = np.array([np.array(s_curves[c], dtype=float) for c in s_curves_columns]).transpose()
+    return array[np.argsort(array[:, 0], kind='stable')]
+
+
+class SCurvesRepository(object):
+
+    """ Параметры S-кривых в памяти процесса, по одной компактной S-кривой (см. s_curves_columns) на каждую дату отчетов. S-кривые не
+    зависят от выпуска, поэтому S-кривая на каждую дату разбирается один раз и используется во всех расчетах процесса (массивы доступны
+    только для чтения). Метод update принимает поле sCurvesParameters ответа метода GetDataForCalculation (список словарей, словарь
+    списков или pandas.DataFrame) и разбирает только даты отчетов, которых еще нет в репозитории или S-кривая на которые была разобрана
+    более ttl секунд назад (ttl=None — без ограничения; по умолчанию — как у DataCache). Такая дата разбирается заново, и если S-кривая
+    изменилась (например, была исправлена), она заменяется новым массивом (массивы, уже полученные расчетами, не изменяются) """
+
+    def __init__(self, ttl=600.0):
+        self.ttl = ttl
+        self.curves = {}
+        self.times = {}
+        self.lock = threading.Lock()
+        self.parsed = 0
+        self.reused = 0
+        self.replaced = 0
+
+    def update(self, s_curves_parameters):
+
+        """ Добавление S-кривых из s_curves_parameters. Возвращает отсортированный массив дат отчетов, S-кривые на которые были переданы """
+
+        records = isinstance(s_curves_parameters, list)
+        if records:
+            dates = [row['reportDate'] for row in s_curves_parameters]
+        else:
+            dates = list(s_curves_parameters['reportDate'])
+        dates = np.array([str(date)[:10] for date in dates], dtype=object).astype(d_type)
+        report_dates = np.unique(dates)
+
+        now = time.monotonic()
+        with self.lock:
+            new_dates = [date for date in report_dates
+                         if date not in self.curves or (self.ttl is not None and now - self.times[date] >= self.ttl)]
+            self.reused += len(report_dates) - len(new_dates)
+
+        for date in new_dates:
+            index = np.flatnonzero(dates == date)
+            if records:
+                array = np.array([[s_curves_parameters[i][c] for c in s_curves_columns] for i in index], dtype=float)
+                array = array[np.argsort(array[:, 0], kind='stable')]
+            else:
+                array = s_curves_array({c: np.array(s_curves_parameters[c])[index] for c in s_curves_columns})
+            array.flags.writeable = False
+            with self.lock:
+                current = self.curves.get(date)
+                if current is None or not np.array_equal(current, array, equal_nan=True):
+                    self.replaced += current is not None
+                    self.curves[date] = array
+                self.times[date] = now
+                self.parsed += 1
+
+        return report_dates
+
+    def curve(self, report_date):
+        """ Компактная S-кривая на дату отчетов report_date (массив только для чтения) """
+        return self.curves[np.datetime64(report_date, 'D')]
+
+    def statistics(self):
+        with self.lock:
+            return {'reportDates': len(self.curves), 'parsed': self.parsed, 'reused': self.reused, 'replaced': self.replaced}
+
+
+s_curves_repository = SCurvesRepository()
+
+
+# ----- ХРАНИЛИЩЕ ДАННЫХ ПО ВЫПУСКАМ ----------------------------------------------------------------------------------------------------- #
+# Таблицы ответа метода GetDataForCalculation, которые хранятся построчно. Для каждой таблицы указана колонка с датой, по которой
+# таблица обновляется инкрементально:
+reference_tables = {
+    'serviceReportsStatistics': 'reportDate',
+    'investorsReportsData': 'couponDate',
+    'pools': 'reportDate',
+}
+
+
+class ReferenceData(object):
+
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Локальное хранилище данных по выпускам ИЦБ ДОМ.РФ (ответов метода GetDataForCalculation) в базе данных SQLite
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Ответ метода GetDataForCalculation содержит параметры выпуска, всю историю статистики ипотечного покрытия, данных отчетов для инвесторов
+    и доступных срезов ипотечного покрытия, а также параметры S-кривых на все даты отчетов. При включенном хранилище Convention читает эти
+    таблицы из базы данных (запросами по индексу выпуска), а метод GetDataForCalculation вызывается не чаще одного раза в refresh секунд
+    по каждому выпуску.
+
+    Синхронизация инкрементальная: строки таблиц serviceReportsStatistics, investorsReportsData и pools записываются начиная с последней
+    сохраненной по выпуску даты (последняя дата перезаписывается, более ранние не изменяются). Параметры S-кривых не зависят от выпуска,
+    поэтому хранятся в общей таблице, и записываются только даты отчетов, которых еще нет в хранилище.
+
+    Параметры:
+
+        Опциональные:
+            1. path     — путь к файлу базы данных SQLite (None — хранилище не используется)
+            2. refresh  — время, в течение которого данные по выпуску не синхронизируются повторно, секунды (0 — синхронизация при каждом
+                          расчете). По умолчанию 3600
+
+    Хранилище по умолчанию выключено. Включить его можно методом configure объекта reference_data или переменными окружения
+    CONVENTION_REFERENCE_DATA и CONVENTION_REFERENCE_DATA_REFRESH.
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    def __init__(self, path=None, refresh=3600.0):
+        self.path = None
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.syncs = 0
+        self.reads = 0
+        self.configure(path, refresh)
+
+    def configure(self, path=None, refresh=None):
+        """ Смена параметров хранилища (незаданные параметры не изменяются) """
+        with self.lock:
+            if refresh is not None:
+                self.refresh = float(refresh)
+            if path is not None:
+                self.path = path or None
+                if self.path is not None:
+                    with self.connect() as connection:
+                        connection.execute('CREATE TABLE IF NOT EXISTS bonds (bondID TEXT PRIMARY KEY, bondParameters TEXT, '
+                                           'sCurvesFrom TEXT, sCurvesTo TEXT, synced REAL)')
+                        connection.execute('CREATE TABLE IF NOT EXISTS sCurvesParameters (reportDate TEXT, loanAge INTEGER, '
+                                           'PRIMARY KEY (reportDate, loanAge))')
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    @staticmethod
+    def columns(connection, table, columns, keys):
+
+        """ Создание таблицы table (при отсутствии) и добавление в нее недостающих колонок columns """
+
+        names = ', '.join('"' + c + '"' for c in keys)
+        connection.execute('CREATE TABLE IF NOT EXISTS "{0}" ({1}, PRIMARY KEY ({1}))'.format(table, names))
+        existing = [row[1] for row in connection.execute('PRAGMA table_info("{0}")'.format(table))]
+        for column in columns:
+            if column not in existing:
+                connection.execute('ALTER TABLE "{0}" ADD COLUMN "{1}"'.format(table, column))
+
+    @staticmethod
+    def upsert(connection, table, data):
+        if data.empty:
+            return
+        data = data.astype(object).where(data.notna(), None)
+        names = ', '.join('"' + c + '"' for c in data.columns)
+        marks = ', '.join('?' * len(data.columns))
+        connection.executemany('INSERT OR REPLACE INTO "{0}" ({1}) VALUES ({2})'.format(table, names, marks),
+                               data.itertuples(index=False, name=None))
+
+    def sync(self, bond_id, source=None, force=False):
+
+        """ Синхронизация данных по выпуску bond_id. Возвращает True, если данные были загружены методом GetDataForCalculation """
+
+        source = source if source is not None else get
+
+        with self.connect() as connection:
+            row = connection.execute('SELECT synced FROM bonds WHERE bondID = ?', [bond_id]).fetchone()
+            if not force and row is not None and time.time() - row[0] < self.refresh:
+                return False
+
+        response = source(API.DATA_FOR_CALC.format(bond_id), timeout=15)
+        if response.status_code != 200:
+            raise Exception(response.text if hasattr(response, 'text') else response.status_code)
+        data = response.json()
+
+        with self.connect() as connection:
+
+            for table, date in reference_tables.items():
+                frame = pd.DataFrame(data[table])
+                frame.insert(0, 'bondID', bond_id)
+                if date in frame.columns:
+                    frame[date] = frame[date].astype(str)
+                self.columns(connection, table, frame.columns, ['bondID', date])
+                last = connection.execute('SELECT MAX("{0}") FROM "{1}" WHERE bondID = ?'.format(date, table), [bond_id]).fetchone()[0]
+                if last is not None:
+                    frame = frame[frame[date] >= last]
+                self.upsert(connection, table, frame)
+
+            s_curves = pd.DataFrame(data['sCurvesParameters'])
+            s_curves_from, s_curves_to = None, None
+            if not s_curves.empty:
+                s_curves['reportDate'] = s_curves['reportDate'].astype(str)
+                s_curves_from, s_curves_to = s_curves['reportDate'].min(), s_curves['reportDate'].max()
+                self.columns(connection, 'sCurvesParameters', s_curves.columns, ['reportDate', 'loanAge'])
+                stored = [row[0] for row in connection.execute('SELECT DISTINCT reportDate FROM sCurvesParameters')]
+                self.upsert(connection, 'sCurvesParameters', s_curves[~s_curves['reportDate'].isin(stored)])
+
+            connection.execute('INSERT OR REPLACE INTO bonds VALUES (?, ?, ?, ?, ?)',
+                               [bond_id, json.dumps(data['bondParameters'], ensure_ascii=False), s_curves_from, s_curves_to, time.time()])
+
+        with self.lock:
+            self.syncs += 1
+        return True
+
+    def load(self, bond_id, source=None):
+
+        """ Данные по выпуску bond_id в формате ответа метода GetDataForCalculation: параметры выпуска — словарь, остальные таблицы —
+        pandas.DataFrame, отсортированные по дате. При необходимости данные предварительно синхронизируются (функция source повторяет
+        сигнатуру requests.get, по умолчанию — requests.get) """
+
+        self.sync(bond_id, source)
+
+        result = {}
+        with self.connect() as connection:
+            row = connection.execute('SELECT bondParameters, sCurvesFrom, sCurvesTo FROM bonds WHERE bondID = ?', [bond_id]).fetchone()
+            result['bondParameters'] = json.loads(row[0])
+            for table, date in reference_tables.items():
+                query = 'SELECT * FROM "{0}" WHERE bondID = ? ORDER BY "{1}"'.format(table, date)
+                result[table] = pd.read_sql_query(query, connection, params=[bond_id]).drop(columns='bondID')
+            query = 'SELECT * FROM sCurvesParameters WHERE reportDate BETWEEN ? AND ? ORDER BY reportDate, loanAge'
+            result['sCurvesParameters'] = pd.read_sql_query(query, connection, params=[row[1], row[2]])
+
+        with self.lock:
+            self.reads += 1
+        return result
+
+    def statistics(self):
+        with self.lock:
+            return {'path': self.path, 'syncs': self.syncs, 'reads': self.reads}
+
+
+reference_data = ReferenceData(os.environ.get('CONVENTION_REFERENCE_DATA'),
+                               float(os.environ.get('CONVENTION_REFERENCE_DATA_REFRESH', 3600.0)))
+
+
+# ----- ПОТОКОВАЯ ЗАПИСЬ РЕЗУЛЬТАТОВ РАСЧЕТОВ -------------------------------------------------------------------------------------------- #
+# Колонки таблиц результатов расчетов:
 rslt_cols = ['isin', 'pricingDate', 'poolReportDate', 'zcycDateTime', 'zSpread',
              'requiredKeyRatePremium', 'dirtyPrice', 'cleanPrice', 'modelCPR']
 
@@ -328,13 +1444,318 @@ bond_cols = ['isin', 'pricingDate', 'couponDate', 'bondPrincipalStartPeriod', 'b
 date_cols = ['pricingDate', 'zcycDateTime', 'poolReportDate', 'reportDate', 'paymentMonth', 'keyRateStartDate',
              'subsidyPaymentDate', 'subsidyCouponDate', 'couponDate', 'nettingDate']
 
-def export_table(sheet: openpyxl.Workbook, df: pd.DataFrame, start_row: int = 0, start_col: int = 0):
-    rows = dataframe_to_rows(df, index=False, header=False)
-    for r_idx, row in enumerate(rows, start_row + 1):
-        for c_idx, value in enumerate(row, start_col + 1):
-            cell = sheet.cell(row=r_idx, column=c_idx)
-            if isinstance(value, pd.Timestamp):
-                cell.number_format = 'dd.MM.YYYY'
-            elif isinstance(value, float):
-                cell.number_format = '#,##0.00'
-            cell.value = value
\ No newline at end of file
+# Таблицы результатов расчетов: название таблицы, лист в файле TEMPLATE.xlsx, колонки:
+result_tables = [
+    ('rslt',       'Оценка',                rslt_cols),
+    ('pool_total', 'Все кредиты',           pool_cols),
+    ('pool_fixed', 'Фиксированная часть',   pool_cols),
+    ('pool_float', 'Плавающая часть',       pool_cols),
+    ('subs',       'Формирование субсидий', subs_cols),
+    ('bond',       'ИЦБ',                   bond_cols),
+]
+
+checkpoint_key = 'calculationKey'  # колонка с ключом расчета в CSV-файлах контрольной точки (см. класс ResultCollector)
+
+template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'TEMPLATE.xlsx')
+template_header_rows = 2  # количество строк заголовка на листах TEMPLATE.xlsx
+
+
+def table_columns(table, columns):
+
+    """ Значения колонок таблицы в виде списков объектов Python для построчной записи: даты — datetime, пропущенные значения — None """
+
+    values = []
+    for column in columns:
+        series = table[column] if column in table.columns else pd.Series([None] * len(table), dtype=object)
+        if column in date_cols:
+            series = pd.to_datetime(series)
+            values.append([None if pd.isnull(v) else v.to_pydatetime() for v in series])
+        else:
+            values.append(series.astype(object).where(series.notna(), None).tolist())
+    return values
+
+
+class ResultWriter(object):
+
+    """ Базовый класс потоковой записи таблиц результатов расчетов (см. result_tables). Таблицы каждого выпуска облигаций дописываются
+    методом write по мере завершения расчета, запись завершается методом close """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = {name: 0 for name, sheet, columns in result_tables}
+
+    def write(self, name, table):
+        if table is None or table.empty:
+            return
+        self.append(name, table)
+        self.rows[name] += len(table)
+
+    def append(self, name, table):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ExcelResultWriter(ResultWriter):
+
+    """ Запись в Excel-файл в режиме write-only (строки сразу сбрасываются в файл и не хранятся в памяти). Строки заголовка, ширина
+    колонок, закрепление областей и фильтр копируются из TEMPLATE.xlsx. Формат чисел и дат задается один раз на колонку """
+
+    def __init__(self, path, template=template_path):
+
+        ResultWriter.__init__(self, path)
+
+        import openpyxl
+        from copy import copy
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.worksheet.dimensions import ColumnDimension
+
+        self.workbook = openpyxl.Workbook(write_only=True)
+        source = openpyxl.load_workbook(template)
+        self.sheets, self.cells = {}, {}
+
+        for name, sheet, columns in result_tables:
+
+            template_sheet = source[sheet]
+            ws = self.workbook.create_sheet(sheet)
+            for key, d in template_sheet.column_dimensions.items():
+                ws.column_dimensions[key] = ColumnDimension(ws, index=key, width=d.width, min=d.min, max=d.max, hidden=d.hidden)
+            for key, dimension in template_sheet.row_dimensions.items():
+                if key <= template_header_rows:
+                    ws.row_dimensions[key].height = dimension.height
+            ws.freeze_panes = template_sheet.freeze_panes
+            ws.auto_filter.ref = template_sheet.auto_filter.ref
+
+            for row in template_sheet.iter_rows(min_row=1, max_row=template_header_rows):
+                header = []
+                for template_cell in row:
+                    cell = WriteOnlyCell(ws, template_cell.value)
+                    if template_cell.has_style:
+                        cell.font = copy(template_cell.font)
+                        cell.fill = copy(template_cell.fill)
+                        cell.border = copy(template_cell.border)
+                        cell.alignment = copy(template_cell.alignment)
+                    header.append(cell)
+                ws.append(header)
+
+            # Ячейки с форматом для колонок с датами и числами (одна ячейка на колонку, переиспользуется при записи каждой строки):
+            self.cells[name] = [None] * len(columns)
+            for i, column in enumerate(columns):
+                if column in date_cols:
+                    self.cells[name][i] = WriteOnlyCell(ws)
+                    self.cells[name][i].number_format = 'dd.MM.YYYY'
+                elif column != 'isin':
+                    self.cells[name][i] = WriteOnlyCell(ws)
+                    self.cells[name][i].number_format = '#,##0.00'
+
+            self.sheets[name] = (ws, columns)
+
+    def append(self, name, table):
+
+        ws, columns = self.sheets[name]
+        cells = self.cells[name]
+        for row in zip(*table_columns(table, columns)):
+            values = list(row)
+            for i, cell in enumerate(cells):
+                if cell is not None and values[i] is not None and not isinstance(values[i], str):
+                    cell.value = values[i]
+                    values[i] = cell
+            ws.append(values)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class CSVResultWriter(ResultWriter):
+
+    """ Запись в папку path в CSV-файлы <название таблицы>.csv (строки дописываются в конец файла). При append=True существующие
+    файлы не перезаписываются. Если задана колонка key_column, она записывается первой во все таблицы """
+
+    def __init__(self, path, append=False, key_column=None):
+        ResultWriter.__init__(self, path)
+        os.makedirs(path, exist_ok=True)
+        self.columns = {name: ([key_column] if key_column is not None else []) + columns for name, sheet, columns in result_tables}
+        for name in self.columns.keys():
+            file = os.path.join(path, name + '.csv')
+            if not (append and os.path.isfile(file)):
+                pd.DataFrame(columns=self.columns[name]).to_csv(file, index=False)
+
+    def append(self, name, table):
+        table = table.reindex(columns=self.columns[name])
+        table.to_csv(os.path.join(self.path, name + '.csv'), mode='a', header=False, index=False)
+
+
+class ParquetResultWriter(ResultWriter):
+
+    """ Запись в папку path в Parquet-файлы <название таблицы>.parquet (по одной группе строк на каждую запись). Модуль pyarrow
+    импортируется только при создании объекта """
+
+    def __init__(self, path):
+
+        ResultWriter.__init__(self, path)
+
+        import pyarrow
+        import pyarrow.parquet
+
+        self.pyarrow = pyarrow
+        os.makedirs(path, exist_ok=True)
+
+        # Схема таблиц фиксируется заранее, чтобы все группы строк были одного типа (даже если в одной из них колонка пустая):
+        self.schemas, self.writers = {}, {}
+        for name, sheet, columns in result_tables:
+            fields = []
+            for column in columns:
+                if column in date_cols:
+                    fields.append((column, pyarrow.timestamp('s')))
+                elif column == 'isin':
+                    fields.append((column, pyarrow.string()))
+                else:
+                    fields.append((column, pyarrow.float64()))
+            self.schemas[name] = pyarrow.schema(fields)
+            self.writers[name] = pyarrow.parquet.ParquetWriter(os.path.join(path, name + '.parquet'), self.schemas[name])
+
+    def append(self, name, table):
+        schema = self.schemas[name]
+        table = table.reindex(columns=schema.names)
+        for column in schema.names:
+            if column in date_cols:
+                table[column] = pd.to_datetime(table[column])
+            elif column != 'isin':
+                table[column] = pd.to_numeric(table[column], errors='coerce')
+        self.writers[name].write_table(self.pyarrow.Table.from_pandas(table, schema=schema, preserve_index=False))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+class ResultCollector(object):
+
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Накопление таблиц результатов расчетов по выпускам облигаций
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры:
+
+        Опциональные:
+            1. writer             — объект потоковой записи (см. result_writer), в который сразу передаются таблицы каждого выпуска
+            2. checkpoint_path    — папка, в CSV-файлы которой сразу дописываются таблицы каждого выпуска. Если папка уже содержит
+                                    результаты прерванного запуска, то они загружаются, а ключи рассчитанных расчетов попадают в completed
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Таблицы выпусков складываются в списки и объединяются (pd.concat) один раз при первом обращении к методу table после добавления
+    новых выпусков, поэтому затраты на накопление растут линейно с количеством выпусков. Таблица rslt каждого выпуска записывается
+    последней: расчет считается выполненным, только если все его таблицы были записаны
+
+    Расчет идентифицируется ключом (см. функцию calculation_key), а не ISIN, поэтому несколько расчетов одного выпуска с разными
+    параметрами (например, разными Z-спредами или датами оценки) выполняются и сохраняются отдельно. В CSV-файлах checkpoint_path ключ
+    хранится в колонке calculationKey
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    def __init__(self, writer=None, checkpoint_path=None):
+
+        self.writer = writer
+        self.parts = {name: [] for name, sheet, columns in result_tables}
+        self.cache = {}
+        self.completed = set()  # ключи выполненных расчетов
+        self.checkpoint = None
+
+        if checkpoint_path is not None:
+            restored = self.restore(checkpoint_path)
+            # Строки невыполненных расчетов удаляются и из CSV-файлов, иначе при повторном расчете они окажутся в файлах дважды:
+            self.rewrite(checkpoint_path, restored)
+            self.checkpoint = CSVResultWriter(checkpoint_path, append=True, key_column=checkpoint_key)
+            for name, table in restored.items():
+                self.store(name, table.drop(columns=checkpoint_key))
+            if 'rslt' in restored.keys():
+                self.completed = set(restored['rslt'][checkpoint_key].values)
+
+    @staticmethod
+    def restore(path):
+
+        """ Загрузка таблиц из папки checkpoint_path. Строки расчетов, для которых не была записана таблица rslt (или все строки, если
+        файла rslt.csv нет или в файлах нет колонки calculationKey), отбрасываются """
+
+        tables = {}
+        for name, sheet, columns in result_tables:
+            file = os.path.join(path, name + '.csv')
+            if os.path.isfile(file):
+                tables[name] = pd.read_csv(file, parse_dates=[c for c in columns if c in date_cols], dtype={checkpoint_key: str})
+
+        completed = []
+        if 'rslt' in tables.keys() and checkpoint_key in tables['rslt'].columns:
+            completed = tables['rslt'][checkpoint_key].values
+        for name in tables.keys():
+            if checkpoint_key not in tables[name].columns:
+                tables[name] = tables[name].assign(**{checkpoint_key: None})
+            tables[name] = tables[name][tables[name][checkpoint_key].isin(completed)].reset_index(drop=True)
+
+        return {name: table for name, table in tables.items() if not table.empty}
+
+    @staticmethod
+    def rewrite(path, tables):
+
+        """ Перезапись CSV-файлов папки checkpoint_path таблицами tables (строками выполненных расчетов). Каждый файл сначала
+        записывается во временный файл, который затем заменяет исходный, поэтому прерывание перезаписи не повреждает контрольную точку """
+
+        for name, sheet, columns in result_tables:
+            file = os.path.join(path, name + '.csv')
+            if os.path.isfile(file):
+                columns = [checkpoint_key] + columns
+                table = tables[name] if name in tables.keys() else pd.DataFrame(columns=columns)
+                table.reindex(columns=columns).to_csv(file + '.tmp', index=False)
+                os.replace(file + '.tmp', file)
+
+    def store(self, name, table):
+        if table is None or table.empty:
+            return
+        self.parts[name].append(table)
+        self.cache.pop(name, None)
+        if self.writer is not None:
+            self.writer.write(name, table)
+
+    def add(self, tables, key):
+
+        """ Добавление таблиц одного расчета с ключом key (словарь: название таблицы -> pandas.DataFrame) """
+
+        for name in sorted(tables.keys(), key=lambda n: n == 'rslt'):
+            self.store(name, tables[name])
+            if self.checkpoint is not None and tables[name] is not None and not tables[name].empty:
+                self.checkpoint.write(name, tables[name].assign(**{checkpoint_key: key}))
+
+        if tables.get('rslt') is not None and not tables['rslt'].empty:
+            self.completed.add(key)
+
+    def table(self, name):
+
+        """ Объединенная по всем выпускам таблица name """
+
+        if name not in self.cache.keys():
+            parts = self.parts[name]
+            self.cache[name] = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame([])
+        return self.cache[name]
+
+
+def result_writer(path, output_format='xlsx'):
+
+    """ Объект потоковой записи результатов расчетов: xlsx — Excel-файл path (по шаблону TEMPLATE.xlsx), csv/parquet — папка path """
+
+    if output_format == 'xlsx':
+        return ExcelResultWriter(path)
+    if output_format == 'csv':
+        return CSVResultWriter(path)
+    if output_format == 'parquet':
+        return ParquetResultWriter(path)
+
+    raise Exception(EXCEPTIONS._20)
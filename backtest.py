@@ -0,0 +1,206 @@
+# -*- coding: utf8 -*-
+
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+# ----- КОНВЕНЦИЯ ДЛЯ ИПОТЕЧНЫХ ЦЕННЫХ БУМАГ: ИСТОРИЧЕСКИЙ РАСЧЕТ НА ДИАПАЗОНЕ ДАТ ОЦЕНКИ ------------------------------------------------ #
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+
+import os
+import sys
+import copy
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from auxiliary import *
+
+# Функция backtest рассчитывает один выпуск ИЦБ ДОМ.РФ на каждую Дату оценки из заданного диапазона и возвращает временной ряд ценовых
+# метрик. На время расчета обращения к API в модулях convention и pool_model подменяются на кэш DataCache, поэтому данные по выпуску
+# загружаются один раз, срез ипотечного покрытия — один раз на каждую дату среза (poolReportDate), данные модели макроэкономики — один раз
+# на каждую Опорную дату модели Ключевой ставки (keyRateModelDate). Модель Ключевой ставки и ставки рефинансирования ипотеки также
+# рассчитывается один раз для всех Дат оценки с одинаковой Опорной датой модели Ключевой ставки и одинаковым диапазоном месяцев.
+#
+# Запуск из корня репозитория:
+#       python backtest.py --bond RU000A1074A5 --z-spread 100 --start 2024-01-01 --end 2024-03-31 --output backtest.csv
+
+
+# ----- СОСТАВ ВРЕМЕННОГО РЯДА ----------------------------------------------------------------------------------------------------------- #
+backtest_columns = ['pricingDate', 'poolReportDate', 'keyRateModelDate', 'zcycDateTime', 'dirtyPrice', 'dirtyPriceRub', 'cleanPrice',
+                    'cleanPriceRub', 'accruedCouponInterest', 'accruedCouponInterestRub', 'ytm', 'zSpread', 'gSpread',
+                    'requiredKeyRatePremium', 'durationMacaulay', 'durationModified', 'modelCPR', 'error']
+
+
+# ----- ОБЩАЯ МОДЕЛЬ КЛЮЧЕВОЙ СТАВКИ ----------------------------------------------------------------------------------------------------- #
+class SharedMacroModel(object):
+
+    """ Расчет Модельной траектории Ключевой ставки и ставки рефинансирования ипотеки (функция refinancingRatesModel) один раз для всех
+    вызовов с одинаковой Опорной датой модели Ключевой ставки, диапазоном месяцев и пользовательской траекторией Ключевой ставки. Данные
+    модели макроэкономики загружаются по Опорной дате, поэтому key_rate_model_data в ключ не входит. Каждый вызов получает собственную
+    копию результата """
+
+    def __init__(self, function):
+        self.function = function
+        self.models = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, key_rate_model_date, key_rate_model_data, start_month, stop_month, key_rate_forecast=None, ifrs=False,
+                 interactive_graph=True):
+
+        forecast = None if key_rate_forecast is None else pd.DataFrame(key_rate_forecast).to_json(date_format='iso')
+        key = (str(key_rate_model_date), str(start_month), str(stop_month), forecast, bool(ifrs), bool(interactive_graph))
+
+        if key in self.models:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.models[key] = self.function(key_rate_model_date=key_rate_model_date,
+                                             key_rate_model_data=key_rate_model_data,
+                                             start_month=start_month,
+                                             stop_month=stop_month,
+                                             key_rate_forecast=key_rate_forecast,
+                                             ifrs=ifrs,
+                                             interactive_graph=interactive_graph)
+
+        return copy.deepcopy(self.models[key])
+
+    def statistics(self):
+        return {'entries': len(self.models), 'hits': self.hits, 'misses': self.misses}
+
+
+# ----- ИСТОРИЧЕСКИЙ РАСЧЕТ -------------------------------------------------------------------------------------------------------------- #
+def pricing_dates(start_date=None, end_date=None, frequency='B', dates=None):
+
+    """ Даты оценки исторического расчета: dates (если заданы) или диапазон от start_date до end_date (включительно) с шагом frequency
+    (в формате pandas.date_range: 'B' — рабочие дни, 'D' — календарные дни, 'W-FRI' — пятницы, 'BM' — последние рабочие дни месяцев) """
+
+    if dates is not None:
+        result = [np.datetime64(pd.Timestamp(date).date(), 'D') for date in dates]
+    else:
+        if start_date is None or end_date is None:
+            raise Exception(EXCEPTIONS._23)
+        result = list(pd.date_range(start_date, end_date, freq=frequency).values.astype(d_type))
+
+    if len(result) == 0:
+        raise Exception(EXCEPTIONS._23)
+
+    return sorted(set(result))
+
+
+def backtest(input, start_date=None, end_date=None, frequency='B', dates=None, errors='collect'):
+
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Исторический расчет выпуска ИЦБ ДОМ.РФ на диапазоне Дат оценки
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры функции:
+
+        Обязательные:
+            1. input        — параметры оценки в формате Convention(input). Параметры pricingDate и zcycDateTime задаются для каждой
+                              Даты оценки (значения из input не используются). Если параметр usePricingDateDataOnly не задан, расчет
+                              проводится только на данных, доступных на каждую Дату оценки (usePricingDateDataOnly = True)
+
+        Опциональные:
+            1. start_date   — первая Дата оценки диапазона
+            2. end_date     — последняя Дата оценки диапазона (включительно)
+            3. frequency    — шаг диапазона в формате pandas.date_range, по умолчанию 'B' (рабочие дни)
+            4. dates        — список Дат оценки (если задан, то start_date, end_date и frequency не используются)
+            5. errors       — 'collect': ошибка расчета на Дату оценки записывается в колонку error, расчет продолжается на следующих
+                              Датах оценки; 'raise': ошибка прерывает расчет. По умолчанию 'collect'
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Результат — pandas.DataFrame, одна строка на каждую Дату оценки (колонки backtest_columns). Атрибут attrs['cache'] результата содержит
+    статистику кэша ответов DataSource и модели Ключевой ставки (количество загрузок и повторных использований).
+
+    Расчеты на разные Даты оценки проводятся последовательно в одном процессе. На время расчета обращения к API в модулях convention и
+    pool_model подменяются на кэш DataCache без ограничения размера и времени хранения, а функция refinancingRatesModel в модуле
+    pool_model — на SharedMacroModel. После расчета (в том числе при ошибке) исходные функции восстанавливаются.
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    import convention
+    import pool_model
+    from convention import Convention
+
+    dates = pricing_dates(start_date, end_date, frequency, dates)
+
+    original = convention.get, pool_model.get, pool_model.refinancingRatesModel
+    data_cache = DataCache(ttl=None, max_entries=None, source=convention.get)
+    macro_model = SharedMacroModel(pool_model.refinancingRatesModel)
+    convention.get, pool_model.get, pool_model.refinancingRatesModel = data_cache.get, data_cache.get, macro_model
+
+    rows = []
+    try:
+        for date in dates:
+
+            parameters = dict(input)
+            parameters['pricingDate'] = str(date)
+            parameters['zcycDateTime'] = None
+            parameters['progressBar'] = False
+            parameters['connectionId'] = None
+            parameters['outputProfile'] = OUTPUT_PROFILE.MINIMAL
+            parameters['riskMetrics'] = False
+            if parameters.get('usePricingDateDataOnly') is None:
+                parameters['usePricingDateDataOnly'] = True
+
+            row = dict.fromkeys(backtest_columns)
+            row['pricingDate'] = date
+            try:
+                res = Convention(parameters).calculate()
+            except Exception as e:
+                if errors == 'raise':
+                    raise
+                row['error'] = str(e)
+                rows.append(row)
+                continue
+
+            for column in backtest_columns:
+                if column in res['pricingResult'].keys():
+                    row[column] = res['pricingResult'][column]
+            row['zcycDateTime'] = res['pricingParameters']['zcycDateTime']
+            row['keyRateModelDate'] = res['calculationParameters']['keyRateModelDate']
+            row['modelCPR'] = res['calculationParameters']['modelCPR']
+            if res['poolStatistics'] is not None:
+                row['poolReportDate'] = res['poolStatistics']['reportDate']
+            rows.append(row)
+
+    finally:
+        convention.get, pool_model.get, pool_model.refinancingRatesModel = original
+
+    result = pd.DataFrame(rows, columns=backtest_columns)
+    for column in ['pricingDate', 'poolReportDate', 'keyRateModelDate']:
+        result[column] = pd.to_datetime(result[column])
+    result.attrs['cache'] = {'dataSource': data_cache.statistics(), 'macroModel': macro_model.statistics()}
+
+    return result
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Исторический расчет выпуска ИЦБ ДОМ.РФ на диапазоне Дат оценки')
+    parser.add_argument('--bond', required=True, help='ISIN, регистрационный номер или тикер выпуска ИЦБ ДОМ.РФ')
+    parser.add_argument('--start', required=True, help='первая Дата оценки диапазона')
+    parser.add_argument('--end', required=True, help='последняя Дата оценки диапазона (включительно)')
+    parser.add_argument('--frequency', default='B', help="шаг диапазона в формате pandas.date_range, по умолчанию 'B' (рабочие дни)")
+    parser.add_argument('--z-spread', type=float, default=None)
+    parser.add_argument('--g-spread', type=float, default=None)
+    parser.add_argument('--dirty-price', type=float, default=None)
+    parser.add_argument('--clean-price', type=float, default=None)
+    parser.add_argument('--key-rate-premium', type=float, default=None, help='требуемая надбавка к Ключевой ставке, б.п.')
+    parser.add_argument('--cpr', type=float, default=None, help='фиксированное значение CPR, % годовых')
+    parser.add_argument('--output', default=None, help='CSV-файл для сохранения временного ряда')
+    args = parser.parse_args()
+
+    series = backtest({'bondID': args.bond, 'zSpread': args.z_spread, 'gSpread': args.g_spread, 'dirtyPrice': args.dirty_price,
+                       'cleanPrice': args.clean_price, 'requiredKeyRatePremium': args.key_rate_premium, 'cpr': args.cpr},
+                      args.start, args.end, args.frequency)
+
+    print(series.attrs['cache'])
+    if args.output is not None:
+        series.to_csv(args.output, index=False)
+    else:
+        print(series.to_string(index=False))
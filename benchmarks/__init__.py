@@ -0,0 +1,14 @@
+# -*- coding: utf8 -*-
+
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+# ----- КОНВЕНЦИЯ ДЛЯ ИПОТЕЧНЫХ ЦЕННЫХ БУМАГ: БЕНЧМАРКИ ---------------------------------------------------------------------------------- #
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+
+# Пакет benchmarks позволяет замерять время и память расчета без обращения к API:
+#       · synthetic.py         — генератор синтетических данных (poolData, dataForCalculation, параметры КБД, данные модели макроэкономики)
+#       · run_benchmarks.py    — запуск замеров loansCashflowModel, refinancingRatesModel, mbsCashflowModel и mbsPricing
+#       · datasource_server.py — локальный HTTP-сервер, отвечающий на запросы методов DataSource данными из файлов снимков
+#
+# Запуск из корня репозитория:
+#       python -m benchmarks.run_benchmarks --sizes 1000 10000 100000
+#       python -m benchmarks.datasource_server --snapshots snapshots --synthetic 10000 --latency 0.05
@@ -0,0 +1,215 @@
+# -*- coding: utf8 -*-
+
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+# ----- КОНВЕНЦИЯ ДЛЯ ИПОТЕЧНЫХ ЦЕННЫХ БУМАГ: ЛОКАЛЬНЫЙ СЕРВЕР DATASOURCE ДЛЯ НАГРУЗОЧНОГО ТЕСТИРОВАНИЯ --------------------------------- #
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auxiliary import *
+
+# Локальный сервер отвечает на запросы четырех методов DataSource данными из файлов снимков (snapshot). Структура папки снимков:
+#       <папка>/GetDataForCalculation/<bondID>.json
+#       <папка>/GetZCYCCoefficients/<zcycDate>.json     (или <дата zcycDate>.json)
+#       <папка>/GetPoolsData/<bondID>_<date>.json        (или <bondID>.json)
+#       <папка>/GetMacroData/<date>.json
+# Если файла для конкретного ключа нет, используется файл default.json в папке метода. Запрошенные файлы кэшируются в памяти
+#
+# Для того, чтобы расчет обращался к локальному серверу, необходимо задать адрес сервера (см. auxiliary.API.configure или переменные
+# окружения CONVENTION_API_SERVER и CONVENTION_API_PORT)
+
+# Ключи поиска файла снимка для каждого метода (в порядке приоритета):
+SNAPSHOT_KEYS = {
+    'GetDataForCalculation': lambda q: [q.get('bondID')],
+    'GetZCYCCoefficients': lambda q: [q.get('zcycDate'), (q.get('zcycDate') or '')[:10]],
+    'GetPoolsData': lambda q: ['{}_{}'.format(q.get('bondID'), q.get('date')), q.get('bondID')],
+    'GetMacroData': lambda q: [q.get('date')],
+}
+
+
+def snapshot_name(key):
+    """ Имя файла снимка для ключа (символы, недопустимые в имени файла, заменяются на _) """
+    return re.sub(r'[^A-Za-z0-9._-]', '_', str(key)) + '.json'
+
+
+def write_snapshot(path, method, key, payload):
+    """ Сохранение ответа метода DataSource в папку снимков (key=None — файл по умолчанию default.json) """
+    folder = os.path.join(path, method)
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, snapshot_name('default' if key is None else key)), 'w', encoding='utf8') as f:
+        json.dump(payload, f, ensure_ascii=False)
+
+
+def write_synthetic_snapshots(path, data_source):
+    """ Сохранение синтетических данных (benchmarks.synthetic.SyntheticDataSource) в папку снимков. Параметры КБД и данные модели
+        макроэкономики сохраняются как файлы по умолчанию """
+    write_snapshot(path, 'GetDataForCalculation', data_source.bondID, data_source.dataForCalculation)
+    write_snapshot(path, 'GetPoolsData', data_source.bondID,
+                   {'pools': [{'reportDate': str(data_source.reportDate), 'data': data_source.poolData}]})
+    write_snapshot(path, 'GetZCYCCoefficients', None, data_source.zcycParameters)
+    write_snapshot(path, 'GetMacroData', None, data_source.keyRateModelData)
+
+
+class SnapshotHandler(BaseHTTPRequestHandler):
+
+    """ Обработчик запросов к локальному серверу DataSource """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+
+        split = urlsplit(self.path)
+        method = split.path.rstrip('/').split('/')[-1]
+        query = {key: values[0] for key, values in parse_qs(split.query).items()}
+
+        # Статистика количества запросов по методам:
+        if method == 'stats':
+            return self.respond(200, json.dumps(self.server.statistics()).encode('utf8'))
+
+        self.server.count(method)
+        self.server.sleep()
+
+        if method not in SNAPSHOT_KEYS.keys():
+            return self.respond(404, json.dumps({'error': 'unknown method ' + method}).encode('utf8'))
+
+        body = self.server.snapshot(method, SNAPSHOT_KEYS[method](query))
+        if body is None:
+            return self.respond(404, json.dumps({'error': 'no snapshot for ' + self.path}).encode('utf8'))
+
+        self.respond(200, body)
+
+    def respond(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class DataSourceServer(ThreadingHTTPServer):
+
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Локальный HTTP-сервер, повторяющий методы DataSource (GetDataForCalculation, GetZCYCCoefficients, GetPoolsData, GetMacroData)
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры:
+
+        Обязательные:
+            1. snapshot_path  — путь к папке снимков
+
+        Опциональные:
+            1. host           — адрес, на котором запускается сервер, по умолчанию 127.0.0.1
+            2. port           — порт сервера (0 — любой свободный порт), по умолчанию 8193
+            3. latency        — задержка ответа на каждый запрос, секунды
+            4. jitter         — максимальная случайная добавка к задержке ответа, секунды
+            5. verbose        — True/False: выводить в консоль журнал запросов
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    daemon_threads = True
+
+    def __init__(self, snapshot_path, host='127.0.0.1', port=8193, latency=0.0, jitter=0.0, verbose=False):
+
+        ThreadingHTTPServer.__init__(self, (host, port), SnapshotHandler)
+        self.snapshotPath = snapshot_path
+        self.latency = float(latency)
+        self.jitter = float(jitter)
+        self.verbose = verbose
+        self.requests = Counter()
+        self.cache = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{}'.format(self.server_address[0]), self.server_address[1]
+
+    def count(self, method):
+        with self.lock:
+            self.requests[method] += 1
+
+    def statistics(self):
+        with self.lock:
+            return dict(self.requests)
+
+    def sleep(self):
+        delay = self.latency + (random.uniform(0.0, self.jitter) if self.jitter > 0.0 else 0.0)
+        if delay > 0.0:
+            time.sleep(delay)
+
+    def snapshot(self, method, keys):
+        """ Содержимое первого найденного файла снимка по ключам keys (или default.json) """
+        for key in [k for k in keys if k] + ['default']:
+            file = os.path.join(self.snapshotPath, method, snapshot_name(key))
+            with self.lock:
+                if file in self.cache.keys():
+                    return self.cache[file]
+            if os.path.isfile(file):
+                with open(file, 'rb') as f:
+                    body = f.read()
+                with self.lock:
+                    self.cache[file] = body
+                return body
+        return None
+
+    def start(self, configure_api=True):
+        """ Запуск сервера в фоновом потоке. При configure_api=True методы auxiliary.API перенаправляются на локальный сервер """
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        if configure_api:
+            API.configure(*self.url)
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Локальный сервер DataSource, отвечающий данными из файлов снимков')
+    parser.add_argument('--snapshots', required=True, help='путь к папке снимков')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8193)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, секунды')
+    parser.add_argument('--jitter', type=float, default=0.0, help='максимальная случайная добавка к задержке, секунды')
+    parser.add_argument('--synthetic', type=int, nargs='+', default=None,
+                        help='перед запуском сохранить в папку снимков синтетические выпуски заданных размеров (для всех сочетаний '
+                             'типов купона и ипотечного покрытия)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if args.synthetic is not None:
+        from benchmarks.synthetic import SyntheticDataSource
+        from benchmarks.run_benchmarks import COMBINATIONS
+        for loans_number in args.synthetic:
+            for coupon_type, pool_type in COMBINATIONS:
+                data_source = SyntheticDataSource(loans_number, coupon_type, pool_type, seed=args.seed)
+                write_synthetic_snapshots(args.snapshots, data_source)
+                print('Сохранен синтетический выпуск ' + data_source.bondID, flush=True)
+
+    server = DataSourceServer(args.snapshots, args.host, args.port, args.latency, args.jitter, args.verbose)
+    print('DataSource: {}:{} (CONVENTION_API_SERVER={} CONVENTION_API_PORT={})'.format(*server.url, *server.url), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
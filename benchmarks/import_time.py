@@ -0,0 +1,77 @@
+# -*- coding: utf8 -*-
+
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+# ----- КОНВЕНЦИЯ ДЛЯ ИПОТЕЧНЫХ ЦЕННЫХ БУМАГ: ЗАМЕР ВРЕМЕНИ ИМПОРТА МОДЕЛИ --------------------------------------------------------------- #
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+
+# Скрипт замеряет время импорта модуля convention в новом процессе интерпретатора (так, как его оплачивает каждый запуск run.py,
+# короткоживущий процесс или обработчик без постоянного процесса) и проверяет, какие тяжелые необязательные зависимости загружаются при
+# импорте. Для сравнения замеряется импорт с предварительной загрузкой этих зависимостей (так модель импортировалась до перевода
+# requests, scipy.optimize, openpyxl и tqdm на загрузку при первом использовании).
+#
+# Запуск из корня репозитория:
+#       python -m benchmarks.import_time --repeats 10
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Необязательные зависимости, которые загружаются только при первом использовании:
+OPTIONAL_MODULES = ['requests', 'scipy.optimize', 'openpyxl', 'tqdm']
+
+# Сценарии импорта: название сценария -> модули, импортируемые до convention:
+SCENARIOS = {'lazy': [], 'eager': OPTIONAL_MODULES}
+
+SCRIPT = '''
+import sys, time, json
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+for name in {preload!r}:
+    __import__(name)
+import convention
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {optional!r} if name in sys.modules]}}))
+'''
+
+
+def import_seconds(preload=()):
+    """ Время импорта convention (вместе с модулями preload) в новом процессе интерпретатора и список загруженных необязательных
+    зависимостей """
+    script = SCRIPT.format(root=ROOT, preload=list(preload), optional=OPTIONAL_MODULES)
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def importBenchmark(repeats=10):
+
+    """ Замер времени импорта convention по сценариям SCENARIOS. Для каждого сценария возвращается медианное и минимальное время импорта
+    (миллисекунды) по repeats запускам и список необязательных зависимостей, загруженных при импорте """
+
+    rows = []
+    for scenario, preload in SCENARIOS.items():
+        # Первый запуск прогревает файловый кэш и __pycache__ и в замер не входит:
+        import_seconds(preload)
+        runs = [import_seconds(preload) for i in range(repeats)]
+        milliseconds = np.array([run['seconds'] for run in runs]) * 1000.0
+        rows.append({'scenario': scenario,
+                     'medianMs': np.round(np.median(milliseconds), 1),
+                     'minMs': np.round(milliseconds.min(), 1),
+                     'loaded': ', '.join(runs[-1]['loaded']) or '-'})
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Замер времени импорта модели Конвенции в новом процессе интерпретатора')
+    parser.add_argument('--repeats', type=int, default=10, help='количество запусков на каждый сценарий')
+    args = parser.parse_args()
+
+    table = importBenchmark(args.repeats)
+    print(table.to_string(index=False))
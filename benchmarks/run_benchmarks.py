@@ -0,0 +1,225 @@
+# -*- coding: utf8 -*-
+
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+# ----- КОНВЕНЦИЯ ДЛЯ ИПОТЕЧНЫХ ЦЕННЫХ БУМАГ: ЗАПУСК БЕНЧМАРКОВ НА СИНТЕТИЧЕСКИХ ДАННЫХ -------------------------------------------------- #
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from auxiliary import *
+from benchmarks.synthetic import *
+
+import warnings
+
+warnings.filterwarnings('ignore')
+np.seterr(all='ignore')
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Размеры ипотечных покрытий (количество кредитов) по умолчанию:
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+# Замеряемые этапы расчета (названия этапов StageTimer):
+STAGES = ['loansCashflowModel', 'refinancingRatesModel', 'mbsCashflowModel', 'mbsPricing']
+
+# Все сочетания типа купонной выплаты и типа ипотечного покрытия:
+COMBINATIONS = [(c, p) for c in [COUPON_TYPE.FXD, COUPON_TYPE.CHG, COUPON_TYPE.FLT] for p in [POOL_TYPE.FXD, POOL_TYPE.FLT, POOL_TYPE.MIX]]
+
+
+def peak_rss_mb():
+    """ Пиковый объем резидентной памяти текущего процесса в мегабайтах (None, если модуль resource недоступен) """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux ru_maxrss возвращается в килобайтах, в macOS — в байтах:
+    return np.round(peak / 1024.0 ** (2 if sys.platform == 'darwin' else 1), 1)
+
+
+def stage_seconds(timings, name):
+    """ Суммарное время всех этапов с названием name в дереве замеров StageTimer (None, если этап не запускался) """
+    seconds = None
+    if timings['stage'] == name and timings['seconds'] is not None:
+        seconds = timings['seconds']
+    for stage in timings['stages']:
+        child = stage_seconds(stage, name)
+        if child is not None:
+            seconds = child if seconds is None else seconds + child
+    return seconds
+
+
+@contextlib.contextmanager
+def offline(data_source):
+    """ Подмена обращений к API в модулях convention и pool_model на синтетический источник данных на время расчета """
+
+    import convention
+    import pool_model
+
+    original = convention.get, pool_model.get
+    convention.get, pool_model.get = data_source.get, data_source.get
+    try:
+        yield data_source
+    finally:
+        convention.get, pool_model.get = original
+
+
+@contextlib.contextmanager
+def local_server(data_source, latency=0.0):
+    """ Запуск локального сервера DataSource со снимком синтетических данных и перенаправление на него методов API """
+
+    from benchmarks.datasource_server import DataSourceServer, write_synthetic_snapshots
+
+    with tempfile.TemporaryDirectory() as path:
+        write_synthetic_snapshots(path, data_source)
+        server = DataSourceServer(path, port=0, latency=latency)
+        server_address = API.SERVER, API.PORT
+        server.start()
+        try:
+            yield data_source
+        finally:
+            server.stop()
+            API.configure(*server_address)
+
+
+def benchmarkCase(coupon_type, pool_type, loans_number, seed=0, latency=None):
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Замер одного расчета Конвенции на синтетическом выпуске ИЦБ ДОМ.РФ
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры функции:
+
+        Обязательные:
+            1. coupon_type    — тип расчета купонной выплаты (см. auxiliary.COUPON_TYPE)
+            2. pool_type      — тип ипотечного покрытия (см. auxiliary.POOL_TYPE)
+            3. loans_number   — количество кредитов в ипотечном покрытии
+
+        Опциональные:
+            1. seed           — зерно генератора синтетических данных
+            2. latency        — None: данные передаются в модель напрямую; число: данные запрашиваются по HTTP у локального сервера
+                                DataSource (benchmarks/datasource_server.py) с заданной задержкой ответа в секундах
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Время этапов берется из замеров StageTimer (calculationOutput['timings']), время генерации синтетических данных в замеры не входит.
+    Пиковая память — максимальный объем резидентной памяти процесса (включая синтетические данные), поэтому каждый замер необходимо
+    запускать в отдельном процессе (см. runBenchmarks)
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    from convention import Convention
+
+    result = {'couponType': COUPON_TYPE_NAMES[coupon_type], 'poolType': POOL_TYPE_NAMES[pool_type], 'loans': int(loans_number),
+              'seed': seed, 'error': None}
+
+    data_source = SyntheticDataSource(loans_number, coupon_type, pool_type, seed=seed)
+    result['dataRSSMB'] = peak_rss_mb()
+
+    try:
+        with offline(data_source) if latency is None else local_server(data_source, latency):
+            start = time.perf_counter()
+            output = Convention(data_source.pricingParameters()).calculate()
+            result['totalSeconds'] = np.round(time.perf_counter() - start, 6)
+        for stage in STAGES:
+            result[stage] = stage_seconds(output['timings'], stage)
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+
+    result['peakRSSMB'] = peak_rss_mb()
+
+    return result
+
+
+def benchmark_worker(queue, *args):
+    """ Запуск замера в дочернем процессе с передачей результата через очередь """
+    queue.put(benchmarkCase(*args))
+
+
+def runBenchmarks(sizes=DEFAULT_SIZES, combinations=COMBINATIONS, seed=0, isolate=True, latency=None):
+    """ Запуск замеров для всех заданных размеров ипотечного покрытия и сочетаний типов купона и ипотечного покрытия. При isolate=True
+        каждый замер выполняется в отдельном процессе (чтобы пиковая память одного замера не влияла на следующие) """
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+
+    for loans_number in sizes:
+        for coupon_type, pool_type in combinations:
+
+            if isolate:
+                queue = context.Queue()
+                arguments = (queue, coupon_type, pool_type, loans_number, seed, latency)
+                process = context.Process(target=benchmark_worker, args=arguments)
+                process.start()
+                result = None
+                while result is None and (process.is_alive() or not queue.empty()):
+                    try:
+                        result = queue.get(timeout=1.0)
+                    except Exception:
+                        pass
+                process.join()
+                if result is None:
+                    result = {'couponType': COUPON_TYPE_NAMES[coupon_type], 'poolType': POOL_TYPE_NAMES[pool_type],
+                              'loans': int(loans_number), 'seed': seed, 'error': 'exit code {}'.format(process.exitcode)}
+            else:
+                result = benchmarkCase(coupon_type, pool_type, loans_number, seed, latency)
+
+            results.append(result)
+            print(format_result(result), flush=True)
+
+    columns = ['couponType', 'poolType', 'loans', 'seed', 'totalSeconds'] + STAGES + ['dataRSSMB', 'peakRSSMB', 'error']
+    return pd.DataFrame(results).reindex(columns=columns)
+
+
+def format_result(result):
+    """ Строка с результатом одного замера для вывода в консоль """
+    name = '{}/{} {:>8}'.format(result['couponType'], result['poolType'], result['loans'])
+    if result['error'] is not None:
+        return name + '  ОШИБКА: ' + result['error']
+    stages = '  '.join('{}={:.3f}s'.format(s, result[s]) for s in STAGES if result.get(s) is not None)
+    return name + '  total={:.3f}s  {}  peakRSS={}MB'.format(result['totalSeconds'], stages, result['peakRSSMB'])
+
+
+def parse_combinations(values):
+    """ Разбор сочетаний вида FXD/MIX (тип купонной выплаты / тип ипотечного покрытия) """
+    coupon_types = {name: value for value, name in COUPON_TYPE_NAMES.items()}
+    pool_types = {name: value for value, name in POOL_TYPE_NAMES.items()}
+    combinations = []
+    for value in values:
+        coupon_name, pool_name = value.upper().split('/')
+        combinations.append((coupon_types[coupon_name], pool_types[pool_name]))
+    return combinations
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Замеры времени и памяти расчета Конвенции на синтетических данных')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='количество кредитов в ипотечном покрытии')
+    parser.add_argument('--combinations', nargs='+', default=None, help='сочетания типов купона и ипотечного покрытия, например FXD/FXD')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генератора синтетических данных')
+    parser.add_argument('--no-isolate', action='store_true', help='запускать замеры в текущем процессе')
+    parser.add_argument('--http-latency', type=float, default=None,
+                        help='запрашивать данные по HTTP у локального сервера DataSource с заданной задержкой ответа, секунды')
+    parser.add_argument('--output', default=None, help='путь для сохранения результата (.csv или .json)')
+    args = parser.parse_args()
+
+    combinations = COMBINATIONS if args.combinations is None else parse_combinations(args.combinations)
+    table = runBenchmarks(args.sizes, combinations, args.seed, not args.no_isolate, args.http_latency)
+
+    if args.output is not None:
+        if args.output.endswith('.json'):
+            table.to_json(args.output, orient='records', force_ascii=False, indent=2)
+        else:
+            table.to_csv(args.output, index=False)
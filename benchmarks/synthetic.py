@@ -0,0 +1,401 @@
+# -*- coding: utf8 -*-
+
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+# ----- КОНВЕНЦИЯ ДЛЯ ИПОТЕЧНЫХ ЦЕННЫХ БУМАГ: ГЕНЕРАТОР СИНТЕТИЧЕСКИХ ДАННЫХ ДЛЯ БЕНЧМАРКОВ --------------------------------------------- #
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+
+import json
+import numpy as np
+import pandas as pd
+from urllib.parse import urlsplit, parse_qs
+
+from auxiliary import *
+
+import warnings
+
+warnings.filterwarnings('ignore')
+np.seterr(all='ignore')
+
+# Дата размещения синтетического выпуска по умолчанию (она же Дата оценки и Опорная дата модели Ключевой ставки):
+DEFAULT_ISSUE_DATE = np.datetime64('2024-06-20')
+
+# Номинал одной облигации синтетического выпуска, руб.:
+BOND_PRINCIPAL = 1000.0
+
+# Распределение первоначальных сроков кредитов (годы) и их вероятности:
+LOAN_TERMS = np.array([10, 15, 20, 25, 30])
+LOAN_TERMS_PROBABILITIES = np.array([0.10, 0.20, 0.30, 0.15, 0.25])
+
+# Гос. программы, по которым выдаются субсидируемые кредиты, и вычеты для расчета субсидии по ним (п.п.):
+GOVERN_PROGRAMS = np.array([1, 2, 3, 4, 5])
+GOVERN_PROGRAMS_DEDUCTIONS = np.array([2.5, 3.0, 3.5, 2.0, 4.0])
+
+# Доля кредитов без субсидий и доля частично субсидируемых кредитов среди субсидируемых в смешанном ипотечном покрытии:
+MIX_STANDARD_LOANS_FRACTION = 0.6
+MIX_PARTIAL_SUBSIDY_FRACTION = 0.3
+
+# Допустимые сочетания типа купонной выплаты и параметров оценки:
+COUPON_TYPE_NAMES = {COUPON_TYPE.FXD: 'FXD', COUPON_TYPE.CHG: 'CHG', COUPON_TYPE.FLT: 'FLT'}
+POOL_TYPE_NAMES = {POOL_TYPE.FXD: 'FXD', POOL_TYPE.FLT: 'FLT', POOL_TYPE.MIX: 'MIX'}
+
+
+def date_strings(dates):
+    """ Перевод массива дат numpy в список строк формата YYYY-MM-DD (так даты приходят по API) """
+    return np.datetime_as_string(np.asarray(dates).astype(d_type), unit='D').tolist()
+
+
+def syntheticPoolData(loans_number, report_date, pool_type=POOL_TYPE.FXD, seed=0):
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Генерация синтетических данных по кредитам в ипотечном покрытии (poolData) в формате ответа метода GetPoolsData
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры функции:
+
+        Обязательные:
+            1. loans_number  — количество кредитов в ипотечном покрытии
+            2. report_date   — дата среза ипотечного покрытия
+
+        Опциональные:
+            1. pool_type     — тип ипотечного покрытия (см. auxiliary.POOL_TYPE), по умолчанию POOL_TYPE.FXD
+            2. seed          — зерно генератора случайных чисел (при одинаковом seed результат воспроизводится полностью)
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Распределения параметров кредитов:
+        · выдержка кредита — равномерно от 1 месяца до 8 лет
+        · первоначальный срок кредита — 10/15/20/25/30 лет (см. LOAN_TERMS_PROBABILITIES)
+        · остаток основного долга — логнормальное распределение с медианой около 2.5 млн руб., уменьшенный пропорционально доле
+          прошедшего срока кредита
+        · процентная ставка — нормальное распределение со средним 9.5% годовых для кредитов без субсидий и 5.5% годовых для
+          субсидируемых кредитов
+        · тип платежа — 95% аннуитетных и 5% дифференцированных кредитов
+        · день начала процентного периода — день выдачи кредита
+        · субсидии — отсутствуют (FXD), у всех кредитов на весь остаток (FLT), у части кредитов на весь или на часть остатка (MIX)
+        · остаток основного долга для расчета по требованиям МСФО (currentDebtIFRS) — у 5% кредитов платеж перенесен на следующий
+          месяц (остаток больше текущего на 0.5–2%), у остальных кредитов совпадает с текущим остатком
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    random = np.random.default_rng(seed)
+    report_date = np.datetime64(report_date, 'D')
+    n = int(loans_number)
+
+    # ----- СРОКИ КРЕДИТОВ ----------------------------------------------------------------------------------------------------------- #
+    age_days = random.integers(30, 8 * 365, n)
+    issue_dates = report_date - age_days * day
+    terms = random.choice(LOAN_TERMS, n, p=LOAN_TERMS_PROBABILITIES) * 12
+    issue_months = issue_dates.astype(m_type)
+    issue_days = (issue_dates - issue_months.astype(d_type)) / day
+
+    # Кредиты должны погашаться не раньше, чем через полгода после даты среза:
+    maturity_months = np.maximum(issue_months + terms * month, report_date.astype(m_type) + 6 * month)
+    maturity_dates = maturity_months.astype(d_type) + np.minimum(issue_days, 27).astype(int) * day
+
+    # ----- ОСТАТКИ ОСНОВНОГО ДОЛГА И СТАВКИ ----------------------------------------------------------------------------------------- #
+    passed = np.minimum(age_days / (terms * 30.5), 0.95)
+    current_debts = np.round(random.lognormal(np.log(2.5e6), 0.5, n) * (1.0 - passed ** 1.5), 2)
+    current_debts = np.maximum(current_debts, 10000.0)
+
+    payment_types = (random.random(n) < 0.05).astype(int)
+    start_days = (issue_days + 1).astype(int)
+
+    # ----- СУБСИДИИ ----------------------------------------------------------------------------------------------------------------- #
+    subsidy_coefficients = np.full(n, np.nan)
+    if pool_type == POOL_TYPE.FLT:
+        subsidy_coefficients[:] = 100.0
+    elif pool_type == POOL_TYPE.MIX:
+        subsidized = random.random(n) >= MIX_STANDARD_LOANS_FRACTION
+        partial = subsidized & (random.random(n) < MIX_PARTIAL_SUBSIDY_FRACTION)
+        subsidy_coefficients[subsidized] = 100.0
+        subsidy_coefficients[partial] = np.round(random.uniform(30.0, 90.0, partial.sum()), 2)
+    subsidized = ~np.isnan(subsidy_coefficients)
+
+    programs = random.integers(0, len(GOVERN_PROGRAMS), n)
+    govern_program_types = np.where(subsidized, GOVERN_PROGRAMS[programs], 0)
+    key_rate_deductions = np.where(subsidized, GOVERN_PROGRAMS_DEDUCTIONS[programs], np.nan)
+
+    current_rates = np.where(subsidized, random.normal(5.5, 0.8, n), random.normal(9.5, 2.0, n))
+    current_rates = np.round(np.clip(current_rates, 0.1, 20.0), 2)
+
+    # ----- ОСТАТКИ ДЛЯ РАСЧЕТА ПО ТРЕБОВАНИЯМ МСФО ---------------------------------------------------------------------------------- #
+    transferred = random.random(n) < 0.05
+    current_debts_ifrs = np.round(current_debts * (1.0 + transferred * random.uniform(0.005, 0.02, n)), 2)
+
+    return {
+        'issueDate': date_strings(issue_dates),
+        'currentMaturityDate': date_strings(maturity_dates),
+        'currentDebt': current_debts.tolist(),
+        'currentDebtIFRS': current_debts_ifrs.tolist(),
+        'currentRate': current_rates.tolist(),
+        'paymentType': payment_types.tolist(),
+        'startInterestDay': start_days.tolist(),
+        'governProgramType': [int(g) if s else None for g, s in zip(govern_program_types, subsidized)],
+        'keyRateDeduction': [float(k) if s else None for k, s in zip(key_rate_deductions, subsidized)],
+        'subsidyCoefficient': [float(c) if s else None for c, s in zip(subsidy_coefficients, subsidized)],
+    }
+
+
+def syntheticKeyRateModelData(key_rate_model_date, seed=0):
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Генерация синтетических данных для модели макроэкономики в формате ответа метода GetMacroData
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры функции:
+
+        Обязательные:
+            1. key_rate_model_date   — Опорная дата модели Ключевой ставки
+
+        Опциональные:
+            1. seed                  — зерно генератора случайных чисел
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Формируются:
+        · meetingsCBR                — решения по Ключевой ставке каждые 6 недель за 6 лет до Опорной даты
+        · meetingsCBRForecasts       — прогноз ЦБ РФ на текущий и три следующих года
+        · meetingsCBRSmooth          — сглаженная траектория Ключевой ставки на 11 лет вперед (помесячно)
+        · keyRateSwapForecast        — траектория Ключевой ставки из свопов на 10 лет вперед (помесячно) на дату синтетической КБД
+                                       (Опорную дату), как того требует проверка EXCEPTIONS._16 при расчете по требованиям МСФО
+        · refinancingRateHistory     — история среднемесячной рыночной ставки рефинансирования ипотеки
+        · refinancingRateParameters  — параметры модели спреда между ставкой рефинансирования и Ключевой ставкой на первое число
+                                       каждого месяца за 2 года до и 1 год после Опорной даты (словарь списков, как в ответе API),
+                                       поэтому проверка EXCEPTIONS._15 проходит для расчетов по требованиям МСФО на конец месяца
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    random = np.random.default_rng(seed)
+    key_rate_model_date = np.datetime64(key_rate_model_date, 'D')
+
+    # ----- ИСТОРИЯ КЛЮЧЕВОЙ СТАВКИ -------------------------------------------------------------------------------------------------- #
+    meetings_dates = key_rate_model_date - np.arange(0, 6 * 365, 42)[::-1] * day
+    steps = random.choice([-1.0, -0.5, 0.0, 0.0, 0.5, 1.0], len(meetings_dates))
+    meetings_rates = np.clip(8.0 + np.cumsum(steps), 4.25, 21.0)
+    current_rate = float(meetings_rates[-1])
+
+    # ----- ПРОГНОЗЫ КЛЮЧЕВОЙ СТАВКИ ------------------------------------------------------------------------------------------------- #
+    forecast_date = key_rate_model_date - 30 * day
+    forecast_year = int(str(key_rate_model_date.astype(y_type)))
+    forecasts = []
+    for i, target in enumerate(np.linspace(current_rate, 7.5, 4)):
+        forecasts.append({'date': str(forecast_date), 'year': forecast_year + i, 'min': float(target - 0.5), 'max': float(target + 0.5)})
+
+    # Сглаженная траектория и траектория из свопов сходятся от текущего значения Ключевой ставки к долгосрочному уровню 7.5%:
+    future_months = (key_rate_model_date.astype(m_type) + np.arange(1, 11 * 12 + 1) * month).astype(d_type)
+    weights = np.exp(-np.arange(1, len(future_months) + 1) / 18.0)
+    smooth_rates = np.round((current_rate * weights + 7.5 * (1.0 - weights)) * 4.0, 0) / 4.0
+    swap_rates = np.round(smooth_rates + random.normal(0.0, 0.25, len(future_months)), 2)
+
+    # ----- СТАВКА РЕФИНАНСИРОВАНИЯ ИПОТЕКИ ------------------------------------------------------------------------------------------ #
+    history_months = (key_rate_model_date.astype(m_type) - np.arange(1, 6 * 12 + 1)[::-1] * month).astype(d_type)
+    history_key_rates = meetings_rates[np.maximum(np.searchsorted(meetings_dates, history_months, side='right') - 1, 0)]
+    ref_rates = np.round(history_key_rates + 100.0 * np.exp(-3.2 - 8.0 * history_key_rates / 100.0), 2)
+    parameters_months = (key_rate_model_date.astype(m_type) + np.arange(-24, 13) * month).astype(d_type)
+
+    return {
+        'meetingsCBR': [{'date': d, 'rate': float(r)} for d, r in zip(date_strings(meetings_dates), meetings_rates)],
+        'meetingsCBRForecasts': forecasts,
+        'meetingsCBRSmooth': {'data': [{'date': d, 'rate': float(r)} for d, r in zip(date_strings(future_months), smooth_rates)]},
+        'keyRateSwapForecast': {
+            'forecastDate': str(key_rate_model_date),  # совпадает с датой синтетической КБД (см. SyntheticDataSource)
+            'data': [{'date': d, 'rate': float(r)} for d, r in zip(date_strings(future_months[:10 * 12]), swap_rates)],
+        },
+        'refinancingRateHistory': [{'date': d, 'rate': float(r)} for d, r in zip(date_strings(history_months), ref_rates)],
+        'refinancingRateParameters': {'date': date_strings(parameters_months), 'alpha0': [-3.2] * len(parameters_months),
+                                      'alpha1': [-8.0] * len(parameters_months)},
+    }
+
+
+def syntheticZCYCParameters(zcyc_date, seed=0):
+    """ Генерация синтетических параметров КБД Московской биржи в формате ответа метода GetZCYCCoefficients """
+
+    random = np.random.default_rng(seed)
+    parameters = {'date': str(np.datetime64(zcyc_date, 's')),
+                  'b0': float(np.round(random.uniform(1000.0, 1500.0), 2)),
+                  'b1': float(np.round(random.uniform(-300.0, 300.0), 2)),
+                  'b2': float(np.round(random.uniform(-300.0, 300.0), 2)),
+                  'tau': float(np.round(random.uniform(1.0, 3.0), 4))}
+    for i in range(1, 10):
+        parameters['g' + str(i)] = float(np.round(random.normal(0.0, 10.0), 4))
+    return parameters
+
+
+def syntheticSCurvesParameters(report_date, max_loan_age=5):
+    """ Синтетические параметры S-кривых для выдержек от 0 до max_loan_age лет в формате поля sCurvesParameters """
+
+    s_curves = []
+    for loan_age in range(max_loan_age + 1):
+        s_curves.append({'reportDate': str(np.datetime64(report_date, 'D')), 'loanAge': loan_age,
+                         'beta0': 0.12 + 0.01 * loan_age, 'beta1': 0.08, 'beta2': -1.0, 'beta3': 1.2,
+                         'beta4': 0.01, 'beta5': 0.0, 'beta6': 0.5})
+    return s_curves
+
+
+def syntheticDataForCalculation(bond_id, pool_data, coupon_type=COUPON_TYPE.FXD, issue_date=DEFAULT_ISSUE_DATE, coupon_period=1,
+                                reinvestment=True, report_months=0):
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Генерация синтетических данных по выпуску ИЦБ ДОМ.РФ в формате ответа метода GetDataForCalculation
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры функции:
+
+        Обязательные:
+            1. bond_id        — идентификатор синтетического выпуска
+            2. pool_data      — данные по кредитам в ипотечном покрытии (результат syntheticPoolData)
+
+        Опциональные:
+            1. coupon_type    — тип расчета купонной выплаты (см. auxiliary.COUPON_TYPE), по умолчанию COUPON_TYPE.FXD
+            2. issue_date     — Дата размещения выпуска
+            3. coupon_period  — длина купонного периода в месяцах (1 или 3)
+            4. reinvestment   — True/False: начисление процентов на остаток на счете Ипотечного агента
+            5. report_months  — число ежемесячных отчетов сервисного агента после Даты передачи (по умолчанию 0)
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Выпуск формируется на Дату размещения: Дата передачи — первое число месяца размещения (она же дата среза ипотечного покрытия),
+    первый купон выплачивается 28 числа через два месяца после размещения, Юридическая дата погашения наступает через год после
+    максимальной текущей даты погашения кредитов. Первоначальный объем выпуска равен сумме остатков основного долга, округленной вниз
+    до номинала облигации. Истории выплат у выпуска нет. При report_months > 0 срезы ипотечного покрытия и параметры S-кривых
+    добавляются на первое число каждого из report_months месяцев после Даты передачи (нужны для оценки по МСФО на конец месяца)
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    issue_date = np.datetime64(issue_date, 'D')
+    delivery_date = issue_date.astype(m_type).astype(d_type)
+    report_dates = (delivery_date.astype(m_type) + np.arange(int(report_months) + 1) * month).astype(d_type)
+    first_coupon_date = (issue_date.astype(m_type) + 2 * month).astype(d_type) + 27 * day
+    max_maturity = np.array(pool_data['currentMaturityDate']).astype(d_type).max()
+    legal_redemption_date = (max_maturity.astype(m_type) + 12 * month).astype(d_type) + 27 * day
+
+    current_debts = np.array(pool_data['currentDebt']).astype(float)
+    coefficients = np.array(pool_data['subsidyCoefficient']).astype(float)
+    coefficients[np.isnan(coefficients)] = 0.0
+    govern_programs_fraction = float(np.round(np.sum(current_debts * coefficients) / np.sum(current_debts), 2))
+    start_issue_principal = np.floor(np.sum(current_debts) / BOND_PRINCIPAL) * BOND_PRINCIPAL
+
+    bond_parameters = {
+        'issueDate': str(issue_date),
+        'deliveryDate': str(delivery_date),
+        'firstCouponDate': str(first_coupon_date),
+        'legalRedemptionDate': str(legal_redemption_date),
+        'actualRedemptionDate': None,
+        'couponPeriod': int(coupon_period),
+        'couponType': int(coupon_type),
+        'startBondPrincipal': BOND_PRINCIPAL,
+        'startIssuePrincipal': float(start_issue_principal),
+        'cleanUpPercentage': 10.0,
+        'initialExpectedCDR': 0.5,
+        'firstCouponExpensesIssueDoc': 0.3,
+        'otherCouponsExpensesIssueDoc': 0.2,
+        'specDepRateIssueDoc': 0.01,
+        'specDepMinMonthIssueDoc': 20000.0,
+        'specDepCompensationMonthIssueDoc': 5000.0,
+        'manAccQuartRateIssueDoc': 0.004,
+        'manAccQuartFixIssueDoc': None,
+        'paymentAgentYearIssueDoc': 60000.0,
+        'reinvestment': bool(reinvestment),
+        'deductionRUONIA': 0.0,
+        'returnAccruedSubsidy': True,
+        'fixedCouponRate': 8.5 if coupon_type == COUPON_TYPE.FXD else None,
+        'fixedKeyRatePremium': 1.0 if coupon_type == COUPON_TYPE.FLT else None,
+        'swapWithOriginator': False,
+        'monthlyFloatingSums': False,
+        'origPaysAccruedYield': False,
+        'lumpSumSwap': 0.0,
+    }
+
+    return {
+        'bondParameters': bond_parameters,
+        'serviceReportsStatistics': {'reportDate': [], 'currentCPR': [], 'currentCDR': [], 'historicalCPR': [], 'sixMonthsCPR': [],
+                                     'historicalCDR': []},
+        'investorsReportsData': {'couponDate': [], 'bondNextPrincipal': [], 'bondAmortization': [], 'bondCouponPayment': []},
+        'sCurvesParameters': [s_curve for report_date in report_dates for s_curve in syntheticSCurvesParameters(report_date)],
+        'pools': [{'reportDate': str(report_date), 'governProgramsFraction': govern_programs_fraction} for report_date in report_dates],
+    }
+
+
+def syntheticPricingParameters(bond_id, coupon_type, pool_type, pricing_date=DEFAULT_ISSUE_DATE):
+    """ Параметры оценки синтетического выпуска, допустимые для заданного сочетания типа купонной выплаты и типа ипотечного покрытия """
+
+    pricing_parameters = {'bondID': bond_id, 'pricingDate': str(np.datetime64(pricing_date, 'D')), 'usePricingDateDataOnly': True}
+
+    if coupon_type == COUPON_TYPE.FXD:
+        pricing_parameters['zSpread'] = 120.0
+    elif coupon_type == COUPON_TYPE.FLT:
+        pricing_parameters['requiredKeyRatePremium'] = 120.0
+    elif pool_type == POOL_TYPE.FXD:
+        pricing_parameters['zSpread'] = 120.0
+    elif pool_type == POOL_TYPE.FLT:
+        pricing_parameters['requiredKeyRatePremium'] = 120.0
+    else:
+        pricing_parameters['zSpread'] = 120.0
+        pricing_parameters['requiredKeyRatePremium'] = 120.0
+
+    return pricing_parameters
+
+
+class SyntheticResponse(object):
+
+    """ Ответ синтетического источника данных (повторяет интерфейс requests.Response, необходимый модели и кэшу DataCache: метод json и
+    атрибут content) """
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.status_code = 200
+
+    def json(self):
+        return self.payload
+
+    @property
+    def content(self):
+        return json.dumps(self.payload, ensure_ascii=False).encode('utf8')
+
+
+class SyntheticDataSource(object):
+
+    """ Синтетический источник данных, отвечающий на запросы четырех методов DataSource (GetDataForCalculation, GetZCYCCoefficients,
+        GetPoolsData, GetMacroData) без обращения к API. Метод get повторяет сигнатуру requests.get """
+
+    def __init__(self, loans_number, coupon_type=COUPON_TYPE.FXD, pool_type=POOL_TYPE.FXD, issue_date=DEFAULT_ISSUE_DATE, seed=0,
+                 bond_id=None, report_months=0):
+
+        self.couponType = coupon_type
+        self.poolType = pool_type
+        self.issueDate = np.datetime64(issue_date, 'D')
+        self.seed = seed
+        self.bondID = bond_id
+        if self.bondID is None:
+            self.bondID = 'SYNTH-{}-{}-{}'.format(COUPON_TYPE_NAMES[coupon_type], POOL_TYPE_NAMES[pool_type], int(loans_number))
+
+        self.reportDate = self.issueDate.astype(m_type).astype(d_type)
+        self.poolData = syntheticPoolData(loans_number, self.reportDate, pool_type, seed)
+        self.dataForCalculation = syntheticDataForCalculation(self.bondID, self.poolData, coupon_type, self.issueDate,
+                                                              report_months=report_months)
+        self.keyRateModelData = syntheticKeyRateModelData(self.issueDate, seed)
+        self.zcycParameters = syntheticZCYCParameters(self.issueDate + day - second, seed)
+
+    def pricingParameters(self):
+        return syntheticPricingParameters(self.bondID, self.couponType, self.poolType, self.issueDate)
+
+    def get(self, url, timeout=None, **kwargs):
+
+        split = urlsplit(url)
+        method = split.path.rstrip('/').split('/')[-1]
+        query = parse_qs(split.query)
+
+        if method == 'GetDataForCalculation':
+            return SyntheticResponse(self.dataForCalculation)
+        elif method == 'GetZCYCCoefficients':
+            return SyntheticResponse(self.zcycParameters)
+        elif method == 'GetMacroData':
+            return SyntheticResponse(self.keyRateModelData)
+        elif method == 'GetPoolsData':
+            report_date = query['date'][0] if 'date' in query.keys() else str(self.reportDate)
+            return SyntheticResponse({'pools': [{'reportDate': report_date, 'data': self.poolData}]})
+
+        raise Exception('Синтетический источник данных не обрабатывает запрос ' + url)
@@ -10,18 +10,16 @@ logger = logging.getLogger('logger')
 
 import json
 import time
-import sys
-import tqdm
 import copy
 import numpy as np
 import pandas as pd
 import datetime as dt
 
-from requests import get
-from scipy.optimize import minimize
 from auxiliary import *
 from pool_model import *
 from macro_model import *
+from reinvestment_model import *
+from swap_model import *
 
 import warnings
 
@@ -34,8 +32,11 @@ class Convention(object):
 
     def __init__(self, input):
 
-        # Заданные параметры оценки:
-        self.pricingParameters = copy.deepcopy(input)
+        # Заданные параметры оценки (параметр progressBar может содержать объект, поэтому не копируется):
+        progress_bar = input['progressBar'] if 'progressBar' in input.keys() else None
+        self.pricingParameters = copy.deepcopy({key: input[key] for key in input.keys() if key != 'progressBar'})
+        if isinstance(progress_bar, bool):
+            self.pricingParameters['progressBar'] = progress_bar
 
         # Идентификатор расчета (генерируется на стороне сайта калькулятора, необходим для идентификации расчета на сайте):
         self.connectionId = None
@@ -63,6 +64,20 @@ class Convention(object):
         if not condition_1 and not condition_2:
             raise Exception(EXCEPTIONS._1)
 
+        # Ключ модели денежного потока — хэш всех параметров расчета, кроме опорных ценовых метрик и служебных параметров. Расчеты с
+        # одинаковым ключом могут использовать один и тот же денежный поток (см. описание функции reprice):
+        self.modelKey = model_key(self.pricingParameters)
+        self.modelled = False
+        self.priced = False
+
+        # Если состояние расчета после расчета денежного потока с тем же ключом модели есть в кэше (см. описание класса ModelCache),
+        # загрузка данных и расчет денежного потока не проводятся — расчет сразу переходит к определению опорной ценовой метрики:
+        if model_cache.enabled:
+            state = model_cache.get(self.pricingParameters)
+            if state is not None:
+                self.restore(state, input)
+                return
+
         # -------------------------------------------------------------------------------------------------------------------------------- #
         # ----- ИНИЦИАЛИЗАЦИЯ СТАТУСА РАСЧЕТА В КОНСОЛИ И НА САЙТЕ ----------------------------------------------------------------------- #
         # -------------------------------------------------------------------------------------------------------------------------------- #
@@ -70,9 +85,19 @@ class Convention(object):
         # Время начала расчета (московское время):
         self.startTime = np.datetime64('now') + 3 * hour
 
-        # Инициализация прогресс-бара в консоли:
-        self.progressBar = tqdm.tqdm(total=100, file=sys.stdout, ncols=100, leave=False,
-                                     desc=self.bondID, bar_format="{l_bar}|{bar}| {n_fmt}/{total_fmt}{postfix}")
+        # Замеры времени выполнения этапов расчета (возвращаются в calculationOutput['timings']). В случае равенства индикатора logTimings
+        # единице замеры также будут записаны в logger в формате JSON:
+        self.timer = StageTimer(self.bondID)
+        self.logTimings = False
+        if 'logTimings' in self.pricingParameters.keys() and self.pricingParameters['logTimings'] is not None:
+            self.logTimings = bool(self.pricingParameters['logTimings'])
+        self.timer.start('__init__')
+
+        # Инициализация получателя доли готовности расчета (по умолчанию доля готовности не отображается):
+        #     · true/"tqdm" — progress bar в консоли
+        #     · функция     — функция, которой передается доля готовности расчета в процентах
+        #     · объект ProgressReporter (например, AsyncQueueProgress для отправки статуса расчета из асинхронного сервиса)
+        self.progressBar = progress_reporter(progress_bar, desc=self.bondID)
 
         # [ОБНОВЛЕНИЕ СТАТУСА РАСЧЕТА]
         self.currentPercent = 1.0
@@ -82,8 +107,14 @@ class Convention(object):
         # ----- ДАННЫЕ, НЕОБХОДИМЫЕ ДЛЯ ПРОВЕДЕНИЯ РАСЧЕТА ------------------------------------------------------------------------------- #
         # -------------------------------------------------------------------------------------------------------------------------------- #
 
-        # Загрузка данных, необходимых для расчета, по API:
-        self.dataForCalculation = get(API.DATA_FOR_CALC.format(self.bondID), timeout=15).json()
+        # Загрузка данных, необходимых для расчета, по API (или из локального хранилища данных по выпускам, если оно включено,
+        # см. описание класса ReferenceData):
+        self.timer.start('GetDataForCalculation')
+        if reference_data.enabled:
+            self.dataForCalculation = reference_data.load(self.bondID, get)
+        else:
+            self.dataForCalculation = get(API.DATA_FOR_CALC.format(self.bondID), timeout=15).json()
+        self.timer.stop()
 
         # ----- ПАРАМЕТРЫ ВЫПУСКА ИЦБ ДОМ.РФ --------------------------------------------------------------------------------------------- #
         self.bondParameters = self.dataForCalculation['bondParameters']
@@ -248,9 +279,10 @@ class Convention(object):
         #   — reportDate         --> Дата отчетов сервисных агентов t
         #   — loanAge            --> Выдержка кредита h, целое число, годы
         #   — beta0, beta1, ...  --> Параметры S-кривых на дату t для выдержки кредита h, числа
-        self.sCurvesParameters = pd.DataFrame(self.dataForCalculation['sCurvesParameters'])
-        self.sCurvesParameters['reportDate'] = pd.to_datetime(self.sCurvesParameters['reportDate'])
-        self.sCurvesParameters.sort_values(by=['reportDate', 'loanAge'], inplace=True)
+        # S-кривые не зависят от выпуска, поэтому хранятся в общем для всех расчетов процесса репозитории s_curves_repository (каждая дата
+        # отчетов разбирается один раз, см. описание класса SCurvesRepository). В расчете остается только массив дат отчетов, S-кривые на
+        # которые доступны по выпуску:
+        self.sCurvesReportDates = s_curves_repository.update(self.dataForCalculation['sCurvesParameters'])
 
         # ----- ДОСТУПНЫЕ ДЛЯ ЗАГРУЗКИ СРЕЗЫ ИПОТЕЧНОГО ПОКРЫТИЯ ------------------------------------------------------------------------- #
         # Список ипотечных покрытий по выпуску ИЦБ ДОМ.РФ, доступных для скачивания посредсвтом метода getPoolsData:
@@ -311,7 +343,12 @@ class Convention(object):
             self.zcycDateTime = np.datetime64(self.pricingParameters['zcycDateTime'])
 
         # ----- ПАРАМЕТРЫ КБД (КРИВОЙ БЕСКУПОННОЙ ДОХОДНОСТИ) ---------------------------------------------------------------------------- #
+        self.timer.start('GetZCYCCoefficients')
         self.zcycParameters = get(API.GET_ZCYC_COEF.format(self.zcycDateTime), timeout=15).json()
+        self.timer.stop()
+
+        # Сдвиг КБД в б.п. — функция срока в годах (используется только в сценариях расчета показателей риска, см. mbsRiskMetrics):
+        self.zcycShift = None
 
         # ----- ИНДИКАТОР ИСПОЛЬЗОВАНИЯ ТОЛЬКО ДОСТУПНОЙ НА ДАТУ ОЦЕНКИ ИНФОРМАЦИИ ------------------------------------------------------- #
         # Бинарный параметр (1/0, да/нет), определяющий использование в расчете только той информации, которая доступна на Дату оценки.
@@ -392,6 +429,42 @@ class Convention(object):
             self.rounding = bool(self.pricingParameters['rounding'])
         self.roundingPrecision = 2 if self.rounding else 15
 
+        # ----- СОСТАВ ВЫХОДНЫХ ДАННЫХ РАСЧЕТА ------------------------------------------------------------------------------------------- #
+        # Определяет, какие разделы выходных данных формируются (см. auxiliary.OUTPUT_PROFILE). По умолчанию формируются все разделы,
+        # включая данные для графиков на сайте Калькулятора ИЦБ ДОМ.РФ. При пакетных расчетах графики можно не формировать (tables),
+        # а также не формировать таблицы денежных потоков по ипотечному покрытию, субсидиям, свопам и расходам (minimal):
+        self.outputProfile = OUTPUT_PROFILE.FULL
+        if 'outputProfile' in self.pricingParameters.keys() and self.pricingParameters['outputProfile'] is not None:
+            self.outputProfile = str(self.pricingParameters['outputProfile']).lower()
+            if self.outputProfile not in [OUTPUT_PROFILE.MINIMAL, OUTPUT_PROFILE.TABLES, OUTPUT_PROFILE.FULL]:
+                raise Exception(EXCEPTIONS._19)
+        self.outputGraphs = self.outputProfile == OUTPUT_PROFILE.FULL
+        self.outputTables = self.outputProfile != OUTPUT_PROFILE.MINIMAL
+
+        # ----- ЭКОНОМИЯ ПАМЯТИ ---------------------------------------------------------------------------------------------------------- #
+        # В случае равенства индикатора leanMemory единице промежуточные результаты расчета освобождаются сразу после этапа, после которого
+        # они больше не используются (подробнее см. описание функции releaseState), а после окончания расчета в объекте остаются только
+        # выходные данные и параметры оценки (lean_state_attributes). Результат расчета при этом не изменяется. Используется при пакетных
+        # расчетах, в которых объекты Convention хранятся до окончания всего пакета:
+        self.leanMemory = False
+        if 'leanMemory' in self.pricingParameters.keys() and self.pricingParameters['leanMemory'] is not None:
+            self.leanMemory = bool(self.pricingParameters['leanMemory'])
+
+        # ----- ПОКАЗАТЕЛИ РИСКА --------------------------------------------------------------------------------------------------------- #
+        # В случае равенства индикатора riskMetrics единице дополнительно рассчитываются эффективная дюрация, эффективная выпуклость и
+        # дюрации ключевых сроков КБД (подробнее см. описание функции mbsRiskMetrics). Параметр riskShift — величина параллельного сдвига
+        # процентных ставок в б.п. (по умолчанию 25 б.п.):
+        self.riskMetrics = False
+        self.riskShift = 25.0
+        if 'riskMetrics' in self.pricingParameters.keys() and self.pricingParameters['riskMetrics'] is not None:
+            self.riskMetrics = bool(self.pricingParameters['riskMetrics'])
+        if 'riskShift' in self.pricingParameters.keys() and self.pricingParameters['riskShift'] is not None:
+            self.riskShift = float(self.pricingParameters['riskShift'])
+            if not CONSTRAINTS.SHIFT_MIN <= self.riskShift <= CONSTRAINTS.SHIFT_MAX:
+                raise Exception(CONSTRAINTS.SHIFT_EXCEP)
+        self.initialState = None
+        self.riskResult = None
+
         # ----- ПРОВЕДЕНИЕ РАСЧЕТА СОГЛАСНО ТРЕБОВАНИЯМ МСФО ИЛИ РСБУ -------------------------------------------------------------------- #
         self.ifrs = False
         self.ras = False
@@ -556,189 +629,8 @@ class Convention(object):
         # ----- ОПОРНЫЕ ЦЕНОВЫЕ МЕТРИКИ  ------------------------------------------------------------------------------------------------- #
         # -------------------------------------------------------------------------------------------------------------------------------- #
 
-        # Опорная ценовая метрика — ценовая метрика ИЦБ ДОМ.РФ, которая задается пользователем в явном виде и относительно которой
-        # проводится расчет. В качестве опорной метрики, в зависимости от Типа расчета купонной выплаты и Типа ипотечного покрытия,
-        # могут выступать:
-        self.zSpread = None                 # Z-СПРЕД
-        self.gSpread = None                 # G-СПРЕД
-        self.dirtyPrice = None              # ГРЯЗНАЯ ЦЕНА
-        self.cleanPrice = None              # ЧИСТАЯ ЦЕНА
-        self.requiredKeyRatePremium = None  # ТРЕБУЕМАЯ НАДБАВКА
-
-        # В зависимости от заданной опорной метрики определяется Тип расчета, в соответствии с котором далее будет выбран алгоритм расчета:
-        self.calculationType = None
-
-        # Однако для различных комбинаций типа ставки купона и типа ипотечного покрытия набор возможных для уставноки значения отличается.
-        # Прежде чем проводить расчет, необходимо определиться, верно ли заданы параметры расчета. Для начала определим, что вообще задано:
-        keys = self.pricingParameters.keys()
-        z = 'zSpread' in keys and self.pricingParameters['zSpread'] is not None
-        g = 'gSpread' in keys and self.pricingParameters['gSpread'] is not None
-        d = 'dirtyPrice' in keys and self.pricingParameters['dirtyPrice'] is not None
-        c = 'cleanPrice' in keys and self.pricingParameters['cleanPrice'] is not None
-        p = 'requiredKeyRatePremium' in keys and self.pricingParameters['requiredKeyRatePremium'] is not None
-        r = 'fixedCouponRate' in keys and self.pricingParameters['fixedCouponRate'] is not None
-        k = 'fixedKeyRatePremium' in keys and self.pricingParameters['fixedKeyRatePremium'] is not None
-
-        # Если Тип расчета купонной выплаты — фиксированный:
-        if self.couponType == COUPON_TYPE.FXD:
-
-            # Необходимо задать одно из полей Z-СПРЕД, G-СПРЕД, ГРЯЗНАЯ ЦЕНА, ЧИСТАЯ ЦЕНА, СТАВКА КУПОНА:
-            if z and not g and not d and not c and not p and not r and not k:
-                self.calculationType = CALCULATION_TYPE.SET_ZSPRD
-                self.zSpread = float(self.pricingParameters['zSpread'])
-                if not CONSTRAINTS.ZSPRD_MIN <= self.zSpread <= CONSTRAINTS.ZSPRD_MAX:
-                    raise Exception(CONSTRAINTS.ZSPRD_EXCEP)
-
-            elif g and not z and not d and not c and not p and not r and not k:
-                self.calculationType = CALCULATION_TYPE.SET_GSPRD
-                self.gSpread = float(self.pricingParameters['gSpread'])
-                if not CONSTRAINTS.GSPRD_MIN <= self.gSpread <= CONSTRAINTS.GSPRD_MAX:
-                    raise Exception(CONSTRAINTS.GSPRD_EXCEP)
-
-            elif d and not z and not g and not c and not p and not r and not k:
-                self.calculationType = CALCULATION_TYPE.SET_DIRTY
-                self.dirtyPrice = float(self.pricingParameters['dirtyPrice'])
-                if not CONSTRAINTS.DIRTY_MIN <= self.dirtyPrice <= CONSTRAINTS.DIRTY_MAX:
-                    raise Exception(CONSTRAINTS.DIRTY_EXCEP)
-
-            elif c and not z and not g and not d and not p and not r and not k:
-                self.calculationType = CALCULATION_TYPE.SET_CLEAN
-                self.cleanPrice = float(self.pricingParameters['cleanPrice'])
-                if not CONSTRAINTS.CLEAN_MIN <= self.cleanPrice <= CONSTRAINTS.CLEAN_MAX:
-                    raise Exception(CONSTRAINTS.CLEAN_EXCEP)
-
-            elif r and not z and not g and not d and not c and not p and not k:
-                # В том случае, если задана ставка купона, дата оценки автоматически становится равной дате размещения, а индикатор
-                # ипользования только доступной на дату оценки информации автоматически становится истинным:
-                self.pricingDate = self.issueDate
-                self.usePricingDateDataOnly = True
-                self.poolReportDate = self.deliveryDate
-                self.poolDownloadDate = self.deliveryDate
-                self.calculationType = CALCULATION_TYPE.SET_COUPN
-                self.fixedCouponRate = float(self.pricingParameters['fixedCouponRate'])
-                if not CONSTRAINTS.COUPN_MIN <= self.fixedCouponRate <= CONSTRAINTS.COUPN_MAX:
-                    raise Exception(CONSTRAINTS.COUPN_EXCEP)
-
-            else:
-                raise Exception(EXCEPTIONS._2)
-
-        # Если Тип расчета купонной выплаты — плавающий:
-        elif self.couponType == COUPON_TYPE.FLT:
-
-            # Необходимо задать одно из полей ТРЕБУЕМАЯ НАДБАВКА, ГРЯЗНАЯ ЦЕНА, ЧИСТАЯ ЦЕНА, ФАКТИЧЕСКАЯ НАДБАВКА:
-            if p and not z and not g and not d and not c and not r and not k:
-                self.calculationType = CALCULATION_TYPE.SET_PREMI
-                self.requiredKeyRatePremium = float(self.pricingParameters['requiredKeyRatePremium'])
-                if not CONSTRAINTS.PREMI_MIN <= self.requiredKeyRatePremium <= CONSTRAINTS.PREMI_MAX:
-                    raise Exception(CONSTRAINTS.PREMI_EXCEP)
-
-            elif d and not z and not g and not c and not p and not r and not k:
-                self.calculationType = CALCULATION_TYPE.SET_DIRTY
-                self.dirtyPrice = float(self.pricingParameters['dirtyPrice'])
-                if not CONSTRAINTS.DIRTY_MIN <= self.dirtyPrice <= CONSTRAINTS.DIRTY_MAX:
-                    raise Exception(CONSTRAINTS.DIRTY_EXCEP)
-
-            elif c and not z and not g and not d and not p and not r and not k:
-                self.calculationType = CALCULATION_TYPE.SET_CLEAN
-                self.cleanPrice = float(self.pricingParameters['cleanPrice'])
-                if not CONSTRAINTS.CLEAN_MIN <= self.cleanPrice <= CONSTRAINTS.CLEAN_MAX:
-                    raise Exception(CONSTRAINTS.CLEAN_EXCEP)
-
-            elif k and not z and not g and not d and not c and not p and not r:
-                # В том случае, если задана фактическая фиксированная надбавка к Ключевой ставке, дата оценки автоматически становится
-                # равной дате размещения, а индикатор ипользования только доступной на дату оценки информации
-                # автоматически становится истинным:
-                self.pricingDate = self.issueDate
-                self.usePricingDateDataOnly = True
-                self.poolReportDate = self.deliveryDate
-                self.poolDownloadDate = self.deliveryDate
-                self.calculationType = CALCULATION_TYPE.SET_FXPRM
-                self.fixedKeyRatePremium = float(self.pricingParameters['fixedKeyRatePremium'])
-                if not CONSTRAINTS.FXPRM_MIN <= self.fixedKeyRatePremium <= CONSTRAINTS.FXPRM_MAX:
-                    raise Exception(CONSTRAINTS.FXPRM_EXCEP)
-                self.fixedKeyRatePremium /= 100.0
-
-            else:
-                raise Exception(EXCEPTIONS._3)
-
-        # Если Тип расчета купонной выплаты — переменный:
-        elif self.couponType == COUPON_TYPE.CHG:
-
-            # Если ипотечное покрытие стандартного типа, то необходимо задать одно из полей
-            # Z-СПРЕД, G-СПРЕД, ГРЯЗНАЯ ЦЕНА, ЧИСТАЯ ЦЕНА:
-            if self.poolType == POOL_TYPE.FXD:
-
-                if z and not g and not d and not c and not p and not r and not k:
-                    self.calculationType = CALCULATION_TYPE.SET_ZSPRD
-                    self.zSpread = float(self.pricingParameters['zSpread'])
-                    if not CONSTRAINTS.ZSPRD_MIN <= self.zSpread <= CONSTRAINTS.ZSPRD_MAX:
-                        raise Exception(CONSTRAINTS.ZSPRD_EXCEP)
-
-                elif g and not z and not d and not c and not p and not r and not k:
-                    self.calculationType = CALCULATION_TYPE.SET_GSPRD
-                    self.gSpread = float(self.pricingParameters['gSpread'])
-                    if not CONSTRAINTS.GSPRD_MIN <= self.gSpread <= CONSTRAINTS.GSPRD_MAX:
-                        raise Exception(CONSTRAINTS.GSPRD_EXCEP)
-
-                elif d and not z and not g and not c and not p and not r and not k:
-                    self.calculationType = CALCULATION_TYPE.SET_DIRTY
-                    self.dirtyPrice = float(self.pricingParameters['dirtyPrice'])
-                    if not CONSTRAINTS.DIRTY_MIN <= self.dirtyPrice <= CONSTRAINTS.DIRTY_MAX:
-                        raise Exception(CONSTRAINTS.DIRTY_EXCEP)
-
-                elif c and not z and not g and not d and not p and not r and not k:
-                    self.calculationType = CALCULATION_TYPE.SET_CLEAN
-                    self.cleanPrice = float(self.pricingParameters['cleanPrice'])
-                    if not CONSTRAINTS.CLEAN_MIN <= self.cleanPrice <= CONSTRAINTS.CLEAN_MAX:
-                        raise Exception(CONSTRAINTS.CLEAN_EXCEP)
-
-                else:
-                    raise Exception(EXCEPTIONS._4)
-
-            # Если ипотечное покрытие субсидируемого типа, то необходимо задать одно из полей
-            # ТРЕБУЕМАЯ НАДБАВКА, ГРЯЗНАЯ ЦЕНА, ЧИСТАЯ ЦЕНА:
-            elif self.poolType == POOL_TYPE.FLT:
-
-                if p and not z and not g and not d and not c and not r:
-                    self.calculationType = CALCULATION_TYPE.SET_PREMI
-                    self.requiredKeyRatePremium = float(self.pricingParameters['requiredKeyRatePremium'])
-                    if not CONSTRAINTS.PREMI_MIN <= self.requiredKeyRatePremium <= CONSTRAINTS.PREMI_MAX:
-                        raise Exception(CONSTRAINTS.PREMI_EXCEP)
-
-                elif d and not z and not g and not c and not p and not r:
-                    self.calculationType = CALCULATION_TYPE.SET_DIRTY
-                    self.dirtyPrice = float(self.pricingParameters['dirtyPrice'])
-                    if not CONSTRAINTS.DIRTY_MIN <= self.dirtyPrice <= CONSTRAINTS.DIRTY_MAX:
-                        raise Exception(CONSTRAINTS.DIRTY_EXCEP)
-
-                elif c and not z and not g and not d and not p and not r:
-                    self.calculationType = CALCULATION_TYPE.SET_CLEAN
-                    self.cleanPrice = float(self.pricingParameters['cleanPrice'])
-                    if not CONSTRAINTS.CLEAN_MIN <= self.cleanPrice <= CONSTRAINTS.CLEAN_MAX:
-                        raise Exception(CONSTRAINTS.CLEAN_EXCEP)
-
-                else:
-                    raise Exception(EXCEPTIONS._5)
-
-            # Если ипотечное покрытие смешанного типа, то необходимо задать два параметра одновременно:
-            # Z-СПРЕД (для части выпуска облигаций, которая обеспечивается кредитами без субсидий) и
-            # ТРЕБУЕМАЯ НАДБАВКА (для части выпуска облигаций, которая обеспечивается кредитами с субсидиями):
-            else:
-
-                if z & p and not g and not d and not c and not r:
-
-                    self.calculationType = CALCULATION_TYPE.SET_Z_PRM
-
-                    self.zSpread = float(self.pricingParameters['zSpread'])
-                    if not CONSTRAINTS.ZSPRD_MIN <= self.zSpread <= CONSTRAINTS.ZSPRD_MAX:
-                        raise Exception(CONSTRAINTS.ZSPRD_EXCEP)
-
-                    self.requiredKeyRatePremium = float(self.pricingParameters['requiredKeyRatePremium'])
-                    if not CONSTRAINTS.PREMI_MIN <= self.requiredKeyRatePremium <= CONSTRAINTS.PREMI_MAX:
-                        raise Exception(CONSTRAINTS.PREMI_EXCEP)
-
-                else:
-                    raise Exception(EXCEPTIONS._6.format(np.round(self.governProgramsFraction, 2)))
+        # Опорная ценовая метрика задается пользователем в явном виде (подробнее см. описание функции pricingMetrics):
+        self.pricingMetrics()
 
         # [ОБНОВЛЕНИЕ СТАТУСА РАСЧЕТА]
         self.currentPercent = 3.0
@@ -841,13 +733,10 @@ class Convention(object):
 
         # --> Соответствующая дата купонной выплаты (в части платежей по кредитам) <--
         # Расчетному периоду данной купонной выплаты относятся платежи по кредитам (погашения остатков основного долга и процентные
-        # поступления), поступившим в Месяц платежей по ипотечному покрытию и начисления субсидий (paymentMonth):
-        for i in range(len(self.paymentsStructure)):
-            report_date = self.paymentsStructure['reportDate'].values[i].astype(d_type)
-            index = (report_date >= pay_period_start) & (report_date <= pay_period_end)
-            coupon_date = self.couponsStructure['couponDate'].values[index]
-            if coupon_date.size == 1:
-                self.paymentsStructure.loc[i, 'couponDate'] = coupon_date[0]
+        # поступления), поступившим в Месяц платежей по ипотечному покрытию и начисления субсидий (paymentMonth). Расчетный период
+        # находится бинарным поиском по датам концов расчетных периодов (см. auxiliary.payment_period_coupon_dates):
+        report_dates = self.paymentsStructure['reportDate'].values
+        self.paymentsStructure['couponDate'] = payment_period_coupon_dates(report_dates, self.couponsStructure)
 
         # --> Дата поступления субсидии <--
         # Дата, в которую ожидается поступление субсидий за Месяц платежей по ипотечному покрытию и начисления субсидий (paymentMonth).
@@ -867,12 +756,8 @@ class Convention(object):
         # --> Соответствующая дата купонной выплаты (в части субсидий) <--`
         # Расчетному периоду данной купонной выплаты относятся субсидии, начисленные за Месяц платежей по ипотечному покрытию и начисления
         # субсидий (paymentMonth):
-        for i in range(len(self.paymentsStructure)):
-            subsidy_date = self.paymentsStructure['subsidyPaymentDate'].values[i].astype(d_type)
-            index = (subsidy_date >= pay_period_start) & (subsidy_date <= pay_period_end)
-            coupon_date = self.couponsStructure['couponDate'].values[index]
-            if coupon_date.size == 1:
-                self.paymentsStructure.loc[i, 'subsidyCouponDate'] = coupon_date[0]
+        subsidy_dates = self.paymentsStructure['subsidyPaymentDate'].values
+        self.paymentsStructure['subsidyCouponDate'] = payment_period_coupon_dates(subsidy_dates, self.couponsStructure)
 
         # ----- ПРЕДЫДУЩАЯ ОТ ДАТЫ ОЦЕНКИ ДАТА КУПОННОЙ ВЫПЛАТЫ -------------------------------------------------------------------------- #
         self.previousCouponDate = None
@@ -991,7 +876,9 @@ class Convention(object):
                 self.keyRateModelDate = np.datetime64('today')
 
             # Загрузка данных для модели Ключевой ставки производится на Опорную дату модели макроэкономики:
+            self.timer.start('GetMacroData')
             self.keyRateModelData = get(API.GET_MACR_DATA.format(self.keyRateModelDate), timeout=15).json()
+            self.timer.stop()
 
             if self.ifrs:
                 # В случае расчета по требованиям МСФО на конец месяца необходимо проконтролировать, чтобы уже были загружены актуальные
@@ -1021,19 +908,19 @@ class Convention(object):
                     # S-кривые (например, расчет 31.03.2024 должен проводиться по S-кривым на 01.04.2024, иначе расчет останавливаетя):
                     condition_1 = self.pricingDate != self.issueDate
                     condition_2 = self.poolReportDate == self.pricingDate + day
-                    condition_3 = date_a_1 not in self.sCurvesParameters['reportDate'].values
+                    condition_3 = date_a_1 not in self.sCurvesReportDates
                     if condition_1 and condition_2 and condition_3:
                         raise Exception(EXCEPTIONS._17.format(str(date_a_1), str(self.pricingDate)))
-                date_a_2 = self.sCurvesParameters['reportDate'].values.max().astype(d_type)
+                date_a_2 = self.sCurvesReportDates.max()
                 date_a = min(date_a_1, date_a_2)
-                date_b = self.sCurvesParameters['reportDate'].values.min().astype(d_type)
+                date_b = self.sCurvesReportDates.min()
                 self.calculationSCurvesReportDate = max(date_a, date_b)
             else:
-                self.calculationSCurvesReportDate = self.sCurvesParameters['reportDate'].values.max().astype(d_type)
+                self.calculationSCurvesReportDate = self.sCurvesReportDates.max()
 
             # ----- ПАРАМЕТРЫ S-КРИВЫХ ДЛЯ РАСЧЕТА --------------------------------------------------------------------------------------- #
-            s_curve_index = self.sCurvesParameters['reportDate'] == self.calculationSCurvesReportDate
-            self.calculationSCurvesParameters = self.sCurvesParameters[s_curve_index].copy(deep=True)
+            # Компактная S-кривая из репозитория s_curves_repository (массив только для чтения, общий для всех расчетов процесса):
+            self.calculationSCurvesParameters = s_curves_repository.curve(self.calculationSCurvesReportDate)
 
             # ----- ДАТА АКТУАЛЬНОСТИ ИСТОРИЧЕСКОГО CDR ---------------------------------------------------------------------------------- #
             condition_1 = len(self.serviceReportsStatistics) >= 4
@@ -1090,6 +977,7 @@ class Convention(object):
         self.swapPriceOriginatorRub = None
 
         self.pricingResult = {}
+        self.discounting = None
         self.yearsToCouponDate = None
         self.zcycValuesY = None
         self.discountFactorZCYCPlusZ = None
@@ -1102,9 +990,13 @@ class Convention(object):
         self.ytm = None
         self.durationMacaulay = None
         self.durationModified = None
+        self.spreadDuration = None
+        self.spreadConvexity = None
+        self.dv01 = None
+        self.dv01Rub = None
         self.modelKeyRatePremium = None
 
-        self.calculationOutput = {}
+        self.calculationOutput = CalculationResult()
         self.calculationParameters = {}
         self.mbsCashflowTable = None
         self.historicalCashflow = None
@@ -1113,14 +1005,253 @@ class Convention(object):
         self.sCurveEmpiricalData = None
         self.sCurveGraph = None
 
+        self.releaseState('initialization')
+
         # [ОБНОВЛЕНИЕ СТАТУСА РАСЧЕТА]
         self.currentPercent = 5.0
         update(self.connectionId, self.currentPercent, self.progressBar)
 
+        self.timer.stop()
+
         ####################################################################################################################################
 
-    def __del__(self):
-        pass
+    def releaseState(self, stage):
+
+        """
+        ------------------------------------------------------------------------------------------------------------------------------------
+        Освобождение промежуточных результатов расчета после этапа stage (только при leanMemory = True)
+        ------------------------------------------------------------------------------------------------------------------------------------
+
+        Промежуточные результаты освобождаются сразу после этапа, после которого они больше не используются:
+
+            1. initialization     — исходные данные по выпуску dataForCalculation (после разбора в таблицы отчетов и параметры выпуска)
+            2. poolCashflowModel  — результат loansCashflowModel (кроме статистики ипотечного покрытия poolStatistics: Модельные траектории
+                                    ставок и денежный поток по ипотечному покрытию остаются в macroModel и poolModel)
+            3. mbsCashflowModel   — денежный поток по ипотечному покрытию по дням (reinvestment) в poolModel и mbsModel, денежный поток по
+                                    выпуску (issue) в mbsModel и результат расчета начислений на остаток на счете Ипотечного агента
+                                    reinvModel. Освобождается до сохранения состояния в кэш денежного потока, поэтому состояние в кэше
+                                    также занимает меньше памяти
+            4. mbsPricing         — копии денежного потока по облигации в фиксированной и плавающей частях (mbsCashflowFixed,
+                                    mbsCashflowFloat)
+            5. calculate          — все состояние объекта, кроме выходных данных и параметров оценки (lean_state_attributes)
+
+        Атрибуты не изменяются на месте, а заменяются новыми объектами, поэтому таблицы, на которые ссылается состояние в кэше денежного
+        потока или в копиях для расчета показателей риска, не затрагиваются.
+
+        ------------------------------------------------------------------------------------------------------------------------------------
+        """
+
+        if not self.leanMemory:
+            return
+
+        if stage == 'initialization':
+            self.dataForCalculation = None
+
+        elif stage == 'poolCashflowModel':
+            self.loansCashflowModel_res = {'poolStatistics': self.loansCashflowModel_res['poolStatistics']}
+
+        elif stage == 'mbsCashflowModel':
+            self.poolModel = {part: {'cashflow': model['cashflow']} for part, model in self.poolModel.items()}
+            self.mbsModel = {part: dict(model, reinvestment=None, issue=None) for part, model in self.mbsModel.items()}
+            self.reinvModel = None
+
+        elif stage == 'mbsPricing':
+            self.mbsCashflowFixed = None
+            self.mbsCashflowFloat = None
+
+        elif stage == 'calculate':
+            for key in [key for key in self.__dict__.keys() if key not in lean_state_attributes]:
+                del self.__dict__[key]
+
+    def pricingMetrics(self):
+
+        """ Определение Типа расчета и опорной ценовой метрики по заданным параметрам оценки """
+
+        # Опорная ценовая метрика — ценовая метрика ИЦБ ДОМ.РФ, которая задается пользователем в явном виде и относительно которой
+        # проводится расчет. В качестве опорной метрики, в зависимости от Типа расчета купонной выплаты и Типа ипотечного покрытия,
+        # могут выступать:
+        self.zSpread = None                 # Z-СПРЕД
+        self.gSpread = None                 # G-СПРЕД
+        self.dirtyPrice = None              # ГРЯЗНАЯ ЦЕНА
+        self.cleanPrice = None              # ЧИСТАЯ ЦЕНА
+        self.requiredKeyRatePremium = None  # ТРЕБУЕМАЯ НАДБАВКА
+
+        # В зависимости от заданной опорной метрики определяется Тип расчета, в соответствии с котором далее будет выбран алгоритм расчета:
+        self.calculationType = None
+
+        # Однако для различных комбинаций типа ставки купона и типа ипотечного покрытия набор возможных для уставноки значения отличается.
+        # Прежде чем проводить расчет, необходимо определиться, верно ли заданы параметры расчета. Для начала определим, что вообще задано:
+        keys = self.pricingParameters.keys()
+        z = 'zSpread' in keys and self.pricingParameters['zSpread'] is not None
+        g = 'gSpread' in keys and self.pricingParameters['gSpread'] is not None
+        d = 'dirtyPrice' in keys and self.pricingParameters['dirtyPrice'] is not None
+        c = 'cleanPrice' in keys and self.pricingParameters['cleanPrice'] is not None
+        p = 'requiredKeyRatePremium' in keys and self.pricingParameters['requiredKeyRatePremium'] is not None
+        r = 'fixedCouponRate' in keys and self.pricingParameters['fixedCouponRate'] is not None
+        k = 'fixedKeyRatePremium' in keys and self.pricingParameters['fixedKeyRatePremium'] is not None
+
+        # Если Тип расчета купонной выплаты — фиксированный:
+        if self.couponType == COUPON_TYPE.FXD:
+
+            # Необходимо задать одно из полей Z-СПРЕД, G-СПРЕД, ГРЯЗНАЯ ЦЕНА, ЧИСТАЯ ЦЕНА, СТАВКА КУПОНА:
+            if z and not g and not d and not c and not p and not r and not k:
+                self.calculationType = CALCULATION_TYPE.SET_ZSPRD
+                self.zSpread = float(self.pricingParameters['zSpread'])
+                if not CONSTRAINTS.ZSPRD_MIN <= self.zSpread <= CONSTRAINTS.ZSPRD_MAX:
+                    raise Exception(CONSTRAINTS.ZSPRD_EXCEP)
+
+            elif g and not z and not d and not c and not p and not r and not k:
+                self.calculationType = CALCULATION_TYPE.SET_GSPRD
+                self.gSpread = float(self.pricingParameters['gSpread'])
+                if not CONSTRAINTS.GSPRD_MIN <= self.gSpread <= CONSTRAINTS.GSPRD_MAX:
+                    raise Exception(CONSTRAINTS.GSPRD_EXCEP)
+
+            elif d and not z and not g and not c and not p and not r and not k:
+                self.calculationType = CALCULATION_TYPE.SET_DIRTY
+                self.dirtyPrice = float(self.pricingParameters['dirtyPrice'])
+                if not CONSTRAINTS.DIRTY_MIN <= self.dirtyPrice <= CONSTRAINTS.DIRTY_MAX:
+                    raise Exception(CONSTRAINTS.DIRTY_EXCEP)
+
+            elif c and not z and not g and not d and not p and not r and not k:
+                self.calculationType = CALCULATION_TYPE.SET_CLEAN
+                self.cleanPrice = float(self.pricingParameters['cleanPrice'])
+                if not CONSTRAINTS.CLEAN_MIN <= self.cleanPrice <= CONSTRAINTS.CLEAN_MAX:
+                    raise Exception(CONSTRAINTS.CLEAN_EXCEP)
+
+            elif r and not z and not g and not d and not c and not p and not k:
+                # В том случае, если задана ставка купона, дата оценки автоматически становится равной дате размещения, а индикатор
+                # ипользования только доступной на дату оценки информации автоматически становится истинным:
+                self.pricingDate = self.issueDate
+                self.usePricingDateDataOnly = True
+                self.poolReportDate = self.deliveryDate
+                self.poolDownloadDate = self.deliveryDate
+                self.calculationType = CALCULATION_TYPE.SET_COUPN
+                self.fixedCouponRate = float(self.pricingParameters['fixedCouponRate'])
+                if not CONSTRAINTS.COUPN_MIN <= self.fixedCouponRate <= CONSTRAINTS.COUPN_MAX:
+                    raise Exception(CONSTRAINTS.COUPN_EXCEP)
+
+            else:
+                raise Exception(EXCEPTIONS._2)
+
+        # Если Тип расчета купонной выплаты — плавающий:
+        elif self.couponType == COUPON_TYPE.FLT:
+
+            # Необходимо задать одно из полей ТРЕБУЕМАЯ НАДБАВКА, ГРЯЗНАЯ ЦЕНА, ЧИСТАЯ ЦЕНА, ФАКТИЧЕСКАЯ НАДБАВКА:
+            if p and not z and not g and not d and not c and not r and not k:
+                self.calculationType = CALCULATION_TYPE.SET_PREMI
+                self.requiredKeyRatePremium = float(self.pricingParameters['requiredKeyRatePremium'])
+                if not CONSTRAINTS.PREMI_MIN <= self.requiredKeyRatePremium <= CONSTRAINTS.PREMI_MAX:
+                    raise Exception(CONSTRAINTS.PREMI_EXCEP)
+
+            elif d and not z and not g and not c and not p and not r and not k:
+                self.calculationType = CALCULATION_TYPE.SET_DIRTY
+                self.dirtyPrice = float(self.pricingParameters['dirtyPrice'])
+                if not CONSTRAINTS.DIRTY_MIN <= self.dirtyPrice <= CONSTRAINTS.DIRTY_MAX:
+                    raise Exception(CONSTRAINTS.DIRTY_EXCEP)
+
+            elif c and not z and not g and not d and not p and not r and not k:
+                self.calculationType = CALCULATION_TYPE.SET_CLEAN
+                self.cleanPrice = float(self.pricingParameters['cleanPrice'])
+                if not CONSTRAINTS.CLEAN_MIN <= self.cleanPrice <= CONSTRAINTS.CLEAN_MAX:
+                    raise Exception(CONSTRAINTS.CLEAN_EXCEP)
+
+            elif k and not z and not g and not d and not c and not p and not r:
+                # В том случае, если задана фактическая фиксированная надбавка к Ключевой ставке, дата оценки автоматически становится
+                # равной дате размещения, а индикатор ипользования только доступной на дату оценки информации
+                # автоматически становится истинным:
+                self.pricingDate = self.issueDate
+                self.usePricingDateDataOnly = True
+                self.poolReportDate = self.deliveryDate
+                self.poolDownloadDate = self.deliveryDate
+                self.calculationType = CALCULATION_TYPE.SET_FXPRM
+                self.fixedKeyRatePremium = float(self.pricingParameters['fixedKeyRatePremium'])
+                if not CONSTRAINTS.FXPRM_MIN <= self.fixedKeyRatePremium <= CONSTRAINTS.FXPRM_MAX:
+                    raise Exception(CONSTRAINTS.FXPRM_EXCEP)
+                self.fixedKeyRatePremium /= 100.0
+
+            else:
+                raise Exception(EXCEPTIONS._3)
+
+        # Если Тип расчета купонной выплаты — переменный:
+        elif self.couponType == COUPON_TYPE.CHG:
+
+            # Если ипотечное покрытие стандартного типа, то необходимо задать одно из полей
+            # Z-СПРЕД, G-СПРЕД, ГРЯЗНАЯ ЦЕНА, ЧИСТАЯ ЦЕНА:
+            if self.poolType == POOL_TYPE.FXD:
+
+                if z and not g and not d and not c and not p and not r and not k:
+                    self.calculationType = CALCULATION_TYPE.SET_ZSPRD
+                    self.zSpread = float(self.pricingParameters['zSpread'])
+                    if not CONSTRAINTS.ZSPRD_MIN <= self.zSpread <= CONSTRAINTS.ZSPRD_MAX:
+                        raise Exception(CONSTRAINTS.ZSPRD_EXCEP)
+
+                elif g and not z and not d and not c and not p and not r and not k:
+                    self.calculationType = CALCULATION_TYPE.SET_GSPRD
+                    self.gSpread = float(self.pricingParameters['gSpread'])
+                    if not CONSTRAINTS.GSPRD_MIN <= self.gSpread <= CONSTRAINTS.GSPRD_MAX:
+                        raise Exception(CONSTRAINTS.GSPRD_EXCEP)
+
+                elif d and not z and not g and not c and not p and not r and not k:
+                    self.calculationType = CALCULATION_TYPE.SET_DIRTY
+                    self.dirtyPrice = float(self.pricingParameters['dirtyPrice'])
+                    if not CONSTRAINTS.DIRTY_MIN <= self.dirtyPrice <= CONSTRAINTS.DIRTY_MAX:
+                        raise Exception(CONSTRAINTS.DIRTY_EXCEP)
+
+                elif c and not z and not g and not d and not p and not r and not k:
+                    self.calculationType = CALCULATION_TYPE.SET_CLEAN
+                    self.cleanPrice = float(self.pricingParameters['cleanPrice'])
+                    if not CONSTRAINTS.CLEAN_MIN <= self.cleanPrice <= CONSTRAINTS.CLEAN_MAX:
+                        raise Exception(CONSTRAINTS.CLEAN_EXCEP)
+
+                else:
+                    raise Exception(EXCEPTIONS._4)
+
+            # Если ипотечное покрытие субсидируемого типа, то необходимо задать одно из полей
+            # ТРЕБУЕМАЯ НАДБАВКА, ГРЯЗНАЯ ЦЕНА, ЧИСТАЯ ЦЕНА:
+            elif self.poolType == POOL_TYPE.FLT:
+
+                if p and not z and not g and not d and not c and not r:
+                    self.calculationType = CALCULATION_TYPE.SET_PREMI
+                    self.requiredKeyRatePremium = float(self.pricingParameters['requiredKeyRatePremium'])
+                    if not CONSTRAINTS.PREMI_MIN <= self.requiredKeyRatePremium <= CONSTRAINTS.PREMI_MAX:
+                        raise Exception(CONSTRAINTS.PREMI_EXCEP)
+
+                elif d and not z and not g and not c and not p and not r:
+                    self.calculationType = CALCULATION_TYPE.SET_DIRTY
+                    self.dirtyPrice = float(self.pricingParameters['dirtyPrice'])
+                    if not CONSTRAINTS.DIRTY_MIN <= self.dirtyPrice <= CONSTRAINTS.DIRTY_MAX:
+                        raise Exception(CONSTRAINTS.DIRTY_EXCEP)
+
+                elif c and not z and not g and not d and not p and not r:
+                    self.calculationType = CALCULATION_TYPE.SET_CLEAN
+                    self.cleanPrice = float(self.pricingParameters['cleanPrice'])
+                    if not CONSTRAINTS.CLEAN_MIN <= self.cleanPrice <= CONSTRAINTS.CLEAN_MAX:
+                        raise Exception(CONSTRAINTS.CLEAN_EXCEP)
+
+                else:
+                    raise Exception(EXCEPTIONS._5)
+
+            # Если ипотечное покрытие смешанного типа, то необходимо задать два параметра одновременно:
+            # Z-СПРЕД (для части выпуска облигаций, которая обеспечивается кредитами без субсидий) и
+            # ТРЕБУЕМАЯ НАДБАВКА (для части выпуска облигаций, которая обеспечивается кредитами с субсидиями):
+            else:
+
+                if z & p and not g and not d and not c and not r:
+
+                    self.calculationType = CALCULATION_TYPE.SET_Z_PRM
+
+                    self.zSpread = float(self.pricingParameters['zSpread'])
+                    if not CONSTRAINTS.ZSPRD_MIN <= self.zSpread <= CONSTRAINTS.ZSPRD_MAX:
+                        raise Exception(CONSTRAINTS.ZSPRD_EXCEP)
+
+                    self.requiredKeyRatePremium = float(self.pricingParameters['requiredKeyRatePremium'])
+                    if not CONSTRAINTS.PREMI_MIN <= self.requiredKeyRatePremium <= CONSTRAINTS.PREMI_MAX:
+                        raise Exception(CONSTRAINTS.PREMI_EXCEP)
+
+                else:
+                    raise Exception(EXCEPTIONS._6.format(np.round(self.governProgramsFraction, 2)))
+
+        ####################################################################################################################################
 
     def poolCashflowModel(self):
 
@@ -1185,7 +1316,9 @@ class Convention(object):
                                                          progress_bar=self.progressBar,
                                                          connection_id=self.connectionId,
                                                          current_percent=self.currentPercent,
-                                                         status_delta=self.statusDelta)
+                                                         status_delta=self.statusDelta,
+                                                         timer=self.timer,
+                                                         interactive_graph=self.outputGraphs)
 
         # [ОБНОВЛЕНИЕ СТАТУСА РАСЧЕТА]
         self.currentPercent += self.statusDelta * 10.0
@@ -1336,7 +1469,9 @@ class Convention(object):
                                             progress_bar=self.progressBar,
                                             connection_id=self.connectionId,
                                             current_percent=self.currentPercent,
-                                            status_delta=self.statusDelta)
+                                            status_delta=self.statusDelta,
+                                            timer=self.timer,
+                                            interactive_graph=False)
 
             # [ОБНОВЛЕНИЕ СТАТУСА РАСЧЕТА]
             self.currentPercent += self.statusDelta * 10.0
@@ -1761,85 +1896,28 @@ class Convention(object):
                 if self.mbsModel[part]['reinvestment'].empty:
                     continue
 
-                self.reinvModel[part] = pd.DataFrame([])
-
-                # Оставляем платежи с начала расчетного периода Предыдущей от даты оценки даты купонной выплаты. Например, если
+                # Учитываем платежи с начала расчетного периода Предыдущей от даты оценки даты купонной выплаты. Например, если
                 # Предыдущая от даты оценки дата равна 28.03.2024, то, в случае квартального купона, такой датой станет 01.12.2024:
                 start_date = None
                 if self.previousCouponDate is not None:
-                    index = self.couponsStructure['couponDate'] == self.previousCouponDate
-                    start_date = self.couponsStructure[index]['paymentPeriodStart'].values[0].astype(d_type)
-                    index = self.mbsModel[part]['reinvestment']['date'] >= start_date
-                    self.mbsModel[part]['reinvestment'] = self.mbsModel[part]['reinvestment'][index]
+                    index = coupon_index(self.previousCouponDate, self.couponsStructure)
+                    start_date = self.couponsStructure['paymentPeriodStart'].values[index].astype(d_type)
                 else:
                     start_date = self.deliveryDate
 
-                # Поток поступлений на баланс Ипотечного агента амортизации, процентов и субсидий по ипотечному покрытию:
-                c = ['date', 'amt', 'yld', 'subsidy']
-                self.mbsModel[part]['reinvestment'] = self.mbsModel[part]['reinvestment'][c]
-                self.mbsModel[part]['reinvestment'] = self.mbsModel[part]['reinvestment'].groupby('date', as_index=False).sum()
-                zero_cashflow = self.mbsModel[part]['reinvestment'][['amt', 'yld', 'subsidy']].sum(axis=1) == 0.0
-                self.mbsModel[part]['reinvestment'] = self.mbsModel[part]['reinvestment'][~zero_cashflow]
-                self.mbsModel[part]['reinvestment'].sort_values('date', inplace=True)
-                self.mbsModel[part]['reinvestment'].reset_index(inplace=True, drop=True)
-
-                # Формируем даты с начала расчетного периода Предыдущей от даты оценки даты купонной выплаты включительно
-                # до даты погашения не включительно. На эти даты будем формировать баланс Ипотечного агента:
+                # Баланс Ипотечного агента формируется с начала расчетного периода Предыдущей от даты оценки даты купонной выплаты
+                # включительно до даты погашения не включительно. Расчет баланса, списаний и начисленных процентов производится
+                # в reinvestmentModel (модуль reinvestment_model):
                 end_date = self.modelRedemptionDate - self.writeOffDays
-                self.reinvModel[part]['date'] = np.arange(start_date, end_date + day)
-
-                # Поток поступлений на баланс Ипотечного агента по амортизации, процентам и субсидиям на каждый день:
-                self.reinvModel[part] = self.reinvModel[part].merge(self.mbsModel[part]['reinvestment'], how='left', on='date').fillna(0.0)
-
-                # Формируем поток совокупных поступлений на каждый день:
-                self.reinvModel[part]['flow'] = self.reinvModel[part][['amt', 'yld', 'subsidy']].sum(axis=1)
-
-                # Далее необходимо определить, расчетному периоду какой купонной выплаты принадлежит платеж flow.
-                # Для этого определяем месяц платежа и соответствующую ему дату купонной выплаты:
-                self.reinvModel[part]['paymentMonth'] = self.reinvModel[part]['date'].values.astype(m_type).astype(d_type)
-                c = ['paymentMonth', 'couponDate']
-                self.reinvModel[part] = self.reinvModel[part].merge(self.paymentsStructure[c], how='left', on='paymentMonth')
-
-                # Деньги будут списываться не в саму дату купонной выплаты, а в день выплаты свопа, поэтому вычитаем из couponDate
-                # необходимое количество дней и переименовываем couponDate в writeOffDate:
-                self.reinvModel[part]['couponDate'] = self.reinvModel[part]['couponDate'].values - self.writeOffDays
-                self.reinvModel[part].rename(columns={'couponDate': 'writeOffDate'}, inplace=True)
-                # Это значит, что указанная сумма flow будет списана с баланса в указанную writeOffDate.
-
-                # Группируем в отдельной таблице суммы списаний:
-                writeOffs = self.reinvModel[part][['writeOffDate', 'flow']].groupby('writeOffDate', as_index=False).sum(numeric_only=True)
-                writeOffs.rename(columns={'writeOffDate': 'date', 'flow': 'writeOff'}, inplace=True)
-
-                # Мерджим к reinvModel суммы списаний:
-                self.reinvModel[part] = self.reinvModel[part].merge(writeOffs, how='left', on='date').fillna(0.0)
-
-                # Баланс Ипотечного агента на каждую дату:
-                self.reinvModel[part]['account'] = (self.reinvModel[part]['flow'] - self.reinvModel[part]['writeOff']).cumsum()
-
-                # Мерджим из модели макроэкономики значения Ключевой ставки, по которым будут рассчитаны значения RUONIA:
-                self.reinvModel[part] = pd.merge_asof(self.reinvModel[part], self.macroModel['allKeyRates'],
-                                                      direction='backward', on='date').rename(columns={'key_rate': 'keyRate'})
-
-                # Рассчитываем значения ставки RUONIA (КС - 0.2%) и из нее сразу значение ставки реинвестирования:
-                self.reinvModel[part]['reinvestingRate'] = np.maximum(self.reinvModel[part]['keyRate'] - 0.2 - self.deductionRUONIA, 0.0)
-
-                # Начислено за каждый день (без капитализации процентов):
-                principal = self.reinvModel[part]['account'].values
-                rate = self.reinvModel[part]['reinvestingRate'].values
-                self.reinvModel[part]['reinvestment'] = np.round(principal * rate / 100.0 / 365.0, 2)
-
-                # Сумма начисленных процентов за каждый paymentMonth:
-                c = ['paymentMonth', 'reinvestment']
-                self.reinvModel[part] = self.reinvModel[part][c].groupby('paymentMonth', as_index=False).sum(numeric_only=True)
-
-                # Далее необходимо определить, расчетному периоду какой купонной выплаты принадлежит платеж reinvestment.
-                # Для этого определяем месяц платежа и соответствующую ему дату купонной выплаты:
-                c = ['paymentMonth', 'couponDate']
-                self.reinvModel[part] = self.reinvModel[part].merge(self.paymentsStructure[c], how='left', on='paymentMonth')
-
-                # Сумма начисленных процентов в соответствии с датой купонной выплаты:
-                c = ['couponDate', 'reinvestment']
-                self.reinvModel[part] = self.reinvModel[part][c].groupby('couponDate', as_index=False).sum(numeric_only=True)
+                self.timer.start('reinvestmentModel')
+                self.reinvModel[part] = reinvestmentModel(cashflow=self.mbsModel[part]['reinvestment'],
+                                                          payments_structure=self.paymentsStructure,
+                                                          all_key_rates=self.macroModel['allKeyRates'],
+                                                          start_date=start_date,
+                                                          end_date=end_date,
+                                                          write_off_days=self.writeOffDays,
+                                                          deduction_ruonia=self.deductionRUONIA)
+                self.timer.stop()
 
         # -------------------------------------------------------------------------------------------------------------------------------- #
         # ----- РАСЧЕТ РАСХОДОВ ИПОТЕЧНОГО АГЕНТА И ПЛАВАЮЩИХ СУММ ----------------------------------------------------------------------- #
@@ -2122,27 +2200,35 @@ class Convention(object):
 
         # ----- ТЕХНИЧЕСКИЕ ПЕРЕМЕННЫЕ --------------------------------------------------------------------------------------------------- #
 
+        # [КОНТЕКСТ ДИСКОНТИРОВАНИЯ: СРОКИ В ДНЯХ И ГОДАХ, ЗНАЧЕНИЯ КБД С УЧЕТОМ СЦЕНАРНОГО СДВИГА]
+        self.discounting = DiscountingContext(self.pricingDate, self.zcycParameters, self.zcycShift)
+
         # [КОЛИЧЕСТВО ЛЕТ МЕЖДУ ДАТОЙ ОЦЕНКИ И БУДУЩЕЙ ВЫПЛАТОЙ КУПОНА]
-        self.yearsToCouponDate = (self.mbsCashflow['couponDate'].values - self.pricingDate) / np.timedelta64(1, 'D') / 365.0
+        self.yearsToCouponDate = self.discounting.years(self.mbsCashflow['couponDate'].values)
 
         # [СОКРАЩЕНИЯ]
         future = self.mbsCashflow['couponDate'] > self.pricingDate
         future_model = future & (self.mbsCashflow['cashflowType'] == 0)
-        t_future = self.yearsToCouponDate[future]
-        t_future_model = self.yearsToCouponDate[future_model]
+        grid_future = self.discounting.grid(self.mbsCashflow['couponDate'].values[future])
+        grid_future_model = self.discounting.grid(self.mbsCashflow['couponDate'].values[future_model])
+        t_future = grid_future.t
+        t_future_model = grid_future_model.t
         bond_coupons = self.mbsCashflow['couponPayment'].astype(float).values
         bond_principals = self.mbsCashflow['principalStartPeriod'].astype(float).values
         cf = np.round(self.mbsCashflow['amortization'][future].values + self.mbsCashflow['couponPayment'][future].values, 2)
 
-        # [ФАКТОР ДИСКОНТИРОВАНИЯ ПО КБД С Z-СПРЕДОМ]
-        self.dfZCYCPlusZ = lambda Z, t: (1.0 + Y(self.zcycParameters, t) / 10000.0 + Z / 10000.0) ** -t
+        # [СПОТ-ДОХОДНОСТЬ КБД С УЧЕТОМ СЦЕНАРНОГО СДВИГА]
+        self.zcycRate = self.discounting.rate
+
+        # [ФАКТОР ДИСКОНТИРОВАНИЯ ПО КБД С Z-СПРЕДОМ] (для дат потоков по облигации — grid_future.df и grid_future_model.df)
+        self.dfZCYCPlusZ = lambda Z, t: np.exp(-t * np.log1p((self.zcycRate(t) + Z) / 10000.0))
         self.defaultZSpread = 120.0
 
         # [ФАКТОР ДИСКОНТИРОВАНИЯ ПО YTM]
-        self.dfYTM = lambda YTM: (1.0 + YTM / 100.0) ** -t_future
+        self.dfYTM = grid_future.df_ytm
 
         # [ФУНКЦИЯ РАСЧЕТА ДЮРАЦИИ МАКОЛЕЯ]
-        self.durationMacaulay_func = lambda YTM: max(0.001, (t_future * cf * self.dfYTM(YTM)).sum() / (cf * self.dfYTM(YTM)).sum())
+        self.durationMacaulay_func = lambda YTM: max(0.001, grid_future.duration_ytm(cf, YTM)[0])
 
         # ----- КУПОННЫЕ ВЫПЛАТЫ В ПРОЦЕНТАХ ГОДОВЫХ ОТ НЕПОГАШЕННОГО НОМИНАЛА ----------------------------------------------------------- #
         self.mbsCashflow['couponPaymentPercent'] = np.round(bond_coupons / bond_principals * 365.0 / coupon_days * 100.0, 2)
@@ -2201,11 +2287,11 @@ class Convention(object):
             if self.poolType == POOL_TYPE.FLT:
                 # Для расчета Модельной фиксированной надбавки к Ключевой ставке при субсидируемом ипотечном покрытии:
                 period = future
-                df = self.dfZCYCPlusZ(self.defaultZSpread, t_future)
+                df = grid_future.df(self.defaultZSpread)
             elif self.poolType == POOL_TYPE.MIX:
                 # Для расчета Модельной фиксированной надбавки к Ключевой ставке при смешанном ипотечном покрытии:
                 period = future_model
-                df = self.dfZCYCPlusZ(self.defaultZSpread, t_future_model)
+                df = grid_future_model.df(self.defaultZSpread)
 
             # Технические переменные:
             p = self.mbsCashflowFloat['principalStartPeriod'].astype(float).values[period]
@@ -2219,8 +2305,12 @@ class Convention(object):
             actual_coupons = self.mbsCashflowFloat['couponPayment'].values[period]
             actual_npv = (df * actual_coupons).sum()
 
-            # Модельная фактическая надбавка к Ключевой ставке:
+            # Модельная фактическая надбавка к Ключевой ставке. PV выплат — ступенчатая функция надбавки (выплаты округляются до копеек),
+            # а по найденной надбавке ниже заново рассчитываются округленные выплаты, поэтому решение ищется минимизацией квадрата
+            # отклонения, а не методом Ньютона: точка на краю ступени (решение newton_root) может дать выплаты, отличающиеся на копейку:
+            self.timer.start('modelKeyRatePremiumSolver')
             premium_value = minimize(lambda prm: (premium_npv(prm) - actual_npv) ** 2.0, np.array([100.0]), method='Nelder-Mead').x[0]
+            self.timer.stop()
             self.modelKeyRatePremium = premium_value
 
             # Выплаты по фактической надбавке:
@@ -2241,12 +2331,12 @@ class Convention(object):
 
         # ----- ГРЯЗНАЯ ЦЕНА ------------------------------------------------------------------------------------------------------------- #
         if self.calculationType == CALCULATION_TYPE.SET_ZSPRD:
-            self.dirtyPrice = (self.dfZCYCPlusZ(self.zSpread, t_future) * cf).sum() / self.currentBondPrincipal * 100.0
+            self.dirtyPrice = (grid_future.df(self.zSpread) * cf).sum() / self.currentBondPrincipal * 100.0
 
         elif self.calculationType == CALCULATION_TYPE.SET_GSPRD:
-            self.ytm = minimize(lambda YTM:
-                                (self.gSpread - YTM * 100.0 + Y(self.zcycParameters, self.durationMacaulay_func(YTM))) ** 2.0,
-                                np.array([0.0])).x[0]
+            self.timer.start('gSpreadSolver')
+            self.ytm = g_spread_ytm(grid_future, cf, self.gSpread, self.zcycRate)
+            self.timer.stop()
             self.dirtyPrice = (self.dfYTM(self.ytm) * cf).sum() / self.currentBondPrincipal * 100.0
 
         elif self.calculationType == CALCULATION_TYPE.SET_DIRTY:
@@ -2259,7 +2349,7 @@ class Convention(object):
             flows = self.mbsCashflowFloat if self.couponType == COUPON_TYPE.CHG else self.mbsCashflow
             prem_act = flows['fixedPremiumPayments'].values[future]
             prem_req = flows['requiredPremiumPayments'].values[future]
-            df = self.dfZCYCPlusZ(self.requiredKeyRatePremium, t_future)
+            df = grid_future.df(self.requiredKeyRatePremium)
             self.dirtyPrice = 100.0 + ((prem_act - prem_req) * df).sum() / self.currentBondPrincipal * 100.0 + self.accruedCouponInterest
 
         elif self.calculationType == CALCULATION_TYPE.SET_COUPN or self.calculationType == CALCULATION_TYPE.SET_FXPRM:
@@ -2268,12 +2358,12 @@ class Convention(object):
         elif self.calculationType == CALCULATION_TYPE.SET_Z_PRM:
 
             cf_fixed = self.mbsCashflowFixed['amortization'][future].values + self.mbsCashflowFixed['couponPayment'][future].values
-            npv_fixed = (self.dfZCYCPlusZ(self.zSpread, t_future) * cf_fixed).sum()
+            npv_fixed = (grid_future.df(self.zSpread) * cf_fixed).sum()
 
             prem_act = self.mbsCashflowFloat['fixedPremiumPayments'].values[future_model]
             prem_req = self.mbsCashflowFloat['requiredPremiumPayments'].values[future_model]
             nominal = self.mbsCashflowFloat['principalStartPeriod'].values[future_model][0]
-            npv_float = nominal + ((prem_act - prem_req) * self.dfZCYCPlusZ(self.requiredKeyRatePremium, t_future_model)).sum()
+            npv_float = nominal + ((prem_act - prem_req) * grid_future_model.df(self.requiredKeyRatePremium)).sum()
 
             # В том случае, если значение следующей после Даты оценки купонной выплаты известно, НКД будет по всему выпуску (полностью)
             # включен в приведенную стоимость ИЦБ в фиксированной части (потому что по построению вся выплата дисконтируется по
@@ -2306,8 +2396,9 @@ class Convention(object):
 
             types = [CALCULATION_TYPE.SET_ZSPRD, CALCULATION_TYPE.SET_DIRTY, CALCULATION_TYPE.SET_CLEAN, CALCULATION_TYPE.SET_COUPN]
             if self.calculationType in types:
-                self.ytm = minimize(lambda YTM: ((cf * self.dfYTM(YTM)).sum() / self.currentBondPrincipal * 10000.0 -
-                                                 self.dirtyPrice * 100.0) ** 2.0, np.array([0.0])).x[0]
+                self.timer.start('ytmSolver')
+                self.ytm = newton_root(lambda YTM: grid_future.price_ytm(cf, YTM), self.dirtyPrice / 100.0 * self.currentBondPrincipal, 0.0)
+                self.timer.stop()
 
             elif self.calculationType == CALCULATION_TYPE.SET_GSPRD:
                 pass  # YTM УЖЕ ОПРЕДЕЛЕНА НА ЭТАПЕ ОПРЕДЕЛЕНИЯ ГРЯЗНОЙ ЦЕНЫ
@@ -2323,8 +2414,9 @@ class Convention(object):
                 pass
 
             elif self.calculationType in types:
-                self.zSpread = minimize(lambda Z: ((cf * self.dfZCYCPlusZ(Z, t_future)).sum() / self.currentBondPrincipal * 10000.0 -
-                                                   self.dirtyPrice * 100.0) ** 2.0, np.array([0.0])).x[0]
+                self.timer.start('zSpreadSolver')
+                self.zSpread = newton_root(lambda Z: grid_future.price(cf, Z), self.dirtyPrice / 100.0 * self.currentBondPrincipal, 0.0)
+                self.timer.stop()
 
         else:
             pass
@@ -2334,7 +2426,7 @@ class Convention(object):
 
             types = [CALCULATION_TYPE.SET_ZSPRD, CALCULATION_TYPE.SET_DIRTY, CALCULATION_TYPE.SET_CLEAN, CALCULATION_TYPE.SET_COUPN]
             if self.calculationType in types:
-                self.gSpread = self.ytm * 100.0 - Y(self.zcycParameters, self.durationMacaulay_func(self.ytm))
+                self.gSpread = self.ytm * 100.0 - self.zcycRate(self.durationMacaulay_func(self.ytm))
 
             elif self.calculationType == CALCULATION_TYPE.SET_GSPRD:
                 pass
@@ -2349,10 +2441,13 @@ class Convention(object):
                 flows = self.mbsCashflowFloat if self.couponType == COUPON_TYPE.CHG else self.mbsCashflow
                 prem_act = flows['fixedPremiumPayments'].values[future]
                 prem_req = lambda prm: np.round(bond_principals[future] * prm / 10000.0 * coupon_days[future] / 365.0, 2)
-                prem_req_price = lambda prm: (100.0 + ((prem_act - prem_req(prm)) * self.dfZCYCPlusZ(prm, t_future)).sum() /
-                                              self.currentBondPrincipal * 100.0 + self.accruedCouponInterest)
+                prem_req_slope = -bond_principals[future] / 10000.0 * coupon_days[future] / 365.0
+                prem_req_npv = lambda prm: grid_future.price(prem_act - prem_req(prm), prm, prem_req_slope)
+                prem_req_target = (self.dirtyPrice - 100.0 - self.accruedCouponInterest) / 100.0 * self.currentBondPrincipal
 
-                premium = minimize(lambda prm: (prem_req_price(prm) - self.dirtyPrice) ** 2.0, np.array([100.0]), method='Nelder-Mead').x[0]
+                self.timer.start('requiredKeyRatePremiumSolver')
+                premium = newton_root(prem_req_npv, prem_req_target, 100.0, method='Nelder-Mead')
+                self.timer.stop()
                 self.requiredKeyRatePremium = premium
 
             elif self.calculationType == CALCULATION_TYPE.SET_FXPRM:
@@ -2376,110 +2471,242 @@ class Convention(object):
                     spread = self.requiredKeyRatePremium
                 elif self.couponType == COUPON_TYPE.CHG and self.poolType == POOL_TYPE.MIX:
                     spread = self.zSpread
-                df = self.dfZCYCPlusZ(spread, t_future)
+                df = grid_future.df(spread)
                 self.durationMacaulay = max(0.001, (t_future * cf * df).sum() / (cf * df).sum())
 
         # ----- МОДИФИЦИРОВАННАЯ ДЮРАЦИЯ ------------------------------------------------------------------------------------------------- #
         if self.couponType == COUPON_TYPE.FXD or (self.couponType == COUPON_TYPE.CHG and self.poolType == POOL_TYPE.FXD):
             self.durationModified = self.durationMacaulay / (1.0 + self.ytm / 100.0)
 
-        # ----- ОЦЕНКА СВОПА С ИПОТЕЧНЫМ АГЕНТОМ ----------------------------------------------------------------------------------------- #
-        if self.swapPricing:
+        # ----- СПРЕДОВАЯ ДЮРАЦИЯ, ВЫПУКЛОСТЬ И DV01 ------------------------------------------------------------------------------------- #
+        # Первая и вторая производные грязной цены по спреду, по которому дисконтируется денежный поток (Z-спред — для фиксированного
+        # купона и стандартного ипотечного покрытия, Требуемая фиксированная надбавка к Ключевой ставке — для плавающего купона и
+        # субсидируемого ипотечного покрытия, оба спреда одновременно — для смешанного ипотечного покрытия), рассчитываются аналитически
+        # по денежному потоку базового расчета. Выплаты по требуемой надбавке меняются вместе с надбавкой:
+        sensitivity = None
+        if self.couponType == COUPON_TYPE.FXD or (self.couponType == COUPON_TYPE.CHG and self.poolType == POOL_TYPE.FXD):
+            if self.zSpread is not None:
+                sensitivity = grid_future.price(cf, self.zSpread)
 
-            # Формируем основу модели свопа:
-            c = ['couponDate', 'couponDays', 'principalStartPeriod']
-            self.swapModelAgent = self.mbsCashflow[c].copy(deep=True)
+        elif self.couponType == COUPON_TYPE.FLT or (self.couponType == COUPON_TYPE.CHG and self.poolType == POOL_TYPE.FLT):
+            if self.requiredKeyRatePremium is not None:
+                flows = self.mbsCashflowFloat if self.couponType == COUPON_TYPE.CHG else self.mbsCashflow
+                prem_act = flows['fixedPremiumPayments'].values[future]
+                prem_req_slope = -bond_principals[future] / 10000.0 * coupon_days[future] / 365.0
+                prem_req = np.round(-prem_req_slope * self.requiredKeyRatePremium, 2)
+                sensitivity = grid_future.price(prem_act - prem_req, self.requiredKeyRatePremium, prem_req_slope)
 
-            # Непогашенный объем выпуска до выплаты купона:
-            self.swapModelAgent['principalStartPeriod'] = np.round(self.swapModelAgent['principalStartPeriod'].values*self.numberOfBonds,2)
+        elif self.calculationType == CALCULATION_TYPE.SET_Z_PRM:
+            cf_fixed = self.mbsCashflowFixed['amortization'][future].values + self.mbsCashflowFixed['couponPayment'][future].values
+            prem_act = self.mbsCashflowFloat['fixedPremiumPayments'].values[future_model]
+            prem_req = self.mbsCashflowFloat['requiredPremiumPayments'].values[future_model]
+            prem_req_slope = -(self.mbsCashflowFloat['principalStartPeriod'].astype(float).values[future_model] / 10000.0 *
+                               self.mbsCashflowFloat['couponDays'].astype(float).values[future_model] / 365.0)
+            sensitivity = np.add(grid_future.price(cf_fixed, self.zSpread),
+                                 grid_future_model.price(prem_act - prem_req, self.requiredKeyRatePremium, prem_req_slope))
+
+        self.spreadDuration, self.spreadConvexity, self.dv01, self.dv01Rub = None, None, None, None
+        if sensitivity is not None:
+            dirty_price_rub = self.dirtyPrice / 100.0 * self.currentBondPrincipal
+            self.spreadDuration = -sensitivity[1] / dirty_price_rub * 10000.0
+            self.spreadConvexity = sensitivity[2] / dirty_price_rub * 10000.0 ** 2.0
+            self.dv01 = -sensitivity[1] / self.currentBondPrincipal * 100.0
+            self.dv01Rub = -sensitivity[1]
 
-            # Рассчитываем фиксированные суммы. Т.к. своп считается от лица ДОМ.РФ в отношении Ипотечного агента, фиксированные суммы
-            # указываются со знаком "минус":
-            self.swapModelAgent['fixedSum'] = -np.round(self.mbsCashflow['couponPayment'].values * self.numberOfBonds, 2)
+        # ----- ОЦЕНКА СВОПА С ИПОТЕЧНЫМ АГЕНТОМ ----------------------------------------------------------------------------------------- #
+        if self.swapPricing:
 
-            # Добавляем модельные плавающие суммы и их компоненты:
-            c = ['couponDate', 'yield', 'subsidy', 'reinvestment', 'lumpSumSwap', 'expense', 'accruedYield', 'accruedSubsidy', 'floatSum']
-            self.swapModelAgent = self.swapModelAgent.merge(self.mbsModel['total']['inflow'][c], how='left', on='couponDate')
+            self.timer.start('swapPricing')
 
-            # Указываем, когда именно пройдет неттинг по свопу:
-            self.swapModelAgent['couponDate'] -= self.writeOffDays
-            self.swapModelAgent.rename(columns={'couponDate': 'nettingDate'}, inplace=True)
-
-            # Оставляем только платежи, которые состоятся строго после Даты оценки:
-            future = self.swapModelAgent['nettingDate'] > self.pricingDate
-            self.swapModelAgent = self.swapModelAgent[future].reset_index(drop=True)
+            # Потоки по свопу с Ипотечным агентом строго после Даты оценки (см. описание функции swapCashflow). Т.к. своп считается от лица
+            # ДОМ.РФ в отношении Ипотечного агента, фиксированные суммы указываются со знаком "минус":
+            swap = swapCashflow(coupon_dates=self.mbsCashflow['couponDate'].values.astype(d_type),
+                                coupon_days=self.mbsCashflow['couponDays'].values,
+                                principals=self.mbsCashflow['principalStartPeriod'].values,
+                                coupon_payments=self.mbsCashflow['couponPayment'].values,
+                                inflow=self.mbsModel['total']['inflow'],
+                                number_of_bonds=self.numberOfBonds,
+                                write_off_days=self.writeOffDays,
+                                pricing_date=self.pricingDate)
 
             # Проверяем, не была ли уже выплачена часть плавающих сумм:
             if self.monthlyFloatingSums and self.couponPeriod == 3:
                 # Берем расчетный период ближайшей по потоку по свопу купонной выплаты (payment_period):
-                index = self.mbsModel['total']['pool']['couponDate'] == self.swapModelAgent['nettingDate'].values[0] + self.writeOffDays
-                payment_period = self.mbsModel['total']['pool'][index].copy(deep=True)
+                pool = self.mbsModel['total']['pool']
+                index = pool['couponDate'].values.astype(d_type) == swap['nettingDate'][0] + self.writeOffDays
                 # Для каждого месяца этого расчетного периода указываем дату, в которую ипотечный агент переведет по свопу процентные
                 # поступления за данный месяц (swapPaymentDate):
-                payment_period['swapPaymentDate'] = (payment_period['paymentMonth'].values.astype(m_type) + month).astype(d_type) + 20 * day
+                swap_payment_dates = (pool['paymentMonth'].values[index].astype(m_type) + month).astype(d_type) + 20 * day
                 # Определяем сумму процентных поступлений, которые уже были переведены по свопу по состоянию на дату оценки:
-                index = payment_period['swapPaymentDate'] <= self.pricingDate
-                yield_to_deduct = payment_period['yield'][index].sum()
+                yield_to_deduct = pool['yield'].values[index][swap_payment_dates <= self.pricingDate].sum()
                 # Вычитаем данную сумму из следующей плавающей суммы:
-                self.swapModelAgent.loc[0, 'yield'] -= yield_to_deduct
-                self.swapModelAgent.loc[0, 'floatSum'] -= yield_to_deduct
+                swap['yield'][0] -= yield_to_deduct
+                swap['floatSum'][0] -= yield_to_deduct
 
             # Рассчитываем фиксированные и плавающие суммы в терминах процентов годовых:
-            coupon_days = self.swapModelAgent['couponDays'].values
-            issue_principals = self.swapModelAgent['principalStartPeriod'].values
-            fixed_sums = self.swapModelAgent['fixedSum'].values
-            float_sums = self.swapModelAgent['floatSum'].values
-
-            self.swapModelAgent['fixedSumPercent'] = np.round(-fixed_sums / issue_principals * 365.0 / coupon_days * 100.0, 2)
-            self.swapModelAgent['floatSumPercent'] = np.round(float_sums / issue_principals * 365.0 / coupon_days * 100.0, 2)
-            self.swapModelAgent.drop(columns=['couponDays', 'principalStartPeriod'], inplace=True)
+            fixed_sums, float_sums = swap['fixedSum'], swap['floatSum']
+            swap['fixedSumPercent'] = np.round(-fixed_sums / swap['issuePrincipal'] * 365.0 / swap['couponDays'] * 100.0, 2)
+            swap['floatSumPercent'] = np.round(float_sums / swap['issuePrincipal'] * 365.0 / swap['couponDays'] * 100.0, 2)
 
-            # Количество лет между будущей датой неттинга по свопу и Датой оценки:
-            t = (self.swapModelAgent['nettingDate'].values - self.pricingDate) / np.timedelta64(1, 'D') / 365.0
-
-            # Фактор дисконтирования в зависимости от типа купона:
+            # Спред дисконтирования в зависимости от типа купона:
             z_spread = self.requiredKeyRatePremium if self.couponType is COUPON_TYPE.FLT else self.zSpread
-            df = self.dfZCYCPlusZ(z_spread, t)
+            zcyc_shifts = None if self.zcycShift is None else [self.zcycShift]
 
-            # Стоимость свопа с ипотечным агентом с точки зрения ДОМ.РФ в рублях:
-            self.swapPriceAgentRub = np.round(np.sum((fixed_sums + float_sums) * df), 2)
+            # Стоимость свопа с ипотечным агентом с точки зрения ДОМ.РФ в рублях и дюрация свопа (используется при расчете CVA/DVA):
+            valuation = swapValuation(swap['nettingDate'], fixed_sums, float_sums, self.pricingDate, self.zcycParameters, z_spread,
+                                      zcyc_shifts, self.discounting)
+            self.swapPriceAgentRub = valuation['priceRub'] if zcyc_shifts is None else valuation['priceRub'][0]
+            self.durationMacaulaySwapFix = valuation['durationMacaulaySwapFix']
 
             # Стоимость свопа с ипотечным агентом с точки зрения ДОМ.РФ в % от непогашенного номинала выпуска облигаций:
             self.swapPriceAgent = self.swapPriceAgentRub / (self.currentBondPrincipal * self.numberOfBonds) * 100.0
 
-            # Дюрация свопа (используется при расчете CVA/DVA):
-            self.durationMacaulaySwapFix = ((fixed_sums) * t).sum() / (fixed_sums).sum()
+            c = ['nettingDate', 'fixedSum'] + swap_float_components + ['fixedSumPercent', 'floatSumPercent']
+            self.swapModelAgent = pd.DataFrame({key: swap[key] for key in c})
 
             if self.swapWithOriginator:
-                self.swapModelOriginator = self.swapModelAgent[['nettingDate', 'fixedSum', 'floatSum']]
-
-                # Потоки по свопу с оригинатором имеют обратный знак по сравнению с потоками с ипотечным агентом:
-                self.swapModelOriginator['fixedSum'] *= -1
-                self.swapModelOriginator['floatSum'] *= -1
-
-                # Своп с оригинатором неттится в среднем через два дня после неттинга по свопу с ипотечным агентом:
-                self.swapModelOriginator['nettingDate'] += 2 * day
-                future = self.swapModelOriginator['nettingDate'] > self.pricingDate
-                self.swapModelOriginator = self.swapModelOriginator[future].reset_index(drop=True)
-
-                # Количество лет между будущей датой неттинга по свопу и Датой оценки:
-                t = (self.swapModelOriginator['nettingDate'].values - self.pricingDate) / np.timedelta64(1, 'D') / 365.0
-                df = self.dfZCYCPlusZ(z_spread, t)
+                # Потоки по свопу с оригинатором имеют обратный знак по сравнению с потоками с ипотечным агентом. Своп с оригинатором
+                # неттится в среднем через два дня после неттинга по свопу с ипотечным агентом:
+                netting_dates = swap['nettingDate'] + 2 * day
+                future = netting_dates > self.pricingDate
+                self.swapModelOriginator = pd.DataFrame({'nettingDate': netting_dates[future],
+                                                         'fixedSum': -fixed_sums[future],
+                                                         'floatSum': -float_sums[future]})
 
                 # Стоимость свопа с оригинатором с точки зрения ДОМ.РФ в рублях:
-                fixed_sums = self.swapModelOriginator['fixedSum'].values
-                float_sums = self.swapModelOriginator['floatSum'].values
-                self.swapPriceOriginatorRub = np.round(np.sum((fixed_sums + float_sums) * df), 2)
+                valuation = swapValuation(netting_dates[future], -fixed_sums[future], -float_sums[future], self.pricingDate,
+                                          self.zcycParameters, z_spread, zcyc_shifts, self.discounting)
+                self.swapPriceOriginatorRub = valuation['priceRub'] if zcyc_shifts is None else valuation['priceRub'][0]
 
                 # Стоимость свопа с оригинатором с точки зрения ДОМ.РФ в % от непогашенного номинала выпуска облигаций:
                 self.swapPriceOriginator = self.swapPriceOriginatorRub / (self.currentBondPrincipal * self.numberOfBonds) * 100.0
 
+            self.timer.stop()
+
         # [ОБНОВЛЕНИЕ СТАТУСА РАСЧЕТА]
         self.currentPercent = 99.0
         update(self.connectionId, self.currentPercent, self.progressBar)
 
         ####################################################################################################################################
 
+    def mbsRiskMetrics(self, modelled_state):
+
+        """
+        ------------------------------------------------------------------------------------------------------------------------------------
+        Расчет показателей процентного риска ИЦБ ДОМ.РФ
+        ------------------------------------------------------------------------------------------------------------------------------------
+
+        Во всех сценариях в качестве опорной ценовой метрики используется спред, рассчитанный в базовом расчете (Z-спред для облигаций с
+        фиксированным купоном и для стандартного ипотечного покрытия, Требуемая фиксированная надбавка к Ключевой ставке — для плавающего
+        купона и субсидируемого ипотечного покрытия, оба спреда — для смешанного ипотечного покрытия). Если задана фактическая надбавка
+        (fixedKeyRatePremium), облигация во всех сценариях оценивается по номиналу. Перед расчетом проверяется, что сценарий без сдвига
+        воспроизводит грязную цену базового расчета. Рассчитываются:
+
+            1. effectiveDuration  — эффективная дюрация: изменение грязной цены при параллельном сдвиге на ±riskShift б.п. одновременно
+                                    КБД и Модельной траектории Ключевой ставки. В каждом из двух сценариев заново рассчитываются
+                                    Модельная траектория среднемесячной ставки рефинансирования ипотеки, денежный поток по ипотечному
+                                    покрытию (CPR по S-кривым) и по ИЦБ ДОМ.РФ (в том числе купоны, зависящие от Ключевой ставки)
+            2. effectiveConvexity — эффективная выпуклость по тем же двум сценариям
+            3. keyRateDurations   — дюрации ключевых сроков КБД (сроки krd_tenors): изменение грязной цены при сдвиге КБД на ±riskShift б.п.
+                                    в окрестности ключевого срока (см. функцию krd_weights). Денежный поток при этом не пересчитывается
+                                    (сдвигается только кривая дисконтирования), поэтому сценарии ключевых сроков требуют только повторного
+                                    расчета ценовых метрик
+
+        Сценарии эффективной дюрации рассчитываются по состоянию до расчета денежного потока (initialState), поэтому данные, загруженные
+        по API, используются повторно. Сценарии ключевых сроков — по состоянию после расчета денежного потока (modelled_state)
+
+        ------------------------------------------------------------------------------------------------------------------------------------
+        """
+
+        shift = self.riskShift
+        dy = shift / 10000.0
+        price = self.dirtyPrice
+
+        # Сценарий без сдвига должен воспроизводить грязную цену базового расчета (иначе опорная ценовая метрика сценариев задана
+        # неверно, и все показатели риска отражают не сдвиг ставок, а расхождение сценариев с базовым расчетом). Допустимое расхождение —
+        # одна копейка на облигацию, так как выплаты по надбавкам округляются до копеек:
+        zero = self.riskScenario(modelled_state, lambda t: 0.0)
+        if abs(zero - price) > 0.01 / self.currentBondPrincipal * 100.0:
+            raise Exception(EXCEPTIONS._25.format(np.round(zero, 6), np.round(price, 6)))
+
+        # ----- ЭФФЕКТИВНАЯ ДЮРАЦИЯ И ВЫПУКЛОСТЬ ----------------------------------------------------------------------------------------- #
+        # Сдвинутая Модельная траектория Ключевой ставки задается как пользовательская траектория: Ключевая ставка, действующая на Опорную
+        # дату модели Ключевой ставки, и все последующие значения Модельной траектории сдвигаются на ±shift б.п.:
+        key_rates = self.macroModel['allKeyRates']
+        history = key_rates['date'].values <= self.keyRateModelDate
+        dates = np.append(self.keyRateModelDate + day, key_rates['date'].values[~history].astype(d_type))
+        rates = np.append(key_rates['key_rate'].values[history][-1], key_rates['key_rate'].values[~history])
+
+        prices = {}
+        for sign in [1.0, -1.0]:
+            forecast = pd.DataFrame({'date': dates, 'rate': rates + sign * shift / 100.0})
+            prices[sign] = self.riskScenario(self.initialState, lambda t, sign=sign: sign * shift, forecast)
+
+        effective_duration = (prices[-1.0] - prices[1.0]) / (2.0 * price * dy)
+        effective_convexity = (prices[-1.0] + prices[1.0] - 2.0 * price) / (price * dy ** 2.0)
+
+        # ----- ДЮРАЦИИ КЛЮЧЕВЫХ СРОКОВ КБД ---------------------------------------------------------------------------------------------- #
+        key_rate_durations = []
+        for i in range(len(krd_tenors)):
+            up = self.riskScenario(modelled_state, lambda t, i=i: shift * krd_weights(krd_tenors, t)[i])
+            down = self.riskScenario(modelled_state, lambda t, i=i: -shift * krd_weights(krd_tenors, t)[i])
+            key_rate_durations.append((down - up) / (2.0 * price * dy))
+
+        self.riskResult = {
+            'riskShift': shift,
+            'dirtyPriceUp': np.round(prices[1.0], self.roundingPrecision),
+            'dirtyPriceDown': np.round(prices[-1.0], self.roundingPrecision),
+            'effectiveDuration': np.round(effective_duration, self.roundingPrecision),
+            'effectiveConvexity': np.round(effective_convexity, self.roundingPrecision),
+            'keyRateDurations': {
+                'tenor': krd_tenors,
+                'duration': np.round(key_rate_durations, self.roundingPrecision).tolist(),
+            },
+        }
+
+        ####################################################################################################################################
+
+    def riskScenario(self, state, zcyc_shift, key_rate_forecast=None):
+
+        """ Грязная цена в сценарии расчета показателей риска. Сценарий рассчитывается на копии состояния state: если задана траектория
+        Ключевой ставки key_rate_forecast, денежный поток рассчитывается заново (state — состояние до расчета денежного потока), иначе
+        проводится только расчет ценовых метрик с КБД, сдвинутой на zcyc_shift(t) б.п. """
+
+        scenario = Convention.__new__(Convention)
+        scenario.__dict__.update(copy.deepcopy(state))
+        scenario.timer = self.timer
+        scenario.progressBar = None
+        scenario.connectionId = None
+        scenario.modelKey = None  # денежный поток сценария не сохраняется в кэш
+        scenario.riskMetrics = False
+        scenario.swapPricing = False
+        scenario.outputGraphs = False
+        scenario.zcycShift = zcyc_shift
+
+        # Опорная ценовая метрика сценария — спред(ы), рассчитанный в базовом расчете. Если задана фактическая надбавка к Ключевой ставке,
+        # облигация оценивается по номиналу во всех сценариях (требуемая надбавка равна фактической, см. mbsPricing):
+        if self.calculationType == CALCULATION_TYPE.SET_FXPRM:
+            scenario.calculationType = CALCULATION_TYPE.SET_FXPRM
+        elif self.couponType == COUPON_TYPE.FXD or (self.couponType == COUPON_TYPE.CHG and self.poolType == POOL_TYPE.FXD):
+            scenario.calculationType = CALCULATION_TYPE.SET_ZSPRD
+        elif self.couponType == COUPON_TYPE.FLT or (self.couponType == COUPON_TYPE.CHG and self.poolType == POOL_TYPE.FLT):
+            scenario.calculationType = CALCULATION_TYPE.SET_PREMI
+        else:
+            scenario.calculationType = CALCULATION_TYPE.SET_Z_PRM
+        scenario.zSpread = self.zSpread
+        scenario.requiredKeyRatePremium = self.requiredKeyRatePremium
+        scenario.gSpread, scenario.dirtyPrice, scenario.cleanPrice = None, None, None
+
+        if key_rate_forecast is not None:
+            scenario.keyRateForecast = key_rate_forecast
+            scenario.model()
+
+        scenario.mbsPricing()
+
+        return scenario.dirtyPrice
+
+        ####################################################################################################################################
+
     def outputPreparation(self):
 
         """ Подготовка выходных данных расчета """
@@ -2537,6 +2764,12 @@ class Convention(object):
         if self.durationModified is not None:
             self.pricingResult['durationModified'] = np.round(self.durationModified, self.roundingPrecision)
 
+        # Спредовая дюрация, выпуклость и DV01 (снижение грязной цены в % от номинала и в рублях на облигацию при росте спреда на 1 б.п.):
+        for key in ['spreadDuration', 'spreadConvexity', 'dv01', 'dv01Rub']:
+            self.pricingResult[key] = None
+            if getattr(self, key) is not None:
+                self.pricingResult[key] = np.round(getattr(self, key), self.roundingPrecision)
+
         if self.ifrs or self.ras:
             self.pricingResult['swapPriceAgent'] = None
             self.pricingResult['swapPriceAgentRub'] = None
@@ -2553,6 +2786,10 @@ class Convention(object):
 
         self.calculationOutput['pricingResult'] = self.pricingResult
 
+        # Показатели процентного риска (если рассчитывались):
+        if self.riskResult is not None:
+            self.calculationOutput['riskMetrics'] = self.riskResult
+
         # -------------------------------------------------------------------------------------------------------------------------------- #
         # ----- ПАРАМЕТРЫ, НА КОТОРЫХ ОСНОВАН РАСЧЕТ ------------------------------------------------------------------------------------- #
         # -------------------------------------------------------------------------------------------------------------------------------- #
@@ -2735,24 +2972,22 @@ class Convention(object):
                     # Отобразить в денежном потоке по ипотечному покрытию только те проценты, которые реально попадут в расчетный период:
                     pool_cf['yield'].values[-1] = np.round(pool_cf['yield'].values[-1] * self.redemptionMonthFraction, 2)
 
-                if subsidy_cf is not None and part == 'total':
+                if subsidy_cf is not None and part == 'total' and self.outputTables:
                     if (self.ifrs or self.ras) and self.redemptionBuyout:
                         # Учитывать, что данное ипотечное покрытие будет выкуплено оригинатором в месяц погашения выпуска облигаций:
                         subsidy_cf = subsidy_cf[subsidy_cf['reportDate'] < self.modelRedemptionDate]
-                    subsidy_cf['reportDate'] = subsidy_cf['reportDate'].values.astype(s_type).astype(str)
-                    subsidy_cf.replace({np.nan: None, 'NaT': None}, inplace=True)
-                    self.calculationOutput['subsidyCashflowTable'] = subsidy_cf.to_dict('list')
+                    subsidy_cf.replace({'NaT': None}, inplace=True)
+                    self.calculationOutput.setTable('subsidyCashflowTable', subsidy_cf)
 
-                pool_cf['reportDate'] = pool_cf['reportDate'].values.astype(s_type).astype(str)
-                pool_cf.replace({np.nan: None}, inplace=True)
-                self.calculationOutput['poolCashflowTable'][part] = pool_cf.to_dict('list')
+                if self.outputTables:
+                    self.calculationOutput.setTable('poolCashflowTable', pool_cf, part)
 
         # -------------------------------------------------------------------------------------------------------------------------------- #
         # ----- ДЕНЕЖНЫЙ ПОТОК ПО ИЦБ ДОМ.РФ --------------------------------------------------------------------------------------------- #
         # -------------------------------------------------------------------------------------------------------------------------------- #
 
         self.mbsCashflowTable = pd.DataFrame([])
-        self.mbsCashflowTable['couponDate'] = self.mbsCashflow['couponDate'].values.astype(s_type).astype(str)
+        self.mbsCashflowTable['couponDate'] = self.mbsCashflow['couponDate'].values.astype(s_type)
         self.mbsCashflowTable['cashflowType'] = self.mbsCashflow['cashflowType'].values
         self.mbsCashflowTable['bondPrincipalStartPeriod'] = np.round(self.mbsCashflow['principalStartPeriod'].values, 2)
         self.mbsCashflowTable['bondAmortization'] = np.round(self.mbsCashflow['amortization'].values, 2)
@@ -2767,11 +3002,11 @@ class Convention(object):
 
         if self.couponType is COUPON_TYPE.FLT:
             for c in ['couponKeyRateDate', 'keyRateStartDate']:
-                self.mbsCashflowTable[c] = self.mbsCashflow[c].values.astype(s_type).astype(str)
+                self.mbsCashflowTable[c] = self.mbsCashflow[c].values.astype(s_type)
             self.mbsCashflowTable['couponKeyRate'] = np.round(self.mbsCashflow['couponKeyRate'].values, 2)
             self.mbsCashflowTable['bondFixedPremiumPayments'] = np.round(self.mbsCashflow['fixedPremiumPayments'].values, 2)
 
-        self.calculationOutput['mbsCashflowTable'] = self.mbsCashflowTable.to_dict('list')
+        self.calculationOutput.setTable('mbsCashflowTable', self.mbsCashflowTable, nulls=False)
 
         # -------------------------------------------------------------------------------------------------------------------------------- #
         # ----- ДЕНЕЖНЫЙ ПОТОК ПО СВОПУ МЕЖДУ ДОМ.РФ И ИПОТЕЧНЫМ АГЕНТОМ С ТОЧКИ ЗРЕНИЯ ДОМ.РФ ------------------------------------------- #
@@ -2782,12 +3017,12 @@ class Convention(object):
             self.calculationOutput['swapAgentCashflowTable'] = None
             self.calculationOutput['swapOriginatorCashflowTable'] = None
 
-            self.swapModelAgent['nettingDate'] = self.swapModelAgent['nettingDate'].values.astype(s_type).astype(str)
-            self.calculationOutput['swapAgentCashflowTable'] = self.swapModelAgent.to_dict('list')
+        if self.swapPricing and self.outputTables:
+
+            self.calculationOutput.setTable('swapAgentCashflowTable', self.swapModelAgent, nulls=False)
 
             if self.swapWithOriginator:
-                self.swapModelOriginator['nettingDate'] = self.swapModelOriginator['nettingDate'].values.astype(s_type).astype(str)
-                self.calculationOutput['swapOriginatorCashflowTable'] = self.swapModelOriginator.to_dict('list')
+                self.calculationOutput.setTable('swapOriginatorCashflowTable', self.swapModelOriginator, nulls=False)
 
         # -------------------------------------------------------------------------------------------------------------------------------- #
         # ----- ДЕНЕЖНЫЙ ПОТОК РАСХОДОВ ИПОТЕЧНОГО АГЕНТА -------------------------------------------------------------------------------- #
@@ -2795,7 +3030,7 @@ class Convention(object):
 
         self.calculationOutput['expenseCashflowTable'] = None
 
-        if self.ifrs or self.ras:
+        if (self.ifrs or self.ras) and self.outputTables:
 
             # Формируем основу:
             c = ['couponDate', 'couponDays', 'principalStartPeriod']
@@ -2820,10 +3055,10 @@ class Convention(object):
             for i in nan_expenses_index:
 
                 coupon_date = self.expenseCashflowTable['couponDate'].values[i]
-                index = np.where(self.couponsStructure['couponDate'] == coupon_date)
-                d1 = self.couponsStructure['paymentPeriodDays'].astype(float).values[index][0] / 365.0
-                d2 = self.couponsStructure['couponPeriodDays'].astype(float).values[index][0] / 365.0
-                d3 = self.couponsStructure['couponPeriodDays'].shift(-1).fillna(0.0).astype(float).values[index][0] / 365.0
+                index = coupon_index(coupon_date, self.couponsStructure)
+                d1 = self.couponsStructure['paymentPeriodDays'].astype(float).values[index] / 365.0
+                d2 = self.couponsStructure['couponPeriodDays'].astype(float).values[index] / 365.0
+                d3 = self.couponsStructure['couponPeriodDays'].shift(-1).fillna(0.0).astype(float).values[index] / 365.0
                 p = self.expenseCashflowTable['issuePrincipalStartPeriod'].astype(float).values[i]
                 c = float(self.couponPeriod)
 
@@ -2845,53 +3080,54 @@ class Convention(object):
                 # Расчетный агент:
                 self.expenseCashflowTable.loc[i, 'expensePart5'] = np.round(self.paymentAgentYearIssueDoc * d1, 2)
 
-            self.expenseCashflowTable['couponDate'] = self.expenseCashflowTable['couponDate'].values.astype(s_type).astype(str)
-            self.calculationOutput['expenseCashflowTable'] = self.expenseCashflowTable.to_dict('list')
+            self.calculationOutput.setTable('expenseCashflowTable', self.expenseCashflowTable, nulls=False)
 
         # -------------------------------------------------------------------------------------------------------------------------------- #
         # ----- ДАННЫЕ ДЛЯ ГРАФИКА ДЕНЕЖНОГО ПОТОКА ПО ИЦБ ДОМ.РФ ------------------------------------------------------------------------ #
         # -------------------------------------------------------------------------------------------------------------------------------- #
 
-        self.mbsCashflowGraph = pd.DataFrame({})
-        self.mbsCashflowGraph['couponDates'] = self.mbsCashflowTable['couponDate'].values
-        self.mbsCashflowGraph['cashflowType'] = self.mbsCashflowTable['cashflowType'].values.astype(int)
+        self.calculationOutput['mbsCashflowGraph'] = None
 
-        # Описание cashflowType см. выше
-        h = self.mbsCashflowGraph['cashflowType'].values == 2
-        r = self.mbsCashflowGraph['cashflowType'].values == 1
-        m = self.mbsCashflowGraph['cashflowType'].values == 0
+        if self.outputGraphs:
 
-        self.mbsCashflowGraph.loc[h, 'historicalAmortization'] = self.mbsCashflowTable['bondAmortization'].values[h]
-        self.mbsCashflowGraph.loc[h, 'historicalCouponPayments'] = self.mbsCashflowTable['bondCouponPayments'].values[h]
-        self.mbsCashflowGraph.loc[r, 'futureActualAmortization'] = self.mbsCashflowTable['bondAmortization'].values[r]
-        self.mbsCashflowGraph.loc[r, 'futureActualCouponPayments'] = self.mbsCashflowTable['bondCouponPayments'].values[r]
+            self.mbsCashflowGraph = pd.DataFrame({})
+            self.mbsCashflowGraph['couponDates'] = self.mbsCashflowTable['couponDate'].values
+            self.mbsCashflowGraph['cashflowType'] = self.mbsCashflowTable['cashflowType'].values.astype(int)
 
-        c = ['futureModelDifference', 'futureModelScheduled', 'futureModelPrepayment',
-             'futureModelDefaults', 'futureModelCleanUp', 'futureModelCouponPayments']
-        for column in c:
-            self.mbsCashflowGraph[c] = None
+            # Описание cashflowType см. выше
+            h = self.mbsCashflowGraph['cashflowType'].values == 2
+            r = self.mbsCashflowGraph['cashflowType'].values == 1
+            m = self.mbsCashflowGraph['cashflowType'].values == 0
 
-        if self.runCashflowModel and self.bondID not in fixed_amt_bonds:
-            self.mbsCashflowGraph.loc[m, 'futureModelDifference'] = self.mbsModel['total']['bond']['difference'].values
-            self.mbsCashflowGraph.loc[m, 'futureModelScheduled'] = self.mbsModel['total']['bond']['scheduled'].values
-            self.mbsCashflowGraph.loc[m, 'futureModelPrepayment'] = self.mbsModel['total']['bond']['prepayment'].values
-            self.mbsCashflowGraph.loc[m, 'futureModelDefaults'] = self.mbsModel['total']['bond']['defaults'].values
-            self.mbsCashflowGraph.loc[m, 'futureModelCleanUp'] = self.mbsModel['total']['bond']['cleanUp'].values
-            self.mbsCashflowGraph.loc[m, 'futureModelCouponPayments'] = self.mbsModel['total']['bond']['couponPayment'].values
+            self.mbsCashflowGraph.loc[h, 'historicalAmortization'] = self.mbsCashflowTable['bondAmortization'].values[h]
+            self.mbsCashflowGraph.loc[h, 'historicalCouponPayments'] = self.mbsCashflowTable['bondCouponPayments'].values[h]
+            self.mbsCashflowGraph.loc[r, 'futureActualAmortization'] = self.mbsCashflowTable['bondAmortization'].values[r]
+            self.mbsCashflowGraph.loc[r, 'futureActualCouponPayments'] = self.mbsCashflowTable['bondCouponPayments'].values[r]
 
-        self.mbsCashflowGraph.replace({np.nan: None}, inplace=True)
-        self.mbsCashflowGraph = self.mbsCashflowGraph.to_dict('list')
-        self.calculationOutput['mbsCashflowGraph'] = self.mbsCashflowGraph
+            c = ['futureModelDifference', 'futureModelScheduled', 'futureModelPrepayment',
+                 'futureModelDefaults', 'futureModelCleanUp', 'futureModelCouponPayments']
+            for column in c:
+                self.mbsCashflowGraph[c] = None
+
+            if self.runCashflowModel and self.bondID not in fixed_amt_bonds:
+                self.mbsCashflowGraph.loc[m, 'futureModelDifference'] = self.mbsModel['total']['bond']['difference'].values
+                self.mbsCashflowGraph.loc[m, 'futureModelScheduled'] = self.mbsModel['total']['bond']['scheduled'].values
+                self.mbsCashflowGraph.loc[m, 'futureModelPrepayment'] = self.mbsModel['total']['bond']['prepayment'].values
+                self.mbsCashflowGraph.loc[m, 'futureModelDefaults'] = self.mbsModel['total']['bond']['defaults'].values
+                self.mbsCashflowGraph.loc[m, 'futureModelCleanUp'] = self.mbsModel['total']['bond']['cleanUp'].values
+                self.mbsCashflowGraph.loc[m, 'futureModelCouponPayments'] = self.mbsModel['total']['bond']['couponPayment'].values
+
+            self.calculationOutput.setTable('mbsCashflowGraph', self.mbsCashflowGraph)
 
         # -------------------------------------------------------------------------------------------------------------------------------- #
         # ----- ГРАФИК КБД --------------------------------------------------------------------------------------------------------------- #
         # -------------------------------------------------------------------------------------------------------------------------------- #
 
         self.calculationOutput['zcycGraph'] = None
-        if self.couponType == COUPON_TYPE.FXD or (self.couponType == COUPON_TYPE.CHG and not self.poolType == POOL_TYPE.FLT):
-            end_range = round_ceil(max(self.mbsCashflow['couponDate'].values - self.pricingDate) / np.timedelta64(1, 'D') / 365.0, 1)
-            t = np.arange(0.1, end_range + 0.1, 0.1)
-            zcyc_values = np.round(Y(self.zcycParameters, t) / 100.0, 5)
+        zcyc_needed = self.couponType == COUPON_TYPE.FXD or (self.couponType == COUPON_TYPE.CHG and not self.poolType == POOL_TYPE.FLT)
+        if zcyc_needed and self.outputGraphs:
+            end_range = round_ceil(max(self.yearsToCouponDate), 1)
+            zcyc_values = np.round(self.discounting.curve(end_range, 0.1) / 100.0, 5)
 
             self.calculationOutput['zcycGraph'] = zcyc_values.tolist()
 
@@ -2923,16 +3159,15 @@ class Convention(object):
             # выпуска облигаций:
             cpr, dbt = self.cprGraph['cpr'].values, self.cprGraph['debt'].values
             self.modelCPR = np.round(np.nansum(cpr * dbt) / np.nansum(dbt), 1 if self.rounding else self.roundingPrecision)
-            self.cprGraph['wac'].bfill(inplace=True)
 
-            self.cprGraph = self.cprGraph[['date', 'key_rate', 'ref_rate', 'cpr', 'wac']]
-            self.cprGraph.rename(columns={'key_rate': 'keyRate', 'ref_rate': 'refinancingRate', 'cpr': 'modelCPR'}, inplace=True)
+            # Сам график формируется только при полном составе выходных данных:
+            if self.outputGraphs:
+                self.cprGraph['wac'].bfill(inplace=True)
 
-            self.cprGraph.replace({np.nan: None}, inplace=True)
-            self.cprGraph['date'] = self.cprGraph['date'].values.astype(s_type).astype(str)
-            self.cprGraph = self.cprGraph.to_dict('list')
+                self.cprGraph = self.cprGraph[['date', 'key_rate', 'ref_rate', 'cpr', 'wac']]
+                self.cprGraph.rename(columns={'key_rate': 'keyRate', 'ref_rate': 'refinancingRate', 'cpr': 'modelCPR'}, inplace=True)
 
-            self.calculationOutput['cprGraph'] = self.cprGraph
+                self.calculationOutput.setTable('cprGraph', self.cprGraph)
 
         # -------------------------------------------------------------------------------------------------------------------------------- #
         # ----- ИНТЕРАКТИВНЫЙ ГРАФИК КЛЮЧЕВОЙ СТАВКИ ------------------------------------------------------------------------------------- #
@@ -3016,8 +3251,9 @@ class Convention(object):
 
             self.calculationParameters['calculationSCurvesReportDate'] = str(self.calculationSCurvesReportDate.astype(s_type))
 
-            self.calculationSCurvesParameters.drop(columns=['reportDate'], inplace=True)
-            self.calculationParameters['calculationSCurvesParameters'] = self.calculationSCurvesParameters.to_dict('list')
+            s_curves = {c: self.calculationSCurvesParameters[:, i].tolist() for i, c in enumerate(s_curves_columns)}
+            s_curves['loanAge'] = self.calculationSCurvesParameters[:, 0].astype(int).tolist()
+            self.calculationParameters['calculationSCurvesParameters'] = s_curves
 
             self.calculationParameters['keyRateModelDate'] = str(self.keyRateModelDate.astype(s_type))
             self.calculationParameters['conventionalCDR'] = self.conventionalCDR
@@ -3040,29 +3276,154 @@ class Convention(object):
 
         ####################################################################################################################################
 
-    def calculate(self):
+    def model(self):
+
+        """ Расчет денежного потока по ипотечному покрытию и ИЦБ ДОМ.РФ. Выполняется один раз: повторный вызов (в том числе из calculate)
+        не пересчитывает денежный поток """
+
+        if self.modelled:
+            return self
+
+        # Для расчета показателей риска сохраняется состояние до расчета денежного потока (сценарии рассчитывают его заново):
+        if self.riskMetrics:
+            self.initialState = copy.deepcopy(self.modelState())
 
-        """ Запуск расчета """
         if self.runCashflowModel:
             # ---------------------------------------------------------------------------------------------------------------------------- #
             # ----- РАСЧЕТ ДЕНЕЖНОГО ПОТОКА ПО ИПОТЕЧНОМУ ПОКРЫТИЮ ----------------------------------------------------------------------- #
             # ---------------------------------------------------------------------------------------------------------------------------- #
+            self.timer.start('poolCashflowModel')
             self.poolCashflowModel()
+            self.releaseState('poolCashflowModel')
+            self.timer.stop()
 
             # ---------------------------------------------------------------------------------------------------------------------------- #
             # ----- РАСЧЕТ ДЕНЕЖНОГО ПОТОКА ПО ИЦБ ДОМ.РФ -------------------------------------------------------------------------------- #
             # ---------------------------------------------------------------------------------------------------------------------------- #
+            self.timer.start('mbsCashflowModel')
             self.mbsCashflowModel()
+            self.releaseState('mbsCashflowModel')
+            self.timer.stop()
+
+        self.modelled = True
+
+        # Сохранение состояния в кэш денежного потока (если кэш включен; сценарии расчета показателей риска не сохраняются):
+        if model_cache.enabled and self.modelKey is not None:
+            self.timer.start('modelCache')
+            model_cache.put(self.pricingParameters, self.modelState())
+            self.timer.stop()
+
+        return self
+
+        ####################################################################################################################################
+
+    def reprice(self, input):
+
+        """ Расчет с другой опорной ценовой метрикой на денежном потоке этого объекта. Параметры input должны совпадать с параметрами
+        исходного расчета во всем, кроме опорной ценовой метрики и служебных параметров (connectionId, progressBar, logTimings). Функция
+        рассчитывает денежный поток (если он еще не был рассчитан) и возвращает новый объект Convention, для которого calculate проводит
+        только расчет ценовых метрик и подготовку выходных данных. Исходный объект не изменяется, поэтому для одного денежного потока
+        reprice можно вызывать многократно, однако только до вызова calculate у исходного объекта """
+
+        if self.priced:
+            raise Exception(EXCEPTIONS._22)
+
+        self.model()
+
+        # Состояние объекта после расчета денежного потока копируется целиком, т.к. расчет ценовых метрик и подготовка выходных данных
+        # изменяют часть таблиц модели:
+        return Convention.fromModelState(copy.deepcopy(self.modelState()), input)
+
+        ####################################################################################################################################
+
+    def modelState(self):
+
+        """ Состояние объекта после расчета денежного потока (без получателя доли готовности расчета и замеров времени). Используется
+        функциями reprice и fromModelState, а также кэшем денежного потока model_cache """
+
+        return {key: value for key, value in self.__dict__.items() if key not in ['progressBar', 'timer']}
+
+    @classmethod
+    def fromModelState(cls, state, input):
+
+        """ Новый объект Convention с параметрами оценки input по состоянию state после расчета денежного потока (см. функцию modelState).
+        Объект не копирует state, и для него остается провести только расчет ценовых метрик и подготовку выходных данных (calculate) """
+
+        convention = cls.__new__(cls)
+        convention.restore(state, input)
+        return convention
+
+    def restore(self, state, input):
+
+        """ Восстановление состояния после расчета денежного потока и установка параметров оценки input (опорной ценовой метрики и
+        служебных параметров) """
+
+        if model_key(input) != state['modelKey']:
+            raise Exception(EXCEPTIONS._21)
+
+        self.__dict__.update(state)
+
+        progress_bar = input['progressBar'] if 'progressBar' in input.keys() else None
+        self.pricingParameters = copy.deepcopy({key: input[key] for key in input.keys() if key != 'progressBar'})
+        if isinstance(progress_bar, bool):
+            self.pricingParameters['progressBar'] = progress_bar
+
+        self.connectionId = None
+        if 'connectionId' in self.pricingParameters.keys() and self.pricingParameters['connectionId'] is not None:
+            self.connectionId = self.pricingParameters['connectionId']
+
+        self.logTimings = False
+        if 'logTimings' in self.pricingParameters.keys() and self.pricingParameters['logTimings'] is not None:
+            self.logTimings = bool(self.pricingParameters['logTimings'])
+
+        self.leanMemory = False
+        if 'leanMemory' in self.pricingParameters.keys() and self.pricingParameters['leanMemory'] is not None:
+            self.leanMemory = bool(self.pricingParameters['leanMemory'])
+
+        self.startTime = np.datetime64('now') + 3 * hour
+        self.timer = StageTimer(self.bondID)
+        self.progressBar = progress_reporter(progress_bar, desc=self.bondID)
+        self.calculationOutput = CalculationResult()
+        self.priced = False
+
+        self.pricingMetrics()
+
+        ####################################################################################################################################
+
+    def calculate(self):
+
+        """ Запуск расчета """
+
+        # -------------------------------------------------------------------------------------------------------------------------------- #
+        # ----- РАСЧЕТ ДЕНЕЖНОГО ПОТОКА ПО ИПОТЕЧНОМУ ПОКРЫТИЮ И ИЦБ ДОМ.РФ -------------------------------------------------------------- #
+        # -------------------------------------------------------------------------------------------------------------------------------- #
+        self.model()
+        self.priced = True
 
         # -------------------------------------------------------------------------------------------------------------------------------- #
         # ----- РАСЧЕТ ЦЕНОВЫХ МЕТРИК ИЦБ ДОМ.РФ ----------------------------------------------------------------------------------------- #
         # -------------------------------------------------------------------------------------------------------------------------------- #
+        modelled_state = copy.deepcopy(self.modelState()) if self.riskMetrics else None
+
+        self.timer.start('mbsPricing')
         self.mbsPricing()
+        self.releaseState('mbsPricing')
+        self.timer.stop()
+
+        # -------------------------------------------------------------------------------------------------------------------------------- #
+        # ----- РАСЧЕТ ПОКАЗАТЕЛЕЙ РИСКА ИЦБ ДОМ.РФ -------------------------------------------------------------------------------------- #
+        # -------------------------------------------------------------------------------------------------------------------------------- #
+        if self.riskMetrics:
+            self.timer.start('mbsRiskMetrics')
+            self.mbsRiskMetrics(modelled_state)
+            self.timer.stop()
 
         # -------------------------------------------------------------------------------------------------------------------------------- #
         # ----- ПОДГОТОВКА ВЫХОДНЫХ ДАННЫХ РАСЧЕТА --------------------------------------------------------------------------------------- #
         # -------------------------------------------------------------------------------------------------------------------------------- #
+        self.timer.start('outputPreparation')
         self.outputPreparation()
+        self.timer.stop()
 
         ####################################################################################################################################
 
@@ -3082,6 +3443,13 @@ class Convention(object):
               ' — ' + str(self.endTime)[-8:] +
               ' ' + length + ' sec.')
 
+        # Замеры времени выполнения этапов расчета:
+        self.calculationOutput['timings'] = self.timer.report()
+        if self.logTimings:
+            self.timer.log()
+
+        self.releaseState('calculate')
+
         return self.calculationOutput
 
         ####################################################################################################################################
@@ -0,0 +1,312 @@
+# -*- coding: utf8 -*-
+
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+# ----- КОНВЕНЦИЯ ДЛЯ ИПОТЕЧНЫХ ЦЕННЫХ БУМАГ: ОЦЕНКА ВЫПУСКОВ С ИЗВЕСТНЫМ ДЕНЕЖНЫМ ПОТОКОМ ----------------------------------------------- #
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+
+import numpy as np
+
+from auxiliary import *
+
+import warnings
+warnings.filterwarnings('ignore')
+np.seterr(all='ignore')
+
+
+def knownCashflowPricing(input, source=None):
+
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Оценка выпуска ИЦБ ДОМ.РФ, все будущие платежи по которому известны (расчет без моделирования денежного потока)
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры функции:
+
+        Обязательные:
+            1. input   — параметры оценки в формате Convention(input)
+
+        Опциональные:
+            1. source  — функция загрузки данных методов DataSource, повторяющая сигнатуру requests.get (например, DataCache.get).
+                         По умолчанию — requests.get (или локальное хранилище данных по выпускам, если оно включено)
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Если все будущие платежи по облигации известны из отчетов для инвесторов (последняя известная выплата приходится на Юридическую или
+    Фактическую дату погашения), Convention не моделирует денежный поток по ипотечному покрытию (runCashflowModel = False), однако все
+    равно разбирает все таблицы данных по выпуску, строит структуру выплат по ипотечному покрытию и формирует выходные данные. Функция
+    рассчитывает те же ценовые метрики только по отчетам для инвесторов и параметрам КБД на массивах numpy:
+        · Z-спред, G-спред, грязная и чистая цены, НКД, YTM, дюрации Маколея и модифицированная
+        · денежный поток по облигации (mbsCashflowTable), параметры оценки (pricingParameters), непогашенный номинал на Дату оценки
+          и дату следующей купонной выплаты (calculationParameters)
+
+    Состав выходных данных совпадает с Convention при outputProfile "minimal" или "tables": разделы, которые Convention без
+    моделирования денежного потока не заполняет (денежный поток по ипотечному покрытию, субсидии, расходы, графики, статистика
+    ипотечного покрытия, параметры модели), возвращаются со значением None. Графики (outputProfile "full") функция не строит.
+
+    Дисконтирование и решатели те же, что в Convention.mbsPricing: YTM и Z-спред определяются методом Ньютона (newton_root по
+    DiscountGrid.price_ytm и DiscountGrid.price), YTM при заданном G-спреде — функцией g_spread_ytm, поэтому значения метрик совпадают с
+    расчетом Convention с точностью до сходимости решателя, а модуль scipy при таком расчете не загружается (если метод Ньютона сошелся).
+
+    Функция возвращает None (и расчет необходимо провести через Convention), если оценка без моделирования денежного потока невозможна
+    или параметры оценки требуют полного расчета:
+        · по выпуску есть модельные платежи, выпуск погашается фиксированными суммами (fixed_amt_bonds)
+        · купон плавающий или переменный с субсидируемым или смешанным ипотечным покрытием
+        · задана требуемая надбавка к Ключевой ставке, ставка купона, CDR, расчет по требованиям МСФО/РСБУ, расчет только на данных,
+          доступных на Дату оценки, или расчет показателей риска
+        · outputProfile не задан или равен "full" (требуются графики)
+        · параметры оценки некорректны (ошибку в этом случае сформирует Convention)
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    source = source if source is not None else get
+    parameters = {key: value for key, value in input.items() if key != 'progressBar'}
+    given = lambda key: key in parameters.keys() and parameters[key] is not None
+
+    # ----- ПАРАМЕТРЫ, ТРЕБУЮЩИЕ ПОЛНОГО РАСЧЕТА ----------------------------------------------------------------------------------------- #
+    bond_id = known_cashflow_bond(parameters)
+    if bond_id is None:
+        return None
+
+    metric = [key for key in ['zSpread', 'gSpread', 'dirtyPrice', 'cleanPrice'] if given(key)][0]
+    value = float(parameters[metric])
+    cpr = float(parameters['cpr']) if given('cpr') else None
+
+    # ----- ДАННЫЕ ПО ВЫПУСКУ -------------------------------------------------------------------------------------------------------- #
+    timer = StageTimer(bond_id)
+    if reference_data.enabled:
+        data = reference_data.load(bond_id, source)
+    else:
+        data = source(API.DATA_FOR_CALC.format(bond_id), timeout=15).json()
+    bond = data['bondParameters']
+
+    coupon_type = int(bond['couponType'])
+    if coupon_type == COUPON_TYPE.CHG:
+        pools = data['pools']
+        fractions = list(pools['governProgramsFraction']) if not isinstance(pools, list) else [p['governProgramsFraction'] for p in pools]
+        report_dates = list(pools['reportDate']) if not isinstance(pools, list) else [p['reportDate'] for p in pools]
+        if len(fractions) == 0 or fractions[int(np.argmax(np.array([str(d) for d in report_dates], dtype=object).astype(d_type)))] > \
+                governProgramsFractionLowerBound:
+            return None
+    elif coupon_type != COUPON_TYPE.FXD:
+        return None
+
+    issue_date = np.datetime64(bond['issueDate'], 'D')
+    first_coupon_date = np.datetime64(bond['firstCouponDate'], 'D')
+    legal_redemption_date = np.datetime64(bond['legalRedemptionDate'], 'D')
+    actual_redemption_date = None
+    if bond['actualRedemptionDate'] is not None:
+        actual_redemption_date = np.datetime64(bond['actualRedemptionDate'], 'D')
+
+    # Отчеты для инвесторов (см. Convention.investorsReportsData):
+    reports = data['investorsReportsData']
+    if isinstance(reports, list):
+        reports = {c: [row[c] for row in reports] for c in ['couponDate', 'bondNextPrincipal', 'bondAmortization', 'bondCouponPayment']}
+    coupon_dates = np.array([str(d)[:10] for d in reports['couponDate']], dtype=object).astype(d_type)
+    if len(coupon_dates) == 0:
+        return None
+    order = np.argsort(coupon_dates, kind='stable')
+    coupon_dates = coupon_dates[order]
+    next_principals = np.array(reports['bondNextPrincipal'], dtype=float)[order]
+    amortizations = np.array(reports['bondAmortization'], dtype=float)[order]
+    coupon_payments = np.array(reports['bondCouponPayment'], dtype=float)[order]
+
+    # Все будущие платежи известны, если последняя известная выплата приходится на Юридическую или Фактическую дату погашения:
+    if coupon_dates[-1] != legal_redemption_date and coupon_dates[-1] != actual_redemption_date:
+        return None
+
+    # ----- ДАТА ОЦЕНКИ -------------------------------------------------------------------------------------------------------------- #
+    maximum_possible_date = legal_redemption_date if actual_redemption_date is None else actual_redemption_date
+    if given('pricingDate'):
+        pricing_date = np.datetime64(parameters['pricingDate'], 'D')
+    elif not issue_date <= np.datetime64('today') < maximum_possible_date:
+        pricing_date = issue_date
+    else:
+        pricing_date = np.datetime64('today')
+    if not issue_date <= pricing_date < maximum_possible_date:
+        return None
+
+    # ----- СТРУКТУРА КУПОННЫХ ВЫПЛАТ ------------------------------------------------------------------------------------------------ #
+    # Даты купонных выплат и количество дней в купонных периодах (см. Convention.couponsStructure):
+    step = np.timedelta64(int(bond['couponPeriod']), 'M')
+    payment_day = np.timedelta64(first_coupon_date.astype(object).day - 1, 'D')
+    schedule = np.arange(first_coupon_date.astype(m_type), legal_redemption_date.astype(m_type) + month, step).astype(d_type) + payment_day
+    schedule_days = np.diff(np.concatenate([[issue_date], schedule])) / day
+
+    next_coupon_date = schedule[schedule > pricing_date][0]
+    start_bond_principal = float(bond['startBondPrincipal'])
+    number_of_bonds = float(bond['startIssuePrincipal']) / start_bond_principal
+    if pricing_date < first_coupon_date:
+        days_passed = float((pricing_date - issue_date) / day)
+        current_bond_principal = start_bond_principal
+    else:
+        previous_coupon_date = schedule[schedule <= pricing_date][-1]
+        if previous_coupon_date not in coupon_dates:
+            return None
+        days_passed = float((pricing_date - previous_coupon_date) / day)
+        current_bond_principal = next_principals[coupon_dates == previous_coupon_date][0]
+
+    # ----- ДЕНЕЖНЫЙ ПОТОК ПО ОБЛИГАЦИИ ---------------------------------------------------------------------------------------------- #
+    principals = next_principals + amortizations
+    cashflow_types = np.where(coupon_dates <= pricing_date, 2, 1)
+    position = np.searchsorted(schedule, coupon_dates)
+    position[position >= len(schedule)] = 0
+    coupon_days = np.where(schedule[position] == coupon_dates, schedule_days[position], np.nan)
+    coupon_percents = np.round(coupon_payments / principals * 365.0 / coupon_days * 100.0, 2)
+
+    future = coupon_dates > pricing_date
+    cf = np.round(amortizations[future] + coupon_payments[future], 2)
+
+    # ----- КБД ---------------------------------------------------------------------------------------------------------------------- #
+    zcyc_date_time = pricing_date + day - second
+    if given('zcycDateTime'):
+        zcyc_date_time = np.datetime64(parameters['zcycDateTime'])
+    zcyc_parameters = source(API.GET_ZCYC_COEF.format(zcyc_date_time), timeout=15).json()
+
+    # Сроки, значения КБД и факторы дисконтирования — как в Convention.mbsPricing (контекст дисконтирования и DiscountGrid):
+    discounting = DiscountingContext(pricing_date, zcyc_parameters)
+    grid = discounting.grid(coupon_dates[future])
+    principal = current_bond_principal / 100.0
+
+    # ----- ЦЕНОВЫЕ МЕТРИКИ ---------------------------------------------------------------------------------------------------------- #
+    duration = lambda ytm: max(0.001, grid.duration_ytm(cf, ytm)[0])
+
+    accrued = coupon_percents[future][0] * days_passed / 365.0
+    z_spread, g_spread, ytm = None, None, None
+    if metric == 'zSpread':
+        z_spread = value
+        dirty_price = grid.price(cf, z_spread)[0] / principal
+    elif metric == 'gSpread':
+        g_spread = value
+        ytm = g_spread_ytm(grid, cf, g_spread, discounting.rate)
+        dirty_price = grid.price_ytm(cf, ytm)[0] / principal
+    elif metric == 'dirtyPrice':
+        dirty_price = value
+    else:
+        dirty_price = value + accrued
+    clean_price = value if metric == 'cleanPrice' else dirty_price - accrued
+
+    if ytm is None:
+        ytm = newton_root(lambda y: grid.price_ytm(cf, y), dirty_price * principal, 0.0)
+    if z_spread is None:
+        z_spread = newton_root(lambda z: grid.price(cf, z), dirty_price * principal, 0.0)
+    if g_spread is None:
+        g_spread = ytm * 100.0 - discounting.rate(duration(ytm))
+    duration_macaulay = duration(ytm)
+    duration_modified = duration_macaulay / (1.0 + ytm / 100.0)
+
+    # Спредовая дюрация, выпуклость и DV01 по Z-спреду (как в Convention.mbsPricing):
+    sensitivity = grid.price(cf, z_spread)
+    dirty_price_value = dirty_price * principal
+
+    # ----- ВЫХОДНЫЕ ДАННЫЕ (КАК В Convention.outputPreparation) ----------------------------------------------------------------------- #
+    rounding = bool(parameters['rounding']) if given('rounding') else False
+    precision = 2 if rounding else 15
+    spread = lambda x: int(np.round(x, 0)) if rounding else np.round(x, precision)
+
+    accrued_rub = np.round(accrued / 100.0 * current_bond_principal, 2)
+    dirty_price_rub = np.round(dirty_price / 100.0 * current_bond_principal, 2)
+
+    result = CalculationResult()
+    result['pricingResult'] = {
+        'accruedCouponInterest': np.round(accrued, precision),
+        'accruedCouponInterestRub': accrued_rub,
+        'dirtyPrice': np.round(dirty_price, precision),
+        'dirtyPriceRub': dirty_price_rub,
+        'cleanPrice': np.round(clean_price, precision),
+        'cleanPriceRub': np.round(dirty_price_rub - accrued_rub, 2),
+        'ytm': np.round(ytm, precision),
+        'zSpread': spread(z_spread),
+        'gSpread': spread(g_spread),
+        'requiredKeyRatePremium': None,
+        'modelKeyRatePremium': None,
+        'durationMacaulay': np.round(duration_macaulay, precision),
+        'durationModified': np.round(duration_modified, precision),
+        'spreadDuration': np.round(-sensitivity[1] / dirty_price_value * 10000.0, precision),
+        'spreadConvexity': np.round(sensitivity[2] / dirty_price_value * 10000.0 ** 2.0, precision),
+        'dv01': np.round(-sensitivity[1] / current_bond_principal * 100.0, precision),
+        'dv01Rub': np.round(-sensitivity[1], precision),
+    }
+
+    parameters['pricingDate'] = str(pricing_date.astype(s_type))
+    parameters['usePricingDateDataOnly'] = False
+    parameters['cpr'] = cpr
+    parameters['cdr'] = None
+    parameters['zcycDateTime'] = str(zcyc_parameters['date'])
+    parameters['zcycParameters'] = zcyc_parameters
+    parameters['rounding'] = rounding
+    result['pricingParameters'] = parameters
+
+    # Денежный поток по ипотечному покрытию и субсидиям без моделирования денежного потока не рассчитывается:
+    result['poolCashflowTable'] = {'total': None, 'fixed': None, 'float': None}
+    result['subsidyCashflowTable'] = None
+
+    result.setTable('mbsCashflowTable', pd.DataFrame({
+        'couponDate': coupon_dates.astype(s_type),
+        'cashflowType': cashflow_types,
+        'bondPrincipalStartPeriod': np.round(principals, 2),
+        'bondAmortization': np.round(amortizations, 2),
+        'bondCouponPayments': np.round(coupon_payments, 2),
+        'bondCouponDays': coupon_days.astype(int),
+        'bondCouponPaymentsPercents': coupon_percents,
+        'issuePrincipalStartPeriod': np.round(principals * number_of_bonds, 2),
+        'issueAmortization': np.round(amortizations * number_of_bonds, 2),
+        'issueCouponPayments': np.round(coupon_payments * number_of_bonds, 2),
+    }), nulls=False)
+
+    for key in ['expenseCashflowTable', 'mbsCashflowGraph', 'zcycGraph', 'cprGraph', 'poolStatistics']:
+        result[key] = None
+
+    first_expenses, other_expenses = float(bond['firstCouponExpensesIssueDoc']), float(bond['otherCouponsExpensesIssueDoc'])
+    result['calculationParameters'] = {
+        'currentBondPrincipal': current_bond_principal,
+        'currentIssuePrincipal': current_bond_principal * number_of_bonds,
+        'nextCouponDate': str(next_coupon_date.astype(s_type)),
+        'mortgageAgentExpense1': np.round(first_expenses - other_expenses, 5),
+        'mortgageAgentExpense2': np.round(2.4 * other_expenses - 1.2 * first_expenses, 5),
+    }
+    for key in ['calculationSCurvesReportDate', 'calculationSCurvesParameters', 'keyRateModelDate', 'conventionalCDR',
+                'modelCPR', 'modelCDR', 'poolModelCPR', 'keyRateSwapForecastDate', 'currentCBForecastDate']:
+        result['calculationParameters'][key] = None
+
+    result['timings'] = timer.report()
+
+    return result
+
+
+def known_cashflow_bond(parameters):
+
+    """ Идентификатор выпуска, если параметры оценки parameters допускают расчет функцией knownCashflowPricing (иначе None). Проверяются
+    только параметры оценки, без загрузки данных по выпуску, поэтому функцию можно вызывать до передачи расчета в пул процессов """
+
+    given = lambda key: key in parameters.keys() and parameters[key] is not None
+
+    for key in ['requiredKeyRatePremium', 'fixedCouponRate', 'fixedKeyRatePremium', 'cdr']:
+        if given(key):
+            return None
+    profile = str(parameters['outputProfile']).lower() if given('outputProfile') else OUTPUT_PROFILE.FULL
+    if profile not in [OUTPUT_PROFILE.MINIMAL, OUTPUT_PROFILE.TABLES]:
+        return None
+    for key in ['ifrs', 'ras', 'usePricingDateDataOnly', 'riskMetrics']:
+        if given(key) and bool(parameters[key]):
+            return None
+
+    metrics = [key for key in ['zSpread', 'gSpread', 'dirtyPrice', 'cleanPrice'] if given(key)]
+    if len(metrics) != 1:
+        return None
+    limits = {'zSpread': (CONSTRAINTS.ZSPRD_MIN, CONSTRAINTS.ZSPRD_MAX), 'gSpread': (CONSTRAINTS.GSPRD_MIN, CONSTRAINTS.GSPRD_MAX),
+              'dirtyPrice': (CONSTRAINTS.DIRTY_MIN, CONSTRAINTS.DIRTY_MAX), 'cleanPrice': (CONSTRAINTS.CLEAN_MIN, CONSTRAINTS.CLEAN_MAX),
+              'cpr': (0.0, 80.0)}
+    # Некорректные значения (в том числе нечисловые) проверяет Convention:
+    for key in metrics + ['cpr']:
+        try:
+            if given(key) and not limits[key][0] <= float(parameters[key]) <= limits[key][1]:
+                return None
+        except (TypeError, ValueError):
+            return None
+
+    bond_id = parameters['bondID'] if given('bondID') else parameters['isin'] if given('isin') else None
+    if bond_id is None or bond_id in fixed_amt_bonds:
+        return None
+
+    return bond_id
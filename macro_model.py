@@ -7,7 +7,6 @@
 import numpy as np
 import pandas as pd
 
-from requests import get
 from auxiliary import *
 
 import warnings
@@ -15,7 +14,8 @@ warnings.filterwarnings('ignore')
 np.seterr(all='ignore')
 
 
-def refinancingRatesModel(key_rate_model_date, key_rate_model_data, start_month, stop_month, key_rate_forecast=None, ifrs=False):
+def refinancingRatesModel(key_rate_model_date, key_rate_model_data, start_month, stop_month, key_rate_forecast=None, ifrs=False,
+                          interactive_graph=True):
 
     """
     ----------------------------------------------------------------------------------------------------------------------------------------
@@ -51,6 +51,8 @@ def refinancingRatesModel(key_rate_model_date, key_rate_model_data, start_month,
                                      ипользована Ключевая ставка 9.50% год., с 15.02.2026 по 19.09.2028 будет использована Ключевая ставка
                                      9.50% год., а с 20.09.2028 и до бесконечности — Ключевая ставка 7.75% год
             2. ifrs                  — True/False: моделировать макроэкономику с учетом требований МСФО, по умолчанию false
+            3. interactive_graph     — True/False: формировать keyRateInteractiveGraph (данные для интерактивного графика на сайте
+                                       Калькулятора ИЦБ ДОМ.РФ), по умолчанию true. Если false, keyRateInteractiveGraph = None
 
     ----------------------------------------------------------------------------------------------------------------------------------------
 
@@ -327,7 +329,8 @@ def refinancingRatesModel(key_rate_model_date, key_rate_model_data, start_month,
     # В том случае, если пользовательская траектория Ключевой ставки задана (аргумент key_rate_forecast is not None):
     else:
         # В качестве Модельной траектории Ключевой ставки используется заданная в аргументе key_rate_forecast траектория:
-        key_rate_forecast.rename(columns={'rate': 'key_rate'}, inplace=True)
+        # (траектория копируется, т.к. одна и та же траектория может передаваться в модель несколько раз):
+        key_rate_forecast = key_rate_forecast.rename(columns={'rate': 'key_rate'})
         key_rate_forecast['key_rate'] /= 100.0
 
     # Следующая задача — соединить таблицу заседаний Совета директоров Банка России meetingsCBR с таблицей Модельной траектории Ключевой
@@ -425,6 +428,20 @@ def refinancingRatesModel(key_rate_model_date, key_rate_model_data, start_month,
     period = (ratesMonthlyAvg['date'] >= start_month) & (ratesMonthlyAvg['date'] <= stop_month)
     ratesMonthlyAvg = ratesMonthlyAvg[period][['date', 'key_rate', 'ref_rate']]
 
+    # Результат модели (keyRateInteractiveGraph формируется далее только в том случае, если он нужен):
+    result = {
+        'allKeyRates': allKeyRates,
+        'ratesMonthlyAvg': ratesMonthlyAvg,
+        'keyRateInteractiveGraph': None,
+        'keyRateSwapForecastDate': keyRateSwapForecastDate,
+        'currentCBForecastDate': currentCBForecastDate,
+        'currentRefinancingRateDate': currentRefinancingRateDate,
+        'currentRefinancingRate': currentRefinancingRate,
+    }
+
+    if not interactive_graph:
+        return result
+
     # ------------------------------------------------------------------------------------------------------------------------------------ #
     # ----- ПОДГОТОВКА ДАННЫХ ДЛЯ ИЗМЕНЕНИЯ КЛЮЧЕВОЙ СТАВКИ НА ИНТЕРАКТИВНОМ ГРАФИКЕ ----------------------------------------------------- #
     # ------------------------------------------------------------------------------------------------------------------------------------ #
@@ -670,12 +687,6 @@ def refinancingRatesModel(key_rate_model_date, key_rate_model_data, start_month,
 
     ########################################################################################################################################
 
-    return {
-        'allKeyRates': allKeyRates,
-        'ratesMonthlyAvg': ratesMonthlyAvg,
-        'keyRateInteractiveGraph': keyRateInteractiveGraph,
-        'keyRateSwapForecastDate': keyRateSwapForecastDate,
-        'currentCBForecastDate': currentCBForecastDate,
-        'currentRefinancingRateDate': currentRefinancingRateDate,
-        'currentRefinancingRate': currentRefinancingRate,
-    }
+    result['keyRateInteractiveGraph'] = keyRateInteractiveGraph
+
+    return result
@@ -8,7 +8,6 @@ import pandas as pd
 import numpy as np
 import time
 import copy
-from requests import get
 from iteround import saferound
 
 from auxiliary import *
@@ -22,7 +21,8 @@ np.seterr(all='ignore')
 
 def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model_data, s_curves, cdr, cpr=None, s_curves_shift=0.0,
                        ifrs=False, no_cdr_months=[0, 0], reinvestment=False, stop_date=None, key_rate_forecast=None, subsidy_delay=True,
-                       progress_bar=None, connection_id=None, current_percent=0.0, status_delta=0.0, pool_data=None):
+                       progress_bar=None, connection_id=None, current_percent=0.0, status_delta=0.0, pool_data=None,
+                       timer=None, interactive_graph=True):
     """
     ----------------------------------------------------------------------------------------------------------------------------------------
     Моделирование помесячных погашений основного долга, процентных поступлений и субсидий по ипотечному покрытию
@@ -37,7 +37,8 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
                                        ставки рефинансирования ипотеки (Опорная дата модели Ключевой ставки)
             4. key_rate_model_data   — данные, необходимые для расчета необходимые для расчета Модельной траектории Ключевой ставки и
                                        Модельной траектории среднемесячной ставки рефинансирования ипотеки
-            5. s_curves              — Параметры S-кривых для расчета
+            5. s_curves              — Параметры S-кривых для расчета (pandas.DataFrame с колонками loanAge, beta0, ..., beta6 или
+                                       компактная S-кривая из репозитория auxiliary.s_curves_repository)
             6. cdr                   — значение Модельного CDR в % годовых
 
         Опциональные:
@@ -56,11 +57,13 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
             7. key_rate_forecast    — пользовательская траектория значений Ключевой ставки
             8. subsidy_delay        — True/False: учитывать задержку в выплате субсидий
             9. Для отправки процентов готовности расчета:
-                    9.1 progress_bar         — запущенный в консоли progress bar
+                    9.1 progress_bar         — получатель доли готовности расчета (ProgressReporter) или запущенный в консоли progress bar
                     9.2 connection_id        — идентификатор соединения с сайтом
                     9.3 current_percent      — текущее значение готовности расчета в процентах
                     9.4 status_delta         — дельта в процентах, на которую нужно увеличивать значение готовности расчета
             10. pool_data            — явно заданные параметры кредитов, может быть как путь на csv файл с данными, так и словарем с данными
+            11. timer                — объект StageTimer для замеров времени выполнения этапов модели (если не задан, замеры не сохраняются)
+            12. interactive_graph    — True/False: формировать в модели макроэкономики данные для интерактивного графика Ключевой ставки
 
     ----------------------------------------------------------------------------------------------------------------------------------------
 
@@ -132,6 +135,11 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
     #       · keyRateDeduction     — Вычет для расчета субсидии по кредиту       [П.П]
     #       · subsidyCoefficient   — Субсидируемая доля основного долга          [%]
 
+    # Замеры времени выполнения этапов модели:
+    timer = StageTimer('loansCashflowModel') if timer is None else timer
+    timer.start('loansCashflowModel')
+
+    timer.start('poolData')
     poolData = None
     if pool_data is None:
         server_output = get(API.GET_POOL_DATA.format(bond_id, report_date, ifrs), timeout=30).json()
@@ -145,6 +153,7 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
             poolData = pd.read_excel(pool_data).to_dict('list')
         else:
             poolData = pool_data
+    timer.stop()
 
     # [ОБНОВЛЕНИЕ СТАТУСА РАСЧЕТА]
     current_percent += status_delta
@@ -306,17 +315,22 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
     # По состоянию на Опорную дату модели Ключевой ставки рассчитываются Модельная траектория Ключевой ставки и Модельная траектория
     # среднемесячной рыночной ставки рефинансирования ипотеки
 
+    timer.start('refinancingRatesModel')
     macroModel = refinancingRatesModel(key_rate_model_date=key_rate_model_date,
                                        key_rate_model_data=key_rate_model_data,
                                        start_month=reportDate.astype(m_type) - month,
                                        stop_month=stop_date.astype(m_type) + 10 * month,
                                        key_rate_forecast=key_rate_forecast,
-                                       ifrs=ifrs)
+                                       ifrs=ifrs,
+                                       interactive_graph=interactive_graph)
+    timer.stop()
 
     # ------------------------------------------------------------------------------------------------------------------------------------ #
     # ----- ФОРМИРОВАНИЕ БУДУЩИХ ПРОЦЕНТНЫХ ПЕРИОДОВ ДЛЯ КАЖДОГО КРЕДИТА ----------------------------------------------------------------- #
     # ------------------------------------------------------------------------------------------------------------------------------------ #
 
+    timer.start('schedule')
+
     # Последовательность месяцев с шагом в 1 месяц, начинающаяся с месяца, предшествующего месяцу даты среза, и заканчивающаяся месяцем,
     # следующим за месяцем максимальной текущей даты погашения кредита (горизонтальный вектор):
     all_months = np.arange(reportDate.astype(m_type) - month, maturity_dates.max().astype(m_type) + month * 2)
@@ -440,10 +454,14 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
     current_percent += status_delta
     update(connection_id, current_percent, progress_bar)
 
+    timer.stop()
+
     # ------------------------------------------------------------------------------------------------------------------------------------ #
     # ----- РАСЧЕТ ПОМЕСЯЧНЫХ ДОСРОЧНЫХ ПОГАШЕНИЙ ОСНОВНОГО ДОЛГА ПО КАЖДОМУ КРЕДИТУ В КАЖДОМ ПРОЦЕНТНОМ ПЕРИОДЕ ------------------------- #
     # ------------------------------------------------------------------------------------------------------------------------------------ #
 
+    timer.start('sCurves')
+
     # Темп досрочных погашений CPR в дату платежа (i,j) в таблице end_dates рассчитывается исходя из:
     #     1. значения выдержки по кредиту в полных годах на дату начала процентного периода (i,j) в таблице start_dates;
     #     2. стимула к рефинансированию, посчитанного на основе разницы между текущей ставкой по кредиту j (current_rates) и ожидаемой
@@ -476,8 +494,11 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
         shifts[shifts > 0] -= 1
         shifts_needed = shifts > 0
 
+    # Компактное представление S-кривой (loanAge, beta0, ..., beta6), см. auxiliary.s_curves_array:
+    s_curves = s_curves_array(s_curves)
+
     # Определяем наибольший год жизни кредита, для которого определена S-кривая, и устанавливаем его на все последующие годы:
-    max_cpr_model = float(s_curves['loanAge'].max())
+    max_cpr_model = float(s_curves[:, 0].max())
     loans_age[loans_age > max_cpr_model] = max_cpr_model
 
     # Для каждого платежа по каждому кредиту определяем параметры S-кривой, по которой на этот платеж будет рассчитан CPR:
@@ -486,11 +507,11 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
 
     for i in range(int(max_cpr_model) + 1):
         pos = loans_age == float(i)
-        ind = s_curves['loanAge'] == i
+        betas = s_curves[s_curves[:, 0] == i][0]
 
-        b0[pos] = s_curves[ind]['beta0'].values[0]
-        b1[pos], b2[pos], b3[pos] = s_curves[ind]['beta1'].values[0], s_curves[ind]['beta2'].values[0], s_curves[ind]['beta3'].values[0]
-        b4[pos], b5[pos], b6[pos] = s_curves[ind]['beta4'].values[0], s_curves[ind]['beta5'].values[0], s_curves[ind]['beta6'].values[0]
+        b0[pos] = betas[1]
+        b1[pos], b2[pos], b3[pos] = betas[2], betas[3], betas[4]
+        b4[pos], b5[pos], b6[pos] = betas[5], betas[6], betas[7]
 
     # [ОБНОВЛЕНИЕ СТАТУСА РАСЧЕТА]
     current_percent += status_delta
@@ -522,10 +543,14 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
     current_percent += status_delta
     update(connection_id, current_percent, progress_bar)
 
+    timer.stop()
+
     # ------------------------------------------------------------------------------------------------------------------------------------ #
     # ----- РАСЧЕТ ПОМЕСЯЧНЫХ ПОГАШЕНИЙ ПО КРЕДИТАМ В ИПОТЕЧНОМ ПОКРЫТИИ ----------------------------------------------------------------- #
     # ------------------------------------------------------------------------------------------------------------------------------------ #
 
+    timer.start('amortization')
+
     # На основании заданного значения темпа выкупа дефолтов CDR рассчитываем постоянную долю от остатка основного долга на начало
     # процентного периода, которая будет приходиться на выкуп дефолтов у каждого кредита (иными словами, в отличие от CPR, CDR применяется
     # равномерно ко всем кредитам, т.е. ежемесячно определенная доля остатка основного долга по кредиту выкупается как дефолтная):
@@ -622,10 +647,14 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
     current_percent += status_delta
     update(connection_id, current_percent, progress_bar)
 
+    timer.stop()
+
     # ------------------------------------------------------------------------------------------------------------------------------------ #
     # ----- ГРУППИРОВКА ДЕНЕЖНЫХ ПОТОКОВ ПО КРЕДИТАМ В ПОМЕСЯЧНЫЕ ДЕНЕЖНЫЕ ПОТОКИ ПО ИПОТЕЧНОМУ ПОКРЫТИЮ --------------------------------- #
     # ------------------------------------------------------------------------------------------------------------------------------------ #
 
+    timer.start('aggregation')
+
     # Даты платежей на одной строке таблицы end_dates могут приходиться на разные месяцы. Для того, что иметь возможность просуммировать
     # таблицы start_debts, amt, amt_plan, amt_cpr, yld по кредитам (т.е. просуммировать колонки) и получить помесячные суммы поступлений
     # по ипотечному покрытию, необходимо сдвинуть соответствующие потоки вперед на один месяц таким образом, чтобы одна строка в таблицах
@@ -814,6 +843,8 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
         # ставки на остаток на счете Ипотечного агента:
         if reinvestment:
 
+            timer.start('reinvestment')
+
             # Развертывание таблиц end_dates, amt, yld в одну колонку:
             part_end_dates = np.ravel(end_dates, 'F')
             part_amt_base = np.ravel(amt_base * coeffs, 'F')
@@ -855,6 +886,8 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
             poolModel[part]['reinvestment'] = poolModel[part]['reinvestment'].groupby(by=c_group, as_index=False, dropna=False).sum()
             poolModel[part]['reinvestment'].sort_values(by='date', inplace=True)
 
+            timer.stop()
+
     # Расчет доли каждой части в ипотечном покрытии на всем модельном горизонте и сборка общего потока по ипотечному покрытию:
     poolModel['total'] = {
         'debt': np.round(poolModel['fixed']['debt'] + poolModel['float']['debt'], 2),
@@ -899,6 +932,10 @@ def loansCashflowModel(bond_id, report_date, key_rate_model_date, key_rate_model
         poolModel['total']['reinvestment'] = poolModel['total']['reinvestment'].groupby(by=c_group, as_index=False, dropna=False).sum()
         poolModel['total']['reinvestment'].sort_values(by='date', inplace=True)
 
+    # Завершение замеров этапов aggregation и loansCashflowModel:
+    timer.stop()
+    timer.stop()
+
     # [ОБНОВЛЕНИЕ СТАТУСА РАСЧЕТА]
     current_percent += status_delta
     update(connection_id, current_percent, progress_bar)
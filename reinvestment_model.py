@@ -0,0 +1,115 @@
+# -*- coding: utf8 -*-
+
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+# ----- КОНВЕНЦИЯ ДЛЯ ИПОТЕЧНЫХ ЦЕННЫХ БУМАГ: МОДЕЛЬ НАЧИСЛЕНИЯ ПРОЦЕНТОВ НА ОСТАТОК НА СЧЕТЕ ИПОТЕЧНОГО АГЕНТА ------------------------- #
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+
+import numpy as np
+import pandas as pd
+
+from auxiliary import *
+
+import warnings
+
+warnings.filterwarnings('ignore')
+np.seterr(all='ignore')
+
+
+def reinvestmentModel(cashflow, payments_structure, all_key_rates, start_date, end_date, write_off_days, deduction_ruonia=0.0):
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Расчет процентов, начисленных на остаток на счете Ипотечного агента, в соответствии с датами купонных выплат
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры функции:
+
+        Обязательные:
+            1. cashflow              — ежедневный поток поступлений на баланс Ипотечного агента (DataFrame с колонками date, amt, yld,
+                                       subsidy), результат loansCashflowModel с параметром reinvestment=True
+            2. payments_structure    — таблица соответствия месяцев платежей по ипотечному покрытию (paymentMonth) датам купонных выплат
+                                       (couponDate)
+            3. all_key_rates         — таблица значений Ключевой ставки (allKeyRates из модели макроэкономики)
+            4. start_date            — первый день, на который формируется баланс Ипотечного агента
+            5. end_date              — последний день, на который формируется баланс Ипотечного агента
+            6. write_off_days        — количество дней до купонной выплаты, когда происходит списание денежных средств со счета
+
+        Опциональные:
+            1. deduction_ruonia      — вычет из ставки RUONIA для расчета ставки реинвестирования, в % годовых
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Баланс Ипотечного агента рассчитывается на каждый день с start_date по end_date включительно. Все даты переводятся в целочисленные
+    смещения в днях от start_date, после чего:
+        · ежедневные поступления и суммы списаний собираются через np.bincount
+        · дата купонной выплаты для каждого дня определяется через np.searchsorted по месяцам платежей payments_structure
+        · действующая в каждый день Ключевая ставка определяется через np.searchsorted по датам all_key_rates
+
+    Результат функции: DataFrame из двух колонок:
+            · couponDate   — дата купонной выплаты
+            · reinvestment — сумма процентов, начисленных на остаток на счете Ипотечного агента в расчетном периоде couponDate
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    start_date = np.datetime64(start_date, 'D')
+    end_date = np.datetime64(end_date, 'D')
+
+    days_number = int((end_date - start_date) / day) + 1
+    if days_number <= 0:
+        return pd.DataFrame({'couponDate': payments_structure['couponDate'].values[:0], 'reinvestment': np.array([], dtype=float)})
+
+    # Все дни, на которые формируется баланс Ипотечного агента:
+    dates = start_date + np.arange(days_number) * day
+
+    # ----- ЕЖЕДНЕВНЫЕ ПОСТУПЛЕНИЯ ------------------------------------------------------------------------------------------------------- #
+    # Поток совокупных поступлений амортизации, процентов и субсидий на каждый день (платежи за пределами [start_date, end_date] не
+    # учитываются):
+    offsets = ((cashflow['date'].values.astype(d_type) - start_date) / day).astype(np.int64)
+    values = np.nansum(cashflow[['amt', 'yld', 'subsidy']].values.astype(float), axis=1)
+    inside = (offsets >= 0) & (offsets < days_number)
+    flow = np.bincount(offsets[inside], weights=values[inside], minlength=days_number)
+
+    # ----- ДАТЫ КУПОННЫХ ВЫПЛАТ --------------------------------------------------------------------------------------------------------- #
+    # Определяем, расчетному периоду какой купонной выплаты принадлежит каждый день. Для этого ищем месяц дня среди месяцев платежей:
+    payment_months = payments_structure['paymentMonth'].values.astype(m_type)
+    coupon_dates = payments_structure['couponDate'].values
+    order = np.argsort(payment_months, kind='stable')
+    payment_months, coupon_dates = payment_months[order], coupon_dates[order]
+
+    months = dates.astype(m_type)
+    position = np.clip(np.searchsorted(payment_months, months), 0, max(len(payment_months) - 1, 0))
+    if len(payment_months) > 0:
+        day_coupon_dates = coupon_dates[position]
+        has_coupon = (payment_months[position] == months) & ~pd.isnull(day_coupon_dates)
+    else:
+        day_coupon_dates = coupon_dates[:0]
+        has_coupon = np.zeros(days_number, dtype=bool)
+
+    # ----- СПИСАНИЯ --------------------------------------------------------------------------------------------------------------------- #
+    # Деньги списываются не в саму дату купонной выплаты, а в день выплаты свопа, т.е. за write_off_days до couponDate:
+    write_off_offsets = np.full(days_number, -1, dtype=np.int64)
+    write_off_dates = day_coupon_dates[has_coupon].astype(d_type) - write_off_days
+    write_off_offsets[has_coupon] = ((write_off_dates - start_date) / day).astype(np.int64)
+    inside = (write_off_offsets >= 0) & (write_off_offsets < days_number)
+    write_off = np.bincount(write_off_offsets[inside], weights=flow[inside], minlength=days_number)
+
+    # Баланс Ипотечного агента на каждую дату:
+    account = np.cumsum(flow - write_off)
+
+    # ----- СТАВКА РЕИНВЕСТИРОВАНИЯ ------------------------------------------------------------------------------------------------------ #
+    # Ключевая ставка, действующая в каждый день (последнее значение с датой <= дня), из нее значение ставки RUONIA (КС - 0.2%) и сразу
+    # значение ставки реинвестирования:
+    key_rate_dates = all_key_rates['date'].values.astype(d_type)
+    key_rates = all_key_rates['key_rate'].values.astype(float)
+    position = np.searchsorted(key_rate_dates, dates, side='right') - 1
+    key_rate = np.where(position >= 0, key_rates[np.maximum(position, 0)], np.nan)
+    reinvesting_rate = np.maximum(key_rate - 0.2 - deduction_ruonia, 0.0)
+
+    # Начислено за каждый день (без капитализации процентов):
+    reinvestment = np.nan_to_num(np.round(account * reinvesting_rate / 100.0 / 365.0, 2))
+
+    # ----- АГРЕГАЦИЯ ПО ДАТАМ КУПОННЫХ ВЫПЛАТ ------------------------------------------------------------------------------------------- #
+    unique_coupon_dates, inverse = np.unique(day_coupon_dates[has_coupon], return_inverse=True)
+    reinvestment = np.bincount(inverse.ravel(), weights=reinvestment[has_coupon], minlength=len(unique_coupon_dates))
+
+    return pd.DataFrame({'couponDate': unique_coupon_dates, 'reinvestment': reinvestment})
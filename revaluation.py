@@ -0,0 +1,267 @@
+# -*- coding: utf8 -*-
+
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+# ----- КОНВЕНЦИЯ ДЛЯ ИПОТЕЧНЫХ ЦЕННЫХ БУМАГ: ПЕРЕОЦЕНКА ПОРТФЕЛЯ НА КОНЕЦ МЕСЯЦА ПО ТРЕБОВАНИЯМ МСФО/РСБУ ------------------------------- #
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from auxiliary import *
+
+# Функция revaluation переоценивает все выпуски ИЦБ ДОМ.РФ портфеля на одну Дату оценки (последний день месяца) по требованиям МСФО или
+# РСБУ. Данные, общие для всех выпусков (параметры КБД и данные модели макроэкономики на Опорную дату модели Ключевой ставки), загружаются
+# и проверяются один раз до начала расчетов, после чего передаются в процессы пула расчетов. Каждый процесс пула загружает только данные
+# по своим выпускам (данные по выпуску и срезы ипотечного покрытия). Результат — сводная таблица (ledger) с одной строкой на выпуск.
+#
+# Запуск из корня репозитория:
+#       python revaluation.py --date 2024-03-31 --standard ifrs --portfolio portfolio.csv --workers 4 --output ledger.xlsx
+# (portfolio.csv — таблица с колонкой bondID и опорными ценовыми метриками выпусков, например zSpread или requiredKeyRatePremium, а
+# также, при необходимости, количеством облигаций в портфеле quantity)
+
+
+# ----- СОСТАВ СВОДНОЙ ТАБЛИЦЫ ----------------------------------------------------------------------------------------------------------- #
+revaluation_columns = ['bondID', 'pricingDate', 'standard', 'poolReportDate', 'keyRateModelDate', 'zcycDateTime',
+                       'calculationSCurvesReportDate', 'currentBondPrincipal', 'currentIssuePrincipal', 'dirtyPrice', 'dirtyPriceRub',
+                       'cleanPrice', 'cleanPriceRub', 'accruedCouponInterest', 'accruedCouponInterestRub', 'ytm', 'zSpread', 'gSpread',
+                       'requiredKeyRatePremium', 'durationMacaulay', 'durationModified', 'spreadDuration', 'dv01Rub', 'swapPriceAgent',
+                       'swapPriceAgentRub', 'swapPriceOriginator', 'swapPriceOriginatorRub', 'durationMacaulaySwapFix', 'quantity',
+                       'positionDirtyValueRub', 'positionCleanValueRub', 'positionAccruedRub', 'positionDV01Rub', 'seconds', 'error']
+
+# Суммируемые по портфелю колонки сводной таблицы:
+revaluation_totals = ['positionDirtyValueRub', 'positionCleanValueRub', 'positionAccruedRub', 'positionDV01Rub', 'swapPriceAgentRub',
+                      'swapPriceOriginatorRub']
+
+
+# ----- ОБЩИЕ ДАННЫЕ ПОРТФЕЛЯ ------------------------------------------------------------------------------------------------------------ #
+def shared_market_data(bond_ids, pricing_date, standard, source):
+
+    """ Загрузка и проверка данных, общих для всех выпусков портфеля: параметров КБД на Дату оценки и данных модели макроэкономики на
+    Опорную дату модели Ключевой ставки (как в Convention при usePricingDateDataOnly = True). Для расчета по требованиям МСФО один раз
+    проводятся проверки актуальности данных EXCEPTIONS._15, _16 и _17 (параметры модели ставки рефинансирования ипотеки и S-кривые на
+    первое число следующего месяца, совпадение даты рыночной траектории Ключевой ставки с датой КБД). Возвращается словарь
+    {url: тело ответа} для кэшей DataCache процессов пула """
+
+    zcyc_date_time = pricing_date + day - second
+    key_rate_model_date = min(pricing_date, np.datetime64('today'))
+
+    urls = [API.GET_ZCYC_COEF.format(zcyc_date_time), API.GET_MACR_DATA.format(key_rate_model_date)]
+    responses = [source(url, timeout=15) for url in urls]
+    zcyc_parameters, key_rate_model_data = [response.json() for response in responses]
+
+    if standard == 'ifrs':
+
+        if str(key_rate_model_date + day) not in key_rate_model_data['refinancingRateParameters']['date']:
+            raise Exception(EXCEPTIONS._15.format(str(key_rate_model_date + day), str(pricing_date)))
+
+        date_a = np.datetime64(zcyc_parameters['date'], 'D')
+        date_b = np.datetime64(key_rate_model_data['keyRateSwapForecast']['forecastDate'], 'D')
+        if date_a != date_b:
+            raise Exception(EXCEPTIONS._16.format(str(date_b), str(date_a), str(pricing_date)))
+
+        # Параметры S-кривых не зависят от выпуска, поэтому проверяются по данным первого выпуска портфеля:
+        if reference_data.enabled:
+            data = reference_data.load(bond_ids[0], source)
+        else:
+            data = source(API.DATA_FOR_CALC.format(bond_ids[0]), timeout=15).json()
+        s_curves_date = (pricing_date + day).astype(m_type).astype(d_type)
+        if s_curves_date not in s_curves_repository.update(data['sCurvesParameters']):
+            raise Exception(EXCEPTIONS._17.format(str(s_curves_date), str(pricing_date)))
+
+    return {url: response.content for url, response in zip(urls, responses)}
+
+
+# ----- ПРОЦЕССЫ ПУЛА РАСЧЕТОВ ----------------------------------------------------------------------------------------------------------- #
+revaluation_cache = None
+
+
+def revaluation_worker_init(shared):
+
+    """ Инициализация процесса пула: кэш DataCache с общими данными портфеля и подмена обращений к API в модулях convention и pool_model
+    на этот кэш """
+
+    global revaluation_cache
+
+    import convention
+    import pool_model
+
+    revaluation_cache = DataCache(ttl=None, max_entries=None, source=convention.get)
+    for url, content in shared.items():
+        revaluation_cache.put(url, content)
+    convention.get = revaluation_cache.get
+    pool_model.get = revaluation_cache.get
+
+
+def revaluation_worker(position, pricing_date, standard):
+
+    """ Переоценка одного выпуска портфеля. Возвращает строку сводной таблицы (ошибка расчета записывается в колонку error) """
+
+    from convention import Convention
+
+    position = {'bondID': position} if isinstance(position, str) else dict(position)
+    quantity = position.pop('quantity', None)
+
+    parameters = dict(position)
+    parameters['pricingDate'] = str(pricing_date)
+    parameters[standard] = True
+    parameters['zcycDateTime'] = None
+    parameters['progressBar'] = False
+    parameters['connectionId'] = None
+    parameters['outputProfile'] = OUTPUT_PROFILE.MINIMAL
+    parameters['leanMemory'] = True
+
+    row = dict.fromkeys(revaluation_columns)
+    row['bondID'] = parameters['bondID'] if 'bondID' in parameters.keys() else parameters.get('isin')
+    row['pricingDate'] = pricing_date
+    row['standard'] = standard
+    row['quantity'] = quantity
+
+    start = time.perf_counter()
+    try:
+        res = Convention(parameters).calculate()
+    except Exception as e:
+        row['error'] = str(e)
+        row['seconds'] = time.perf_counter() - start
+        return row
+    row['seconds'] = time.perf_counter() - start
+
+    for section in ['pricingResult', 'calculationParameters']:
+        for column in revaluation_columns:
+            if column in res[section].keys():
+                row[column] = res[section][column]
+    row['zcycDateTime'] = res['pricingParameters']['zcycDateTime']
+    if res['poolStatistics'] is not None:
+        row['poolReportDate'] = res['poolStatistics']['reportDate']
+
+    if quantity is not None:
+        row['positionDirtyValueRub'] = np.round(row['dirtyPriceRub'] * quantity, 2)
+        row['positionAccruedRub'] = np.round(row['accruedCouponInterestRub'] * quantity, 2)
+        row['positionCleanValueRub'] = np.round(row['positionDirtyValueRub'] - row['positionAccruedRub'], 2)
+        if row['dv01Rub'] is not None:
+            row['positionDV01Rub'] = np.round(row['dv01Rub'] * quantity, 2)
+
+    return row
+
+
+# ----- ПЕРЕОЦЕНКА ПОРТФЕЛЯ -------------------------------------------------------------------------------------------------------------- #
+def revaluation(portfolio, pricing_date, standard='ifrs', workers=None, errors='collect'):
+
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Переоценка портфеля выпусков ИЦБ ДОМ.РФ на последний день месяца по требованиям МСФО или РСБУ
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры функции:
+
+        Обязательные:
+            1. portfolio     — список выпусков портфеля: идентификаторов выпусков или параметров оценки в формате Convention(input)
+                               (например, {'bondID': 'RU000A1074A5', 'zSpread': 100.0}). Параметр quantity (количество облигаций
+                               выпуска в портфеле) в расчет не передается и используется для расчета стоимости позиции. Параметры
+                               pricingDate, ifrs/ras и zcycDateTime задаются функцией
+            2. pricing_date  — Дата оценки (последний день месяца)
+
+        Опциональные:
+            1. standard      — 'ifrs' (МСФО) или 'ras' (РСБУ), по умолчанию 'ifrs'
+            2. workers       — количество процессов пула расчетов (по умолчанию — количество ядер процессора, но не больше количества
+                               выпусков). При workers = 1 расчеты проводятся последовательно в текущем процессе
+            3. errors        — 'collect': ошибка расчета выпуска записывается в колонку error, расчет продолжается по остальным выпускам;
+                               'raise': ошибка прерывает переоценку. По умолчанию 'collect'
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры КБД и данные модели макроэкономики одинаковы для всех выпусков портфеля, поэтому загружаются один раз (функция
+    shared_market_data). Там же один раз проводятся проверки актуальности данных для расчета по требованиям МСФО: если на первое число
+    следующего месяца не загружены параметры модели ставки рефинансирования ипотеки или S-кривые, либо рыночная траектория Ключевой
+    ставки рассчитана не на дату КБД, переоценка не начинается (ошибки EXCEPTIONS._15, _16, _17). Если Дата оценки не является
+    последним днем месяца, возвращается ошибка EXCEPTIONS._14.
+
+    Результат — pandas.DataFrame (колонки revaluation_columns), одна строка на выпуск в порядке portfolio. Атрибут attrs['totals']
+    содержит суммы стоимости позиций и стоимости свопов по портфелю (revaluation_totals), attrs['seconds'] — общее время переоценки.
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    import convention
+
+    start = time.perf_counter()
+
+    standard = str(standard).lower()
+    if standard not in ['ifrs', 'ras']:
+        raise Exception(EXCEPTIONS._24)
+
+    pricing_date = np.datetime64(pricing_date, 'D')
+    if pricing_date != (pricing_date.astype(m_type) + month).astype(d_type) - day:
+        raise Exception(EXCEPTIONS._14)
+
+    portfolio = list(portfolio)
+    bond_ids = [position if isinstance(position, str) else position.get('bondID', position.get('isin')) for position in portfolio]
+
+    shared = shared_market_data(bond_ids, pricing_date, standard, DataCache(ttl=None, max_entries=None, source=convention.get).get)
+
+    workers = min(workers or os.cpu_count() or 1, max(len(portfolio), 1))
+    if workers == 1:
+        import pool_model
+        original = convention.get, pool_model.get
+        try:
+            revaluation_worker_init(shared)
+            rows = []
+            for position in portfolio:
+                rows.append(revaluation_worker(position, pricing_date, standard))
+                if errors == 'raise' and rows[-1]['error'] is not None:
+                    raise Exception(rows[-1]['error'])
+        finally:
+            convention.get, pool_model.get = original
+    else:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=revaluation_worker_init, initargs=(shared,)) as executor:
+            futures = [executor.submit(revaluation_worker, position, pricing_date, standard) for position in portfolio]
+            rows = []
+            for future in futures:
+                rows.append(future.result())
+                if errors == 'raise' and rows[-1]['error'] is not None:
+                    executor.shutdown(cancel_futures=True)
+                    raise Exception(rows[-1]['error'])
+
+    result = pd.DataFrame(rows, columns=revaluation_columns)
+    for column in ['pricingDate', 'poolReportDate', 'keyRateModelDate', 'calculationSCurvesReportDate']:
+        result[column] = pd.to_datetime(result[column])
+    result.attrs['totals'] = {column: np.round(pd.to_numeric(result[column]).sum(), 2) for column in revaluation_totals}
+    result.attrs['seconds'] = time.perf_counter() - start
+
+    return result
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Переоценка портфеля выпусков ИЦБ ДОМ.РФ на конец месяца по требованиям МСФО/РСБУ')
+    parser.add_argument('--date', required=True, help='Дата оценки (последний день месяца)')
+    parser.add_argument('--standard', default='ifrs', choices=['ifrs', 'ras'])
+    parser.add_argument('--portfolio', default=None, help='CSV-файл портфеля (колонка bondID, опорные ценовые метрики, quantity)')
+    parser.add_argument('--bonds', nargs='+', default=None, help='идентификаторы выпусков (если портфель не задан файлом)')
+    parser.add_argument('--workers', type=int, default=None, help='количество процессов пула расчетов')
+    parser.add_argument('--output', default=None, help='файл для сохранения сводной таблицы (.csv или .xlsx)')
+    args = parser.parse_args()
+
+    if args.portfolio is not None:
+        table = pd.read_csv(args.portfolio)
+        positions = [{key: value for key, value in row.items() if not pd.isnull(value)} for row in table.to_dict('records')]
+    else:
+        positions = args.bonds or []
+
+    ledger = revaluation(positions, args.date, args.standard, args.workers)
+
+    print(ledger.attrs['totals'], round(ledger.attrs['seconds'], 1), 'sec.')
+    if args.output is not None and args.output.endswith('.xlsx'):
+        ledger.to_excel(args.output, index=False)
+    elif args.output is not None:
+        ledger.to_csv(args.output, index=False)
+    else:
+        print(ledger.to_string(index=False))
@@ -18,89 +18,119 @@ warnings.filterwarnings('ignore')
 # TODO! Путь для сохранения эксель-файла с результатом расчета (изменить на пользовательский!):
 save_path = r"C:\Users\pavel.dovbnya\Desktop\calculation_result.xlsx"
 
+# Формат сохранения результата расчета: "xlsx" — Excel-файл save_path по шаблону TEMPLATE.xlsx, "csv" или "parquet" — папка save_path
+# с отдельным файлом для каждой таблицы. Результаты каждого выпуска дописываются в файл сразу после окончания его расчета:
+save_format = 'xlsx'
+
+# Папка для промежуточного сохранения результатов (None — без промежуточного сохранения). Таблицы каждого выпуска дописываются в CSV-файлы
+# этой папки, поэтому при повторном запуске после прерывания уже рассчитанные выпуски не пересчитываются:
+checkpoint_path = None
+
+# Файл локального хранилища данных по выпускам (None — данные загружаются методом GetDataForCalculation при каждом расчете). При повторных
+# запусках данные по выпуску синхронизируются не чаще одного раза в час, а параметры S-кривых хранятся один раз для всех выпусков:
+reference_data_path = None
+
 # Параметры расчетов. С помощью комментирования строк можно оставить только интересуемые выпуски ИЦБ ДОМ.РФ:
 calculations = [
             {'bondID': 'RU000A1074A5', 'zSpread': 100.0},
             {'bondID': 'RU000A109L98', 'requiredKeyRatePremium': 100.0},
 ]
 
+if reference_data_path is not None:
+    reference_data.configure(reference_data_path)
+
+writer = result_writer(save_path, save_format)
+collector = ResultCollector(writer, checkpoint_path)
+
 # Последовательный запуск расчетов в calculations:
-for calculation in calculations:
-
-    # Включаем progressBar:
-    calculation['progressBar'] = True
-
-    # Запуск расчета:
-    res = Convention(calculation).calculate()
-
-    # Подготовка результата расчета к сохранению в Excel:
-    # — результат оценки:
-    rslt = pd.DataFrame(res['pricingResult'], index=[0])
-    rslt['poolReportDate'] = None
-    if res['poolStatistics'] is not None:
-        rslt['poolReportDate'] = res['poolStatistics']['reportDate']
-    rslt['zcycDateTime'] = res['pricingParameters']['zcycDateTime']
-    rslt['modelCPR'] = res['calculationParameters']['modelCPR']
-    rslt['poolModelCPR'] = res['calculationParameters']['poolModelCPR']
-
-    # — ожидаемый денежный поток по ипотечному покрытию:
-    empty = pd.DataFrame([])
-    pool_total = pd.DataFrame(res['poolCashflowTable']['total']) if res['poolCashflowTable']['total'] is not None else empty
-    pool_fixed = pd.DataFrame(res['poolCashflowTable']['fixed']) if res['poolCashflowTable']['fixed'] is not None else empty
-    pool_float = pd.DataFrame(res['poolCashflowTable']['float']) if res['poolCashflowTable']['float'] is not None else empty
-    # — таблица, демонстрирующая расчет субсидий (при наличии):
-    subs = pd.DataFrame(res['subsidyCashflowTable']) if res['subsidyCashflowTable'] is not None else empty
-    # — ожидаемый денежный поток по ИЦБ ДОМ.РФ:
-    bond = pd.DataFrame(res['mbsCashflowTable']) if res['mbsCashflowTable'] is not None else empty
-
-    for table in [rslt, pool_total, pool_fixed, pool_float, subs, bond]:
-        if not table.empty:
-            table['isin'] = calculation['bondID']
-            table['pricingDate'] = res['pricingParameters']['pricingDate']
-
-    if not pool_total.empty:
-        pool_total = pool_total[pool_total['model'] == 1]
-        pool_total.reset_index(inplace=True, drop=True)
-
-    if not pool_fixed.empty:
-        pool_fixed = pool_fixed[pool_fixed['model'] == 1]
-        pool_fixed.reset_index(inplace=True, drop=True)
-
-    if not pool_float.empty:
-        pool_float = pool_float[pool_float['model'] == 1]
-        pool_float.reset_index(inplace=True, drop=True)
-
-    bond = bond[(bond['cashflowType'] == 1) | (bond['cashflowType'] == 0)]
-    bond.reset_index(inplace=True, drop=True)
-
-    rslt = rslt[rslt_cols]
-    pool_total = pool_total[pool_cols] if res['poolCashflowTable']['total'] is not None else empty
-    pool_fixed = pool_fixed[pool_cols] if res['poolCashflowTable']['fixed'] is not None else empty
-    pool_float = pool_float[pool_cols] if res['poolCashflowTable']['float'] is not None else empty
-    subs = subs[subs_cols] if res['subsidyCashflowTable'] is not None else empty
-    bond = bond[bond_cols] if res['mbsCashflowTable'] is not None else empty
-
-    for table in [rslt, pool_total, pool_fixed, pool_float, subs, bond]:
-        for c in date_cols:
-            if c in table.columns:
-                table[c] = pd.to_datetime(table[c])
-
-    rslt_cf = pd.concat([rslt_cf, rslt])
-    pool_cf_total = pd.concat([pool_cf_total, pool_total])
-    pool_cf_fixed = pd.concat([pool_cf_fixed, pool_fixed])
-    pool_cf_float = pd.concat([pool_cf_float, pool_float])
-    subs_cf = pd.concat([subs_cf, subs])
-    bond_cf = pd.concat([bond_cf, bond])
-
-    del res
-
-# Сохранение результата расчета в Excel-файл:
-name = r'\TEMPLATE.xlsx'
-wb = openpyxl.load_workbook(os.getcwd() + name)
-export_table(wb["Оценка"], rslt_cf, 2)
-export_table(wb["Все кредиты"], pool_cf_total, 2)
-export_table(wb["Фиксированная часть"], pool_cf_fixed, 2)
-export_table(wb["Плавающая часть"], pool_cf_float, 2)
-export_table(wb["Формирование субсидий"], subs_cf, 2)
-export_table(wb["ИЦБ"], bond_cf, 2)
-wb.save(save_path)
+occurrences = {}
+try:
+    for calculation in calculations:
+
+        # Ключ расчета — хэш его параметров и номер повторения расчета с теми же параметрами в calculations. Расчеты, результаты которых
+        # уже загружены из checkpoint_path, не пересчитываются:
+        key = calculation_key(calculation)
+        occurrences[key] = occurrences.get(key, 0) + 1
+        key += '-' + str(occurrences[key])
+        if key in collector.completed:
+            continue
+
+        # Включаем progressBar:
+        calculation['progressBar'] = True
+
+        # Запуск расчета:
+        res = Convention(calculation).calculate()
+
+        # Подготовка результата расчета к сохранению в Excel (таблицы денежных потоков берутся из результата расчета напрямую в виде
+        # pandas.DataFrame, без преобразования в словари списков):
+        # — результат оценки:
+        rslt = pd.DataFrame(res['pricingResult'], index=[0])
+        rslt['poolReportDate'] = None
+        if res['poolStatistics'] is not None:
+            rslt['poolReportDate'] = res['poolStatistics']['reportDate']
+        rslt['zcycDateTime'] = res['pricingParameters']['zcycDateTime']
+        rslt['modelCPR'] = res['calculationParameters']['modelCPR']
+        rslt['poolModelCPR'] = res['calculationParameters']['poolModelCPR']
+
+        # — ожидаемый денежный поток по ипотечному покрытию:
+        empty = pd.DataFrame([])
+        pool_total = res.table('poolCashflowTable', 'total')
+        pool_fixed = res.table('poolCashflowTable', 'fixed')
+        pool_float = res.table('poolCashflowTable', 'float')
+        # — таблица, демонстрирующая расчет субсидий (при наличии):
+        subs = res.table('subsidyCashflowTable')
+        # — ожидаемый денежный поток по ИЦБ ДОМ.РФ:
+        bond = res.table('mbsCashflowTable')
+
+        pool_total, pool_fixed, pool_float, subs, bond = [t.copy() if t is not None else empty
+                                                          for t in [pool_total, pool_fixed, pool_float, subs, bond]]
+
+        for table in [rslt, pool_total, pool_fixed, pool_float, subs, bond]:
+            if not table.empty:
+                table['isin'] = calculation['bondID']
+                table['pricingDate'] = res['pricingParameters']['pricingDate']
+
+        if not pool_total.empty:
+            pool_total = pool_total[pool_total['model'] == 1]
+            pool_total.reset_index(inplace=True, drop=True)
+
+        if not pool_fixed.empty:
+            pool_fixed = pool_fixed[pool_fixed['model'] == 1]
+            pool_fixed.reset_index(inplace=True, drop=True)
+
+        if not pool_float.empty:
+            pool_float = pool_float[pool_float['model'] == 1]
+            pool_float.reset_index(inplace=True, drop=True)
+
+        bond = bond[(bond['cashflowType'] == 1) | (bond['cashflowType'] == 0)]
+        bond.reset_index(inplace=True, drop=True)
+
+        rslt = rslt[rslt_cols]
+        pool_total = pool_total[pool_cols] if not pool_total.empty else empty
+        pool_fixed = pool_fixed[pool_cols] if not pool_fixed.empty else empty
+        pool_float = pool_float[pool_cols] if not pool_float.empty else empty
+        subs = subs[subs_cols] if not subs.empty else empty
+        bond = bond[bond_cols] if not bond.empty else empty
+
+        for table in [rslt, pool_total, pool_fixed, pool_float, subs, bond]:
+            for c in date_cols:
+                if c in table.columns:
+                    table[c] = pd.to_datetime(table[c])
+
+        # Накопление и запись результатов расчета выпуска:
+        collector.add({'rslt': rslt, 'pool_total': pool_total, 'pool_fixed': pool_fixed, 'pool_float': pool_float,
+                       'subs': subs, 'bond': bond}, key)
+
+        del res
+
+finally:
+    # Завершение записи результата расчета (в том числе при прерывании — в файл попадут все уже рассчитанные выпуски):
+    writer.close()
+
+# Объединенные по всем выпускам таблицы результатов расчетов:
+rslt_cf = collector.table('rslt')
+pool_cf_total = collector.table('pool_total')
+pool_cf_fixed = collector.table('pool_fixed')
+pool_cf_float = collector.table('pool_float')
+subs_cf = collector.table('subs')
+bond_cf = collector.table('bond')
@@ -0,0 +1,377 @@
+# -*- coding: utf8 -*-
+
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+# ----- КОНВЕНЦИЯ ДЛЯ ИПОТЕЧНЫХ ЦЕННЫХ БУМАГ: ЛОКАЛЬНЫЙ СЕРВИС РАСЧЕТА ------------------------------------------------------------------- #
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+
+import os
+import sys
+import json
+import pickle
+import time
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from auxiliary import *
+from known_cashflow import known_cashflow_bond
+
+# Сервис принимает POST-запрос /Calculate (или /Convention2/v2/Calculate) с тем же JSON, что и Convention(input), и возвращает
+# результат расчета в формате выходных данных API. Расчеты выполняются в пуле процессов. Каждый процесс пула один раз при запуске
+# импортирует модель (pandas, scipy и т.д.) и хранит в памяти ответы методов DataSource (параметры КБД, данные модели макроэкономики,
+# данные по выпуску и срезы ипотечного покрытия), поэтому повторные расчеты не загружают эти данные заново. Дополнительные методы:
+#       GET /health — проверка доступности сервиса
+#       GET /stats  — количество запросов, среднее время расчета и статистика кэшей процессов пула
+#
+# Одновременные запросы, которые отличаются только опорной ценовой метрикой (например, один выпуск на одну дату оценки с разными
+# Z-спредами или ценами), объединяются: денежный поток по ипотечному покрытию и ИЦБ ДОМ.РФ рассчитывается один раз (в одном процессе пула),
+# после чего ценовые метрики по каждому запросу рассчитываются отдельно на этом денежном потоке (см. функции model_key и
+# Convention.reprice). Рассчитанные денежные потоки хранятся в кэше сервиса (--model-cache, --model-dir), поэтому последующие запросы
+# с новой опорной метрикой рассчитывают только ценовые метрики. Выпуски, все будущие платежи по которым известны из отчетов для
+# инвесторов, при outputProfile "minimal" или "tables" рассчитываются без моделирования денежного потока (см. функцию
+# knownCashflowPricing в модуле known_cashflow).
+#
+# Запуск из корня репозитория:
+#       python service.py --port 8194 --workers 4
+
+
+# Сообщения об ошибках в параметрах оценки (классы EXCEPTIONS и CONSTRAINTS). Для сообщений с подставляемыми значениями сравнивается
+# начало сообщения до первой подстановки. На такие ошибки сервис отвечает кодом 400, на остальные — кодом 500:
+INPUT_ERRORS = tuple(message.split('{')[0] for name, message in list(vars(EXCEPTIONS).items()) + list(vars(CONSTRAINTS).items())
+                     if isinstance(message, str) and (name.endswith('_EXCEP') or name.lstrip('_').isdigit()))
+
+
+def input_error(e):
+    """ Вызвана ли ошибка e некорректными параметрами оценки (а не внутренней ошибкой сервиса или расчета) """
+    return type(e) is Exception and len(e.args) == 1 and isinstance(e.args[0], str) and e.args[0].startswith(INPUT_ERRORS)
+
+
+# ----- ПРОЦЕССЫ ПУЛА РАСЧЕТОВ ----------------------------------------------------------------------------------------------------------- #
+worker_cache = None
+
+
+def worker_init(ttl, max_entries):
+
+    """ Инициализация процесса пула: импорт модели и подмена обращений к API в модулях convention и pool_model на кэш DataCache """
+
+    global worker_cache
+
+    import convention
+    import pool_model
+
+    worker_cache = DataCache(ttl, max_entries)
+    s_curves_repository.ttl = ttl  # S-кривые обновляются с той же периодичностью, что и ответы DataSource
+    convention.get = worker_cache.get
+    pool_model.get = worker_cache.get
+
+
+def worker_calculate(parameters):
+
+    """ Расчет в процессе пула. Результат сериализуется в JSON внутри процесса, чтобы не передавать таблицы между процессами. Вместе с
+    результатом возвращается статистика кэша процесса """
+
+    from convention import Convention
+
+    parameters = dict(parameters)
+    parameters['progressBar'] = False
+
+    return Convention(parameters).calculate().to_json(), worker_statistics()
+
+
+def worker_known(parameters):
+
+    """ Расчет в процессе пула без моделирования денежного потока (функция knownCashflowPricing) для выпусков, все будущие платежи по
+    которым известны. Если такой расчет невозможен, возвращается None (ошибку в параметрах оценки в этом случае сформирует Convention) """
+
+    from known_cashflow import knownCashflowPricing
+
+    try:
+        result = knownCashflowPricing(parameters, worker_cache.get)
+    except Exception as e:
+        # Ошибку в параметрах оценки сформирует Convention, остальные ошибки записываются в журнал, чтобы не скрывать их за полным
+        # расчетом:
+        if not input_error(e):
+            logger.exception('knownCashflowPricing: ошибка расчета, выполняется полный расчет')
+        result = None
+
+    return result.to_json() if result is not None else None, worker_statistics()
+
+
+def worker_model(parameters):
+
+    """ Расчет денежного потока в процессе пула. Возвращается сериализованное состояние расчета после расчета денежного потока, на основе
+    которого ценовые метрики рассчитываются функцией worker_price (в том числе в других процессах пула) """
+
+    from convention import Convention
+
+    parameters = dict(parameters)
+    parameters['progressBar'] = False
+    # Состояние хранится в кэше сервиса, поэтому промежуточные результаты, не нужные для расчета ценовых метрик, освобождаются:
+    parameters['leanMemory'] = True
+
+    return pickle.dumps(Convention(parameters).model().modelState(), pickle.HIGHEST_PROTOCOL), worker_statistics()
+
+
+def worker_price(state, parameters):
+
+    """ Расчет ценовых метрик в процессе пула на денежном потоке, рассчитанном функцией worker_model """
+
+    from convention import Convention
+
+    parameters = dict(parameters)
+    parameters['progressBar'] = False
+
+    return Convention.fromModelState(pickle.loads(state), parameters).calculate().to_json(), worker_statistics()
+
+
+def worker_statistics():
+    return {'pid': os.getpid(), 'cache': worker_cache.statistics() if worker_cache is not None else None}
+
+
+# ----- СЕРВИС --------------------------------------------------------------------------------------------------------------------------- #
+class PricingService(object):
+
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Локальный асинхронный HTTP-сервис расчета Конвенции
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры:
+
+        Опциональные:
+            1. host           — адрес, на котором запускается сервис, по умолчанию 127.0.0.1
+            2. port           — порт сервиса, по умолчанию 8194
+            3. workers        — количество процессов пула расчетов (по умолчанию — количество ядер процессора)
+            4. ttl            — время хранения ответов методов DataSource в кэше процесса пула, секунды (None — без ограничения)
+            5. cache_size     — максимальное количество ответов методов DataSource в кэше процесса пула
+            6. model_cache    — максимальное количество рассчитанных денежных потоков в кэше сервиса (см. описание класса ModelCache)
+            7. model_path     — директория для хранения рассчитанных денежных потоков на диске (None — не используется)
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    routes = ['/Calculate', '/Convention2/v2/Calculate']
+
+    def __init__(self, host='127.0.0.1', port=8194, workers=None, ttl=600.0, cache_size=256, model_cache=32, model_path=None):
+
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.ttl = ttl
+        self.cacheSize = cache_size
+        self.executor = None
+        self.server = None
+        self.requests = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.workerStatistics = {}
+        self.models = {}  # расчеты денежного потока, выполняющиеся в данный момент: ключ модели -> asyncio.Task
+        self.modelRuns = 0
+        self.coalesced = 0
+        self.knownRuns = 0
+        self.modelBonds = {}  # выпуски, для которых расчет без моделирования денежного потока невозможен: bondID -> время проверки
+        self.modelCache = ModelCache(model_cache, ttl or 0, model_path)
+
+    def start_executor(self):
+        context = multiprocessing.get_context('spawn')
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=context, initializer=worker_init,
+                                            initargs=(self.ttl, self.cacheSize))
+
+    async def warm_up(self):
+        """ Запуск всех процессов пула заранее, чтобы импорт модели не приходился на первые запросы """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, worker_statistics) for i in range(self.workers)])
+
+    async def calculate(self, parameters):
+
+        """ Расчет в пуле процессов. Возвращает результат расчета в формате JSON. Если денежный поток с тем же ключом модели есть в кэше
+        сервиса или его расчет уже выполняется, рассчитываются только ценовые метрики. Иначе, если все будущие платежи по выпуску
+        известны, расчет проводится без моделирования денежного потока (выпуски, для которых такой расчет невозможен, запоминаются на
+        время ttl, чтобы не проверять их при каждом запросе) """
+
+        loop = asyncio.get_running_loop()
+
+        state = self.modelCache.load(parameters)
+        if state is not None:
+            result, worker = await loop.run_in_executor(self.executor, worker_price, state, parameters)
+            self.workerStatistics[str(worker['pid'])] = worker['cache']
+            return result
+
+        key = model_key(parameters)
+        model = self.models.get(key)
+
+        bond_id = known_cashflow_bond(parameters) if model is None else None
+        if bond_id is not None and not self.model_bond(bond_id):
+            result, worker = await loop.run_in_executor(self.executor, worker_known, parameters)
+            self.workerStatistics[str(worker['pid'])] = worker['cache']
+            if result is not None:
+                self.knownRuns += 1
+                return result
+            self.modelBonds[str(bond_id)] = time.time()
+            model = self.models.get(key)  # расчет денежного потока мог начаться, пока выполнялась проверка
+
+        leader = model is None
+        if leader:
+            model = asyncio.ensure_future(self.model(key, parameters))
+            self.models[key] = model
+            self.modelRuns += 1
+        else:
+            self.coalesced += 1
+
+        try:
+            # Отмена одного из ожидающих запросов не должна отменять общий расчет денежного потока:
+            state = await asyncio.shield(model)
+        except Exception:
+            if leader:
+                raise
+            # Ошибка общего расчета может быть вызвана опорной ценовой метрикой первого запроса, поэтому присоединившийся запрос в этом
+            # случае рассчитывается отдельно:
+            result, worker = await loop.run_in_executor(self.executor, worker_calculate, parameters)
+        else:
+            result, worker = await loop.run_in_executor(self.executor, worker_price, state, parameters)
+
+        self.workerStatistics[str(worker['pid'])] = worker['cache']
+        return result
+
+    def model_bond(self, bond_id):
+        """ Известно ли (не дольше ttl секунд назад), что выпуск bond_id нельзя рассчитать без моделирования денежного потока """
+        checked = self.modelBonds.get(str(bond_id))
+        return checked is not None and (self.ttl is None or time.time() - checked < self.ttl)
+
+    async def model(self, key, parameters):
+
+        """ Расчет денежного потока в пуле процессов (один на все одновременные запросы с одинаковым ключом модели) """
+
+        loop = asyncio.get_running_loop()
+        try:
+            state, worker = await loop.run_in_executor(self.executor, worker_model, parameters)
+        finally:
+            del self.models[key]
+
+        self.modelCache.store(parameters, state)
+        self.workerStatistics[str(worker['pid'])] = worker['cache']
+        return state
+
+    def statistics(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'averageSeconds': round(self.seconds / self.requests, 6) if self.requests else None,
+            'modelRuns': self.modelRuns,  # количество расчетов денежного потока
+            'coalesced': self.coalesced,  # количество запросов, присоединившихся к уже выполняющемуся расчету денежного потока
+            'knownRuns': self.knownRuns,  # количество расчетов без моделирования денежного потока (см. функцию knownCashflowPricing)
+            'modelBonds': len(self.modelBonds),  # количество выпусков, для которых расчет без моделирования денежного потока невозможен
+            'modelCache': self.modelCache.statistics(),
+            'workers': self.workerStatistics,  # статистика кэшей процессов пула на момент последнего расчета в каждом процессе
+        }
+
+    async def handle(self, reader, writer):
+
+        """ Обработка HTTP-запроса (одно соединение — один запрос) """
+
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            lines = []
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                lines.append(line.decode('latin-1'))
+
+            if len(request_line) < 2:
+                return
+            method, path = request_line[0], request_line[1].split('?')[0].rstrip('/')
+
+            # Заголовок без ':' или некорректная длина тела запроса:
+            try:
+                headers = dict((key.strip().lower(), value.strip()) for key, value in [line.split(':', 1) for line in lines])
+                length = int(headers.get('content-length', 0))
+                if length < 0:
+                    raise ValueError(length)
+            except ValueError:
+                await self.respond(writer, 400, {'error': 'malformed request headers'})
+                return
+            body = await reader.readexactly(length)
+
+            if method == 'GET' and path == '/health':
+                await self.respond(writer, 200, {'status': 'ok', 'workers': self.workers})
+            elif method == 'GET' and path == '/stats':
+                await self.respond(writer, 200, self.statistics())
+            elif method == 'POST' and path in self.routes:
+                await self.respond_calculation(writer, body)
+            else:
+                await self.respond(writer, 404, {'error': 'unknown method ' + method + ' ' + path})
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond_calculation(self, writer, body):
+
+        start = time.perf_counter()
+        self.requests += 1
+        try:
+            parameters = json.loads(body.decode('utf8'))
+            if not isinstance(parameters, dict):
+                raise ValueError('the request body must be a JSON object')
+        except ValueError as e:  # в том числе json.JSONDecodeError и UnicodeDecodeError
+            self.errors += 1
+            await self.respond(writer, 400, {'error': str(e)})
+            return
+
+        try:
+            result = await self.calculate(parameters)
+            status = 200
+        except Exception as e:
+            self.errors += 1
+            result = json.dumps({'error': str(e)}, ensure_ascii=False)
+            status = 400 if input_error(e) else 500
+            if status == 500:
+                logger.exception('Ошибка расчета')
+        self.seconds += time.perf_counter() - start
+
+        await self.respond(writer, status, result)
+
+    @staticmethod
+    async def respond(writer, status, payload):
+        body = (payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)).encode('utf8')
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}[status]
+        writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json; charset=utf-8\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'
+                     .format(status, reason, len(body)).encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self):
+        self.start_executor()
+        try:
+            await self.warm_up()
+            self.server = await asyncio.start_server(self.handle, self.host, self.port)
+            print('Сервис расчета: http://{}:{} (процессов: {})'.format(self.host, self.port, self.workers), flush=True)
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Локальный сервис расчета Конвенции с кэшем данных DataSource в памяти процессов')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8194)
+    parser.add_argument('--workers', type=int, default=None, help='количество процессов пула расчетов')
+    parser.add_argument('--ttl', type=float, default=600.0, help='время хранения ответов DataSource в кэше, секунды (0 — без ограничения)')
+    parser.add_argument('--cache-size', type=int, default=256, help='максимальное количество ответов DataSource в кэше процесса')
+    parser.add_argument('--model-cache', type=int, default=32, help='максимальное количество рассчитанных денежных потоков в кэше сервиса')
+    parser.add_argument('--model-dir', default=None, help='директория для хранения рассчитанных денежных потоков на диске')
+    args = parser.parse_args()
+
+    PricingService(args.host, args.port, args.workers, args.ttl or None, args.cache_size, args.model_cache, args.model_dir).run()
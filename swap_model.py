@@ -0,0 +1,165 @@
+# -*- coding: utf8 -*-
+
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+# ----- КОНВЕНЦИЯ ДЛЯ ИПОТЕЧНЫХ ЦЕННЫХ БУМАГ: ОЦЕНКА СВОПОВ С ИПОТЕЧНЫМ АГЕНТОМ И ОРИГИНАТОРОМ ------------------------------------------ #
+# ---------------------------------------------------------------------------------------------------------------------------------------- #
+
+import numpy as np
+import pandas as pd
+
+from auxiliary import *
+
+import warnings
+
+warnings.filterwarnings('ignore')
+np.seterr(all='ignore')
+
+# Компоненты плавающих сумм по свопу с Ипотечным агентом (колонки таблицы inflow модели денежного потока по ИЦБ ДОМ.РФ):
+swap_float_components = ['yield', 'subsidy', 'reinvestment', 'lumpSumSwap', 'expense', 'accruedYield', 'accruedSubsidy', 'floatSum']
+
+
+def swapCashflow(coupon_dates, coupon_days, principals, coupon_payments, inflow, number_of_bonds, write_off_days, pricing_date):
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Потоки по свопу с Ипотечным агентом с точки зрения ДОМ.РФ
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры функции:
+
+        Обязательные:
+            1. coupon_dates     — даты купонных выплат денежного потока по облигации
+            2. coupon_days      — количество дней в купонных периодах
+            3. principals       — непогашенный номинал облигации до выплаты купона
+            4. coupon_payments  — купонные выплаты по облигации
+            5. inflow           — модельный денежный поток по расчетным периодам (mbsModel['total']['inflow'], колонки couponDate и
+                                  swap_float_components)
+            6. number_of_bonds  — количество облигаций в выпуске
+            7. write_off_days   — количество дней до купонной выплаты, когда проходит неттинг по свопу
+            8. pricing_date     — Дата оценки
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Фиксированные суммы — купонные выплаты по выпуску со знаком "минус", плавающие суммы и их компоненты берутся из inflow по дате
+    купонной выплаты (если дата отсутствует в inflow, компоненты равны NaN). Оставляются только потоки, неттинг по которым пройдет строго
+    после Даты оценки.
+
+    Результат функции — словарь массивов numpy одинаковой длины: nettingDate, fixedSum, компоненты swap_float_components,
+    issuePrincipal (непогашенный объем выпуска до выплаты купона) и couponDays.
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    coupon_dates = np.asarray(coupon_dates)
+    netting_dates = coupon_dates - write_off_days
+    future = netting_dates > pricing_date
+
+    # Позиции дат купонных выплат в inflow:
+    inflow_dates = inflow['couponDate'].values
+    order = np.argsort(inflow_dates, kind='stable')
+    position = np.searchsorted(inflow_dates[order], coupon_dates[future])
+    position[position >= len(order)] = 0
+    found = inflow_dates[order][position] == coupon_dates[future] if len(order) > 0 else np.zeros(future.sum(), dtype=bool)
+    rows = order[position]
+
+    swap = {'nettingDate': netting_dates[future],
+            'fixedSum': -np.round(np.asarray(coupon_payments, dtype=float)[future] * number_of_bonds, 2)}
+    for component in swap_float_components:
+        swap[component] = np.where(found, inflow[component].values[rows].astype(float) if len(order) > 0 else np.nan, np.nan)
+    swap['issuePrincipal'] = np.round(np.asarray(principals, dtype=float)[future] * number_of_bonds, 2)
+    swap['couponDays'] = np.asarray(coupon_days)[future]
+
+    return swap
+
+
+def swapValuation(netting_dates, fixed_sums, float_sums, pricing_date, zcyc_parameters, spreads=0.0, zcyc_shifts=None, discounting=None):
+    """
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    Оценка свопа по потокам фиксированных и плавающих сумм для набора спредов дисконтирования и сдвигов КБД
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Параметры функции:
+
+        Обязательные:
+            1. netting_dates    — даты неттинга по свопу
+            2. fixed_sums       — фиксированные суммы (со знаком с точки зрения стороны, от лица которой оценивается своп)
+            3. float_sums       — плавающие суммы
+            4. pricing_date     — Дата оценки
+            5. zcyc_parameters  — параметры КБД
+
+        Опциональные:
+            1. spreads          — спред дисконтирования в б.п. или массив спредов (по умолчанию 0)
+            2. zcyc_shifts      — список сдвигов КБД: функций zcyc_shift(t), возвращающих сдвиг в б.п. для сроков t (как zcycShift в
+                                  Convention), или массивов сдвигов для каждой даты неттинга; None — сдвиг равен нулю (по умолчанию)
+            3. discounting      — контекст дисконтирования расчета (DiscountingContext) с той же Датой оценки и Параметрами КБД: значения
+                                  КБД берутся из его кэша по количеству дней до даты неттинга; None — КБД рассчитывается заново
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+
+    Фактор дисконтирования на срок t лет до даты неттинга рассчитывается так же, как в Convention.dfZCYCPlusZ:
+        exp(-t · ln(1 + (Y(t) + shift(t) + spread) / 10000))
+    для всех сочетаний сдвигов КБД и спредов одним вычислением над массивом размера (сдвиги × спреды × даты неттинга). Потоки с датой
+    неттинга не позже Даты оценки не учитываются.
+
+    Результат функции — словарь:
+            · t                        — срок до каждой будущей даты неттинга в годах
+            · fixedLegRub              — приведенная стоимость фиксированных сумм, руб.
+            · floatLegRub              — приведенная стоимость плавающих сумм, руб.
+            · priceRub                 — стоимость свопа (сумма приведенных фиксированных и плавающих сумм), руб., округленная до копеек
+            · durationFixed            — дюрация Маколея фиксированных сумм, лет
+            · durationFloat            — дюрация Маколея плавающих сумм, лет
+            · durationMacaulaySwapFix  — средний срок фиксированных сумм, взвешенный по недисконтированным суммам (используется при
+                                         расчете CVA/DVA, от спреда и КБД не зависит)
+    Значения fixedLegRub, ..., durationFloat — массивы размера (количество сдвигов, количество спредов). Если zcyc_shifts не задан,
+    первое измерение отсутствует, если spreads — число, отсутствует второе (и при скалярных spreads без сдвигов значения — числа).
+
+    ----------------------------------------------------------------------------------------------------------------------------------------
+    """
+
+    netting_dates = np.asarray(netting_dates).astype(d_type)
+    pricing_date = np.datetime64(pricing_date, 'D')
+    future = netting_dates > pricing_date
+
+    if discounting is None:
+        discounting = DiscountingContext(pricing_date, zcyc_parameters)
+    days = discounting.days(netting_dates[future])
+    t = days / 365.0
+    fixed_sums = np.asarray(fixed_sums, dtype=float)[future]
+    float_sums = np.asarray(float_sums, dtype=float)[future]
+
+    scalar_spread = np.ndim(spreads) == 0
+    spreads = np.atleast_1d(np.asarray(spreads, dtype=float))
+
+    # Значения КБД для каждого сдвига (строки) и срока (колонки), в б.п.:
+    zcyc_rates = discounting.zcyc(days)
+    if zcyc_shifts is None:
+        rates = zcyc_rates[np.newaxis, :]
+    else:
+        rates = np.array([zcyc_rates + (shift(t) if callable(shift) else np.asarray(shift, dtype=float)[future])
+                          for shift in zcyc_shifts]).reshape(len(zcyc_shifts), len(t))
+
+    # Факторы дисконтирования размера (сдвиги, спреды, даты неттинга):
+    df = np.exp(-t * np.log1p((rates[:, np.newaxis, :] + spreads[np.newaxis, :, np.newaxis]) / 10000.0))
+
+    fixed_pv = (fixed_sums * df).sum(axis=-1)
+    float_pv = (float_sums * df).sum(axis=-1)
+
+    result = {
+        't': t,
+        'fixedLegRub': fixed_pv,
+        'floatLegRub': float_pv,
+        'priceRub': np.round(((fixed_sums + float_sums) * df).sum(axis=-1), 2),
+        'durationFixed': (t * fixed_sums * df).sum(axis=-1) / fixed_pv,
+        'durationFloat': (t * float_sums * df).sum(axis=-1) / float_pv,
+    }
+
+    for key in ['fixedLegRub', 'floatLegRub', 'priceRub', 'durationFixed', 'durationFloat']:
+        value = result[key]
+        if scalar_spread:
+            value = value[:, 0]
+        if zcyc_shifts is None:
+            value = value[0]
+        result[key] = value
+
+    result['durationMacaulaySwapFix'] = (fixed_sums * t).sum() / fixed_sums.sum()
+
+    return result